@@ -13,6 +13,10 @@ class Preferences:
         self.webdav_enabled = False  # 是否启用WebDAV
         self.auto_upload_webdav = False  # 是否自动上传到WebDAV
         self.auto_clean_local = False  # 是否自动清理本地文件
+        self.stream_upload = False  # 远程直传：不在本地建立书籍文件夹，直接上传后删除源文件
+
+        # 交互确认时在后台提前识别接下来几本书（0表示关闭）
+        self.lookahead = 2
         
         # AI选择阈值
         self.min_similarity_threshold = 0.6  # 最小标题相似度阈值
@@ -28,6 +32,8 @@ class Preferences:
             'webdav_enabled': self.webdav_enabled,
             'auto_upload_webdav': self.auto_upload_webdav,
             'auto_clean_local': self.auto_clean_local,
+            'stream_upload': self.stream_upload,
+            'lookahead': self.lookahead,
             'min_similarity_threshold': self.min_similarity_threshold,
             'min_rating_threshold': self.min_rating_threshold,
             'min_rating_people': self.min_rating_people
@@ -43,6 +49,8 @@ class Preferences:
         self.webdav_enabled = data.get('webdav_enabled', False)
         self.auto_upload_webdav = data.get('auto_upload_webdav', False)
         self.auto_clean_local = data.get('auto_clean_local', False)
+        self.stream_upload = data.get('stream_upload', False)
+        self.lookahead = data.get('lookahead', 2)
         self.min_similarity_threshold = data.get('min_similarity_threshold', 0.6)
         self.min_rating_threshold = data.get('min_rating_threshold', 7.0)
         self.min_rating_people = data.get('min_rating_people', 100)
@@ -50,9 +58,13 @@ class Preferences:
 # 获取项目根目录的绝对路径
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
 
+# 数据目录（书籍、配置和缓存所在位置），可以用环境变量 EBOOK_RENAMER_HOME 指向其他目录，例如压力测试时
+DATA_DIR = os.environ.get('EBOOK_RENAMER_HOME') or ROOT_DIR
+
 # 基础配置
-BOOKS_DIR = os.path.join(ROOT_DIR, "books")  # 书籍目录
-CONFIG_FILE = os.path.join(ROOT_DIR, "douban_config.json")  # 配置文件
+BOOKS_DIR = os.path.join(DATA_DIR, "books")  # 书籍目录
+CONFIG_FILE = os.path.join(DATA_DIR, "douban_config.json")  # 配置文件
+CACHE_DIR = os.path.join(DATA_DIR, "cache")  # 缓存目录
 NEW_NAME_PATTERN = "{author} - {title} ({year})"  # 文件夹命名格式
 SUPPORTED_FORMATS = ['pdf', 'epub', 'mobi', 'txt', 'azw3', 'azw']
 
@@ -62,7 +74,15 @@ REQUEST_CONFIG = {
     'max_retries': 3,  # 最大重试次数
     'retry_delay': [2, 5],  # 重试延迟范围（秒）
     'request_delay': [1, 3],  # 请求间隔范围（秒）
-    'proxy': None  # 代理设置
+    'proxy': None,  # 代理设置（旧版单个代理，proxies 为空时使用）
+    'proxies': [],  # 代理池，例如 ["http://127.0.0.1:7890", "http://127.0.0.1:7891"]
+    'proxy_sticky': False,  # 同一主机是否固定使用同一个代理
+    'proxy_eject_after': 3,  # 代理连续失败多少次后暂时剔除
+    'proxy_eject_seconds': 120,  # 代理首次剔除的时间（秒），再次剔除时加倍
+    'book_deadline': 120,  # 单本书所有网络步骤的时间预算（秒），0表示不限制
+    'parked_deadline': 600,  # 超时被搁置的书在本次运行最后重试时的时间预算（秒）
+    'breaker_threshold': 5,  # 同一主机连续被限流多少次后熔断
+    'breaker_cooldown': [30, 600]  # 熔断冷却时间（秒）：初始值，探测失败后加倍的上限
 }
 
 # WebDAV配置
@@ -70,7 +90,24 @@ WEBDAV_CONFIG = {
     'hostname': '',    # WebDAV服务器地址
     'username': '',    # 用户名
     'password': '',    # 密码
-    'root_path': '/books'  # 远程根目录
+    'root_path': '/books',  # 远程根目录
+    'upload_workers': 4,  # 并发上传线程数
+    'sync_mode': False,  # 增量同步：跳过远程已存在的相同文件
+    'queue_workers': 2,  # 后台上传队列的工作线程数
+    'queue_max_attempts': 8,  # 上传任务最大尝试次数
+    'queue_backoff': [5, 600]  # 重试退避时间（初始秒数, 最大秒数）
+}
+
+# 豆瓣配置
+DOUBAN_CONFIG = {
+    'search_url': 'https://www.douban.com/search',  # 搜索页地址（可指向镜像或本地模拟服务）
+    'subject_url': 'https://book.douban.com/subject/{douban_id}/',  # 书籍详情页地址模板
+    # 元数据级别：naming（只需命名字段）/ nfo（命名 + NFO基本字段）/ full（包括ISBN、标签、完整简介）
+    # 搜索结果缺少该级别需要的字段时才请求详情页
+    'metadata_tier': 'full',
+    'backfill_interval': 30,  # backfill 命令每两本书之间的间隔（秒）
+    # 原标题找不到匹配时，最多再并发尝试几个改写后的查询（去掉副标题/分卷标记、繁体原文、标题加作者），0表示关闭
+    'query_variants': 4
 }
 
 # DeepSeek API配置
@@ -79,6 +116,44 @@ DEEPSEEK_CONFIG = {
     'api_url': 'https://api.deepseek.com/v1/chat/completions'  # DeepSeek API地址
 }
 
+# 元数据提取进程池配置（PDF/EPUB等文件在独立进程中解析，防止异常文件卡死或耗尽内存）
+EXTRACT_CONFIG = {
+    'workers': 0,  # 提取进程数，0表示使用全部CPU核心
+    'timeout': 30,  # 单个文件的解析时间上限（秒），超时的进程会被结束并替换
+    'memory_mb': 512,  # 单个提取进程在启动后最多额外使用的内存（MB），仅Linux/macOS有效
+    'max_jobs': 200  # 每个提取进程处理多少个文件后重启，避免内存泄漏累积
+}
+
+# 文本指纹配置（用正文的 MinHash 签名发现同一本书的不同扫描版、转换版）
+FINGERPRINT_CONFIG = {
+    'enabled': True,  # 处理前计算PDF/EPUB正文的指纹，并与书库中已有的书比较
+    'threshold': 0.6,  # 正文相似度（0-1）不低于此值视为疑似重复
+    'on_duplicate': 'flag'  # 发现疑似重复时：flag（只提示，照常处理）/ skip（不识别、不上传，文件留在书籍目录中）
+}
+
+# 书库目录布局（本地书籍目录和远程WebDAV目录相同）
+LAYOUT_CONFIG = {
+    'shard': 'none',  # 分片方式：none（书籍文件夹都在书籍目录下）/ initial（按作者拼音首字母，需要 pypinyin）/ hash（按文件夹名哈希前缀）
+    'depth': 1  # 分片层数：initial 每层多取一个字母（L/LI），hash 每层两个十六进制字符
+}
+
+# 本地缓存配置
+CACHE_CONFIG = {
+    'cover_revalidate_days': 30  # 封面缓存多少天后向服务器重新校验（ETag/If-Modified-Since）
+}
+
+# 日志配置
+LOG_CONFIG = {
+    'level': 'INFO',  # 控制台日志级别：DEBUG / INFO / WARNING / ERROR
+    'file': None,  # JSON Lines 日志文件路径，为空时不写文件
+    'file_level': 'DEBUG'  # 日志文件的级别
+}
+
+# 性能指标配置
+METRICS_CONFIG = {
+    'prometheus_textfile': None  # 运行结束时写入的 Prometheus 文本格式指标文件（node_exporter textfile collector）
+}
+
 # 创建全局偏好设置实例
 PREFERENCES = Preferences()
 
@@ -86,15 +161,30 @@ def save_config():
     """保存当前配置到文件"""
     config = {
         'proxy': REQUEST_CONFIG['proxy'],
+        'proxies': REQUEST_CONFIG['proxies'],
+        'proxy_sticky': REQUEST_CONFIG['proxy_sticky'],
+        'proxy_eject_after': REQUEST_CONFIG['proxy_eject_after'],
+        'proxy_eject_seconds': REQUEST_CONFIG['proxy_eject_seconds'],
         'request_delay': REQUEST_CONFIG['request_delay'],
         'retry_delay': REQUEST_CONFIG['retry_delay'],
         'timeout': REQUEST_CONFIG['timeout'],
         'max_retries': REQUEST_CONFIG['max_retries'],
+        'book_deadline': REQUEST_CONFIG['book_deadline'],
+        'parked_deadline': REQUEST_CONFIG['parked_deadline'],
+        'breaker_threshold': REQUEST_CONFIG['breaker_threshold'],
+        'breaker_cooldown': REQUEST_CONFIG['breaker_cooldown'],
         'webdav': WEBDAV_CONFIG,
         'deepseek': {
             'api_key': DEEPSEEK_CONFIG['api_key'],
             'api_url': DEEPSEEK_CONFIG['api_url']
         },
+        'douban': DOUBAN_CONFIG,
+        'extract': EXTRACT_CONFIG,
+        'fingerprint': FINGERPRINT_CONFIG,
+        'layout': LAYOUT_CONFIG,
+        'cache': CACHE_CONFIG,
+        'logging': LOG_CONFIG,
+        'metrics': METRICS_CONFIG,
         'preferences': PREFERENCES.save_to_json()
     }
     try:
@@ -129,6 +219,20 @@ def load_config():
                 if 'enabled' in deepseek_config:
                     del deepseek_config['enabled']
                 DEEPSEEK_CONFIG.update(deepseek_config)
+            elif key == 'douban':
+                DOUBAN_CONFIG.update(value)
+            elif key == 'extract':
+                EXTRACT_CONFIG.update(value)
+            elif key == 'fingerprint':
+                FINGERPRINT_CONFIG.update(value)
+            elif key == 'layout':
+                LAYOUT_CONFIG.update(value)
+            elif key == 'cache':
+                CACHE_CONFIG.update(value)
+            elif key == 'logging':
+                LOG_CONFIG.update(value)
+            elif key == 'metrics':
+                METRICS_CONFIG.update(value)
             elif key == 'preferences':
                 PREFERENCES.load_from_json(value)
                 
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import posixpath
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from src.config.config import ROOT_DIR
+from src.utils import metrics
+from src.utils.library_layout import iter_book_folders
+from src.utils.logger import print_section, print_info, print_success, print_error, print_highlight
+from src.loadtest.library import make_books, generate_library
+from src.loadtest.mock_servers import Faults, MockDouban, MockChat, MockWebDAV
+
+# 报告中列出的阶段
+REPORT_STAGES = ['book', 'parse', 'metadata', 'douban_search', 'douban_detail', 'ai_select', 'ai_confirm',
+                 'move', 'cover', 'nfo', 'upload']
+
+def _write_config(home, douban, chat, webdav, options):
+    """在数据目录中写入子进程使用的配置文件（格式与 save_config 相同）"""
+    config = {
+        'request_delay': options.request_delay,
+        'retry_delay': options.retry_delay,
+        'timeout': options.timeout,
+        'max_retries': 3,
+        'book_deadline': options.book_deadline,
+        'webdav': {
+            'hostname': webdav.url,
+            'username': 'loadtest',
+            'password': 'loadtest',
+            'root_path': '/books',
+            'upload_workers': 4,
+            'queue_workers': 2,
+            'queue_backoff': [1, 5]
+        },
+        'deepseek': {'api_key': 'loadtest', 'api_url': chat.api_url},
+        'douban': {'search_url': douban.search_url, 'subject_url': douban.subject_url,
+                   'metadata_tier': options.metadata_tier},
+        'layout': {'shard': options.shard, 'depth': 1},
+        'logging': {'level': 'WARNING', 'file': os.path.join(home, 'run.jsonl'), 'file_level': 'INFO'},
+        'preferences': {
+            'ai_enabled': True,
+            'auto_confirm_rename': True,
+            'webdav_enabled': True,
+            'auto_upload_webdav': True
+        }
+    }
+    with open(os.path.join(home, 'douban_config.json'), 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+def run_once(count, options):
+    """生成 count 本书的合成书库，启动模拟服务，在子进程中跑完整流程
+    Returns:
+        dict: elapsed、metrics、renamed、uploaded、servers
+    """
+    home = tempfile.mkdtemp(prefix=f"ebook-loadtest-{count}-")
+    faults = dict(latency=tuple(options.latency), error_rate=options.error_rate)
+    douban = MockDouban(make_books(count, options.seed), Faults(rps=options.douban_rps, **faults)).start()
+    chat = MockChat(Faults(**faults)).start()
+    webdav = MockWebDAV(Faults(**faults)).start()
+    webdav.mkdir('/books')
+    keep = options.keep
+    try:
+        books = douban.books_by_title.values()
+        print_info(f"生成合成书库: {count} 本 -> {home}")
+        generate_library(os.path.join(home, 'books'), [book for book, _ in books], options.file_size, options.seed)
+        _write_config(home, douban, chat, webdav, options)
+
+        result_path = os.path.join(home, 'result.json')
+        env = dict(os.environ, EBOOK_RENAMER_HOME=home)
+        with open(os.path.join(home, 'output.log'), 'w', encoding='utf-8') as output:
+            process = subprocess.run([sys.executable, '-m', 'src.loadtest.runner', '--result', result_path],
+                                     cwd=ROOT_DIR, env=env, stdout=output, stderr=subprocess.STDOUT)
+        if process.returncode != 0 or not os.path.exists(result_path):
+            keep = True
+            print_error(f"子进程运行失败 (返回码 {process.returncode})，输出见: {os.path.join(home, 'output.log')}")
+            return None
+        with open(result_path, 'r', encoding='utf-8') as f:
+            result = json.load(f)
+
+        # 按真实书名核对整理结果：书籍目录下的文件夹名应包含豆瓣书名（而不是干扰条目）
+        folders = [posixpath.basename(folder) for folder in iter_book_folders(os.path.join(home, 'books'))]
+        titles = {book['title'] for book, _ in books}
+        result['renamed'] = sum(1 for name in folders if name.split(' - ', 1)[-1].rsplit(' (', 1)[0] in titles)
+        result['uploaded'] = len(webdav.folders('/books'))
+        result['servers'] = {'douban': douban.stats, 'chat': chat.stats, 'webdav': webdav.stats}
+        result['home'] = home
+        return result
+    finally:
+        for server in (douban, chat, webdav):
+            server.stop()
+        if not keep:
+            shutil.rmtree(home, ignore_errors=True)
+
+def report(count, result):
+    """打印一次运行的吞吐量和各阶段耗时"""
+    print_section(f"{count} 本书")
+    elapsed = result['elapsed']
+    print_success(f"总用时 {elapsed:.1f} 秒，吞吐量 {count / elapsed * 60:.1f} 本/分钟")
+    print_info(f"正确整理 {result['renamed']}/{count}，已上传 {result['uploaded']} 个文件夹")
+    stages = result['metrics']['stages']
+    widths = (12, 8, 10, 9, 9, 9, 9)
+    print_highlight(metrics.format_row(('阶段', '次数', '总耗时', '平均', 'P50', 'P95', '占比'), widths))
+    for stage in REPORT_STAGES:
+        s = stages.get(stage)
+        if not s or not s['count']:
+            continue
+        cells = (metrics.STAGE_LABELS.get(stage, stage), s['count'], f"{s['sum']:.1f}s", f"{s['sum'] / s['count']:.3f}s",
+                 f"{s['p50']:.3f}s", f"{s['p95']:.3f}s", f"{s['sum'] / elapsed * 100:.0f}%")
+        print_highlight(metrics.format_row(cells, widths))
+    counters = result['metrics']['counters']
+    print_info(f"HTTP请求 {counters.get('http_requests', 0)} 次，重试 {counters.get('http_retries', 0)} 次，"
+               f"失败 {counters.get('http_failures', 0)} 次")
+    for name, stats in result['servers'].items():
+        injected = {k: v for k, v in stats.items() if k != 'requests'}
+        print_info(f"模拟{name}: {stats['requests']} 个请求" + (f"，注入 {injected}" if injected else ""))
+    if os.path.isdir(result['home']):
+        print_info(f"数据目录已保留: {result['home']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压力测试：合成书库 + 本地模拟的豆瓣/DeepSeek/WebDAV")
+    parser.add_argument("--books", type=int, nargs="+", default=[100, 1000, 10000], help="书库规模 (默认: 100 1000 10000)")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.02, 0.08], metavar=("MIN", "MAX"),
+                        help="模拟服务每个请求的延迟范围（秒）")
+    parser.add_argument("--douban-rps", type=float, help="模拟豆瓣每秒最多处理的请求数，超出返回429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务随机返回503的比例")
+    parser.add_argument("--request-delay", type=float, nargs=2, default=[0, 0], metavar=("MIN", "MAX"),
+                        help="客户端请求间隔（秒），默认不等待以测量流水线本身")
+    parser.add_argument("--retry-delay", type=float, nargs=2, default=[0.2, 0.5], metavar=("MIN", "MAX"),
+                        help="客户端重试延迟（秒）")
+    parser.add_argument("--timeout", type=float, default=10, help="客户端请求超时（秒）")
+    parser.add_argument("--book-deadline", type=float, default=120, help="单本书的时间预算（秒）")
+    parser.add_argument("--metadata-tier", choices=["naming", "nfo", "full"], default="full",
+                        help="元数据级别，决定是否请求详情页 (默认: full)")
+    parser.add_argument("--shard", choices=["none", "initial", "hash"], default="none",
+                        help="书库分片方式，分片时远程目录需要逐级创建 (默认: none)")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="每个合成文件的字节数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--keep", action="store_true", help="保留数据目录（书库、日志、缓存）")
+    options = parser.parse_args()
+
+    results = {}
+    for count in options.books:
+        result = run_once(count, options)
+        if result:
+            results[count] = result
+            report(count, result)
+
+    if len(results) > 1:
+        print_section("规模对比")
+        for count, result in results.items():
+            book = result['metrics']['stages'].get('book', {})
+            print_highlight(f"{count:>6} 本: {count / result['elapsed'] * 60:8.1f} 本/分钟, "
+                            f"每本 P50 {book.get('p50', 0):.3f}s / P95 {book.get('p95', 0):.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import os
+import random
+import zipfile
+
+import opencc
+
+# 合成书名和作者用的词表
+TITLE_WORDS = [
+    "白夜", "追风", "沉默", "时间", "城市", "河流", "星空", "孤独", "远方", "记忆",
+    "山海", "灯塔", "迷宫", "雪国", "长夜", "旷野", "镜子", "候鸟", "黎明", "深海",
+    "故乡", "群岛", "沙漏", "回声", "花园", "边城", "月亮", "铁轨", "火焰", "晚风",
+    "秘密", "森林", "信使", "钟表", "航线", "书店", "草原", "雨季", "塔楼", "地图",
+    "光年", "渡口", "少年", "冬天", "春潮", "棋局", "琥珀", "纸船", "烟火", "旅人",
+    "码头", "荒原", "钢琴", "邮差", "海湾", "影子", "裂缝", "银河", "石头", "庭院"
+]
+TITLE_PATTERNS = ["{a}的{b}", "{a}与{b}", "{a}{b}"]
+SURNAMES = ["王", "李", "张", "刘", "陈", "杨", "赵", "黄", "周", "吴", "徐", "孙", "胡", "朱", "高",
+            "林", "何", "郭", "马", "罗", "梁", "宋", "郑", "谢", "韩", "唐", "冯", "于", "董", "萧"]
+GIVEN_NAMES = ["小波", "一鸣", "子涵", "思远", "若愚", "晓明", "秋雨", "春生", "文清", "海洋",
+               "嘉言", "书白", "明月", "云舒", "亦凡", "知秋", "景行", "慕白", "南星", "北辰",
+               "安然", "听雪", "怀瑾", "望舒", "清和", "远山", "半夏", "长青", "如风", "三木",
+               "晨曦", "梦溪", "少卿", "墨林", "修远", "问渠", "见素", "鹤鸣", "松年", "竹溪"]
+PUBLISHERS = ["人民文学出版社", "上海译文出版社", "译林出版社", "南海出版公司", "中信出版社",
+              "北京十月文艺出版社", "作家出版社", "生活·读书·新知三联书店"]
+TAGS = ["精校", "高清", "完整版", "文字版", "Z-Library", "第二版"]
+
+# 文件名模板：覆盖文件名解析能处理的各种写法，以及需要元数据/AI补充的情况
+FILENAME_TEMPLATES = [
+    "{author} - {title} ({year})",
+    "《{title}》({author})",
+    "{title} ({author}) (Z-Library)",
+    "{title} ({year})",
+    "[{tag}]{title}_{author}",
+    "{author} - {title_traditional}",
+    "【{tag}】{title}",
+]
+FORMATS = ['pdf', 'epub', 'mobi', 'txt', 'azw3']
+
+_s2t = opencc.OpenCC('s2t')
+
+def _pdf_string(text):
+    """PDF文本字符串（UTF-16BE，带BOM）"""
+    return "<FEFF" + text.encode('utf-16-be').hex().upper() + ">"
+
+def _fake_pdf(title, author, size):
+    """生成一个带有 Title/Author 元数据的最小PDF，用注释行补足大小"""
+    header = b"%PDF-1.4\n%" + b"x" * max(size - 600, 0) + b"\n"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>",
+        f"<< /Title {_pdf_string(title)} /Author {_pdf_string(author)} >>".encode('ascii'),
+    ]
+    body = header
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n".encode('ascii') + obj + b"\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii')
+    body += b"".join(f"{offset:010d} 00000 n \n".encode('ascii') for offset in offsets)
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 4 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('ascii')
+    return body
+
+def _write_fake_epub(path, title, author, size):
+    """生成一个带有 dc:title/dc:creator 的最小EPUB，用不压缩的填充文件补足大小"""
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        z.writestr('META-INF/container.xml',
+                   '<?xml version="1.0"?><container version="1.0" '
+                   'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+                   '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+                   '</rootfiles></container>')
+        z.writestr('OEBPS/content.opf',
+                   '<?xml version="1.0" encoding="utf-8"?><package version="2.0" '
+                   'xmlns="http://www.idpf.org/2007/opf" unique-identifier="id">'
+                   '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+                   f'<dc:title>{title}</dc:title><dc:creator>{author}</dc:creator>'
+                   '<dc:language>zh</dc:language></metadata><manifest/><spine/></package>')
+        z.writestr('OEBPS/filler.bin', os.urandom(max(size - 1024, 0)), compress_type=zipfile.ZIP_STORED)
+
+def make_books(count, seed=0):
+    """生成 count 本书的“真实”信息（模拟豆瓣上的条目），同一 seed 结果相同
+    Returns:
+        list: 每项包含 douban_id、title、author、year、publisher、isbn、rating、rating_people
+    """
+    rng = random.Random(seed)
+    titles = set()
+    books = []
+    while len(books) < count:
+        a, b = rng.sample(TITLE_WORDS, 2)
+        title = rng.choice(TITLE_PATTERNS).format(a=a, b=b)
+        if title in titles:
+            # 组合重复时加上卷号区分
+            volume = 2
+            while f"{title}{volume}" in titles:
+                volume += 1
+            title = f"{title}{volume}"
+        titles.add(title)
+        books.append({
+            'douban_id': str(1000000 + len(books)),
+            'title': title,
+            'author': rng.choice(SURNAMES) + rng.choice(GIVEN_NAMES),
+            'year': str(rng.randint(1980, 2024)),
+            'publisher': rng.choice(PUBLISHERS),
+            'isbn': f"978{rng.randint(10 ** 9, 10 ** 10 - 1)}",
+            'rating': f"{rng.uniform(6.0, 9.6):.1f}",
+            'rating_people': str(rng.randint(50, 50000))
+        })
+    return books
+
+def generate_library(books_dir, books, file_size=64 * 1024, seed=0):
+    """把书写成文件名杂乱的合成电子书文件
+    Args:
+        books_dir: 输出目录
+        books: make_books 的结果
+        file_size: 每个文件的大约字节数
+        seed: 随机种子
+    Returns:
+        list: 与 books 对应的文件名
+    """
+    rng = random.Random(seed)
+    os.makedirs(books_dir, exist_ok=True)
+    filenames = []
+    for index, book in enumerate(books):
+        template = FILENAME_TEMPLATES[index % len(FILENAME_TEMPLATES)]
+        ext = FORMATS[rng.randrange(len(FORMATS))]
+        name = template.format(
+            title=book['title'], title_traditional=_s2t.convert(book['title']),
+            author=book['author'], year=book['year'], tag=rng.choice(TAGS))
+        filename = f"{name}.{ext}"
+        path = os.path.join(books_dir, filename)
+        if ext == 'pdf':
+            with open(path, 'wb') as f:
+                f.write(_fake_pdf(book['title'], book['author'], file_size))
+        elif ext == 'epub':
+            _write_fake_epub(path, book['title'], book['author'], file_size)
+        else:
+            with open(path, 'wb') as f:
+                f.write(os.urandom(file_size))
+        filenames.append(filename)
+    return filenames
@@ -0,0 +1,430 @@
+import hashlib
+import http.client
+import json
+import random
+import threading
+import time
+from email.utils import formatdate
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from src.utils.text_utils import normalize_title
+
+class Faults:
+    """故障注入配置
+    Args:
+        latency: 每个请求的延迟范围（秒）
+        rps: 每秒最多处理的请求数，超出时返回429（None表示不限流）
+        error_rate: 随机返回503的比例
+    """
+    def __init__(self, latency=(0.0, 0.0), rps=None, error_rate=0.0):
+        self.latency = latency
+        self.rps = rps
+        self.error_rate = error_rate
+        self._tokens = float(rps or 0)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take_token(self):
+        """令牌桶限流，容量为一秒的请求数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rps, self._tokens + (now - self._last) * self.rps)
+            self._last = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def inject(self):
+        """在处理请求前调用：返回要直接响应的状态码，或None表示正常处理"""
+        if self.latency[1] > 0:
+            time.sleep(random.uniform(*self.latency))
+        if self.rps and not self._take_token():
+            return 429
+        if self.error_rate and random.random() < self.error_rate:
+            return 503
+        return None
+
+class _Handler(BaseHTTPRequestHandler):
+    """公共部分：HTTP/1.1长连接、故障注入、请求计数"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body=b'', content_type='text/html; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def faulted(self):
+        """执行故障注入，已经响应时返回True"""
+        server = self.server
+        with server.stats_lock:
+            server.stats['requests'] += 1
+        status = server.faults.inject()
+        if status is None:
+            return False
+        with server.stats_lock:
+            server.stats[status] = server.stats.get(status, 0) + 1
+        # 请求体需要读掉，连接才能继续复用
+        self.read_body()
+        self.send_body(status, b'', headers={'Retry-After': '1'} if status == 429 else None)
+        return True
+
+class MockServer:
+    """在后台线程中运行的模拟服务"""
+    handler = _Handler
+
+    def __init__(self, faults=None):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        self.httpd.daemon_threads = True
+        self.httpd.faults = faults or Faults()
+        self.httpd.stats = {'requests': 0}
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.mock = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    @property
+    def stats(self):
+        with self.httpd.stats_lock:
+            return dict(self.httpd.stats)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _DoubanHandler(_Handler):
+    def do_GET(self):
+        if self.faulted():
+            return
+        mock = self.server.mock
+        parts = urlsplit(self.path)
+        if parts.path == '/search':
+            query = parse_qs(parts.query).get('q', [''])[0]
+            self.send_body(200, mock.search_page(query))
+        elif parts.path.startswith('/subject/'):
+            book = mock.books_by_id.get(parts.path.split('/')[2])
+            if book:
+                self.send_body(200, mock.subject_page(book))
+            else:
+                self.send_body(404, 'not found')
+        elif parts.path.startswith('/cover/'):
+            etag = f'"{hashlib.md5(parts.path.encode()).hexdigest()}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_body(304)
+            else:
+                self.send_body(200, mock.cover_bytes, 'image/jpeg', {'ETag': etag})
+        else:
+            self.send_body(404, 'not found')
+
+class MockDouban(MockServer):
+    """模拟豆瓣搜索页、书籍详情页和封面图片
+    每本书的搜索结果中还会带一个标题相近的干扰条目（不同作者的“插图本”）
+    """
+    handler = _DoubanHandler
+
+    def __init__(self, books, faults=None, cover_size=30 * 1024):
+        super().__init__(faults)
+        self.books_by_id = {}
+        self.books_by_title = {}
+        for book in books:
+            decoy = dict(book, douban_id=str(int(book['douban_id']) + 50000000), title=f"{book['title']}（插图本）",
+                         author=book['author'][::-1], rating='6.1', rating_people='23')
+            for entry in (book, decoy):
+                self.books_by_id[entry['douban_id']] = entry
+            self.books_by_title[normalize_title(book['title'])] = (book, decoy)
+        self.cover_bytes = b'\xff\xd8\xff\xe0' + bytes(cover_size)
+
+    @property
+    def search_url(self):
+        return f"{self.url}/search"
+
+    @property
+    def subject_url(self):
+        return f"{self.url}/subject/{{douban_id}}/"
+
+    def _find(self, query):
+        norm = normalize_title(query)
+        found = self.books_by_title.get(norm)
+        if found:
+            return found
+        # 查询词中带有多余内容（标签、作者等）时按包含关系查找
+        for title_norm, entries in self.books_by_title.items():
+            if title_norm and title_norm in norm:
+                return entries
+        return ()
+
+    def search_page(self, query):
+        results = []
+        for book in self._find(query):
+            link = "https://www.douban.com/link2/?url=" + quote(
+                f"https://book.douban.com/subject/{book['douban_id']}/", safe='')
+            results.append(f"""
+<div class="result">
+  <div class="pic"><a href="{link}"><img src="{self.url}/cover/s{book['douban_id']}.jpg"></a></div>
+  <div class="content">
+    <div class="title"><h3><span>[书籍]</span>&nbsp;<a href="{escape(link)}">{escape(book['title'])}</a></h3>
+      <div class="rating-info">
+        <span class="rating_nums">{book['rating']}</span><span>({book['rating_people']}人评价)</span>
+        <span class="subject-cast">{escape(book['author'])} / {escape(book['publisher'])} / {book['year']}</span>
+      </div>
+    </div>
+    <p>这是《{escape(book['title'])}》的内容简介。</p>
+  </div>
+</div>""")
+        return f"<html><body><div class=\"result-list\">{''.join(results)}</div></body></html>"
+
+    def subject_page(self, book):
+        return f"""<html><body>
+<div id="info">
+<span><span class="pl"> 作者</span>:
+<a class="" href="/author/1">{escape(book['author'])}</a></span><br/>
+<span class="pl">出版社:</span> {escape(book['publisher'])}<br/>
+<span class="pl">出版年:</span> {book['year']}-6<br/>
+<span class="pl">页数:</span> 320<br/>
+<span class="pl">定价:</span> 45.00元<br/>
+<span class="pl">装帧:</span> 平装<br/>
+<span class="pl">ISBN:</span> {book['isbn']}<br/>
+</div>
+<div class="rating_self"><strong class="ll rating_num">{book['rating']}</strong></div>
+<div class="rating_sum"><a class="rating_people" href="#"><span>{book['rating_people']}</span>人评价</a></div>
+<div id="link-report"><div class="intro"><p>这是《{escape(book['title'])}》的完整内容简介。</p></div></div>
+<div id="db-tags-section"><a class="tag" href="#">小说</a><a class="tag" href="#">文学</a></div>
+</body></html>"""
+
+class _ProxyHandler(_Handler):
+    def do_GET(self):
+        if self.faulted():
+            return
+        # 转发代理收到的是完整URL，转发给目标服务后原样返回
+        target = urlsplit(self.path)
+        path = target.path + (f"?{target.query}" if target.query else "")
+        connection = self.server.mock.connection(target.netloc)
+        try:
+            connection.request('GET', path or '/', headers={'User-Agent': self.headers.get('User-Agent', '')})
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self.send_body(502)
+            return
+        self.send_body(response.status, body, response.getheader('Content-Type', 'text/html; charset=utf-8'))
+
+class MockProxy(MockServer):
+    """模拟HTTP转发代理（只支持GET），用于测量代理池的吞吐"""
+    handler = _ProxyHandler
+
+    def __init__(self, faults=None):
+        super().__init__(faults)
+        self._local = threading.local()
+
+    def connection(self, netloc):
+        """处理线程复用的上游连接"""
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        if netloc not in connections:
+            connections[netloc] = http.client.HTTPConnection(netloc, timeout=30)
+        return connections[netloc]
+
+class _ChatHandler(_Handler):
+    def do_POST(self):
+        if self.faulted():
+            return
+        try:
+            request = json.loads(self.read_body() or b'{}')
+            prompt = request['messages'][-1]['content']
+        except (ValueError, KeyError, IndexError):
+            self.send_body(400, 'bad request')
+            return
+        # 按提示词类型给出与真实API格式一致的回答
+        if 'APPROVE' in prompt:
+            content = "APPROVE\n新文件名与书籍信息一致。"
+        elif '选项' in prompt:
+            content = "选项 1\n标题相似度最高。"
+        else:
+            content = "{}"
+        response = {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}]}
+        self.send_body(200, json.dumps(response, ensure_ascii=False), 'application/json')
+
+class MockChat(MockServer):
+    """模拟 chat completions 接口"""
+    handler = _ChatHandler
+
+    @property
+    def api_url(self):
+        return f"{self.url}/v1/chat/completions"
+
+class _WebDAVHandler(_Handler):
+    def _path(self):
+        return unquote(urlsplit(self.path).path).rstrip('/') or '/'
+
+    def do_MKCOL(self):
+        if self.faulted():
+            return
+        self.send_body(self.server.mock.mkdir(self._path()))
+
+    def do_PUT(self):
+        if self.faulted():
+            return
+        self.send_body(self.server.mock.put(self._path(), self.read_body()))
+
+    def do_DELETE(self):
+        if self.faulted():
+            return
+        self.send_body(self.server.mock.delete(self._path()))
+
+    def do_MOVE(self):
+        if self.faulted():
+            return
+        destination = unquote(urlsplit(self.headers.get('Destination', '')).path).rstrip('/') or '/'
+        overwrite = self.headers.get('Overwrite', 'T').upper() != 'F'
+        self.send_body(self.server.mock.move(self._path(), destination, overwrite))
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        if self.faulted():
+            return
+        exists = self.server.mock.exists(self._path())
+        self.send_body(200 if exists else 404)
+
+    def do_PROPFIND(self):
+        if self.faulted():
+            return
+        self.read_body()
+        body = self.server.mock.propfind(self._path(), self.headers.get('Depth', '1'))
+        if body is None:
+            self.send_body(404)
+        else:
+            self.send_body(207, body, 'application/xml; charset=utf-8')
+
+class MockWebDAV(MockServer):
+    """内存中的WebDAV服务：只记录文件大小，不保存内容"""
+    handler = _WebDAVHandler
+
+    def __init__(self, faults=None):
+        super().__init__(faults)
+        self.dirs = {'/'}
+        self.files = {}  # 路径 -> (大小, 修改时间)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parent(path):
+        return path.rsplit('/', 1)[0] or '/'
+
+    def mkdir(self, path):
+        with self._lock:
+            if path in self.dirs or path in self.files:
+                return 405
+            if self._parent(path) not in self.dirs:
+                return 409
+            self.dirs.add(path)
+            return 201
+
+    def put(self, path, data):
+        with self._lock:
+            if self._parent(path) not in self.dirs:
+                return 409
+            created = path not in self.files
+            self.files[path] = (len(data), time.time())
+            return 201 if created else 204
+
+    def delete(self, path):
+        with self._lock:
+            if self.files.pop(path, None) is not None:
+                return 204
+            if path in self.dirs:
+                prefix = path + '/'
+                self.dirs = {d for d in self.dirs if d != path and not d.startswith(prefix)}
+                self.files = {f: v for f, v in self.files.items() if not f.startswith(prefix)}
+                return 204
+            return 404
+
+    def move(self, path, destination, overwrite):
+        with self._lock:
+            if path not in self.dirs and path not in self.files:
+                return 404
+            if self._parent(destination) not in self.dirs:
+                return 409
+            exists = destination in self.dirs or destination in self.files
+            if exists and not overwrite:
+                return 412
+            prefix = path + '/'
+
+            def moved(p):
+                return destination + p[len(path):] if p == path or p.startswith(prefix) else p
+            self.dirs = {moved(d) for d in self.dirs}
+            self.files = {moved(f): v for f, v in self.files.items()}
+            return 204 if exists else 201
+
+    def exists(self, path):
+        with self._lock:
+            return path in self.dirs or path in self.files
+
+    def folders(self, root):
+        """root 下的书籍文件夹（直接包含文件的目录，分片布局下含分片目录）的相对路径"""
+        prefix = root.rstrip('/') + '/'
+        with self._lock:
+            return {self._parent(f)[len(prefix):] for f in self.files
+                    if f.startswith(prefix) and '/' in f[len(prefix):]}
+
+    def propfind(self, path, depth):
+        with self._lock:
+            if path in self.files:
+                entries = [(path, False, self.files[path])]
+            elif path in self.dirs:
+                prefix = '/' if path == '/' else path + '/'
+
+                def included(p):
+                    return p.startswith(prefix) and (depth == 'infinity' or '/' not in p[len(prefix):])
+                entries = [(path, True, None)]
+                entries += [(d, True, None) for d in self.dirs if d != path and included(d)]
+                entries += [(f, False, meta) for f, meta in self.files.items() if included(f)]
+            else:
+                return None
+        responses = []
+        for entry_path, isdir, meta in entries:
+            href = quote(entry_path + ('/' if isdir and entry_path != '/' else ''))
+            if isdir:
+                props = "<d:resourcetype><d:collection/></d:resourcetype>"
+            else:
+                size, modified = meta
+                props = (f"<d:resourcetype/><d:getcontentlength>{size}</d:getcontentlength>"
+                         f"<d:getlastmodified>{formatdate(modified, usegmt=True)}</d:getlastmodified>"
+                         f"<d:getetag>\"{size:x}-{int(modified):x}\"</d:getetag>")
+            responses.append(f"<d:response><d:href>{href}</d:href><d:propstat><d:prop>{props}</d:prop>"
+                             f"<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>")
+        return f'<?xml version="1.0" encoding="utf-8"?><d:multistatus xmlns:d="DAV:">{"".join(responses)}</d:multistatus>'
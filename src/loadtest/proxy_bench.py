@@ -0,0 +1,65 @@
+import argparse
+import threading
+import time
+
+from src.config.config import REQUEST_CONFIG
+from src.utils.logger import configure_logging, print_section, print_info, print_highlight
+from src.utils.network import safe_request
+from src.utils.proxy_pool import reset_proxy_pool
+from src.loadtest.mock_servers import Faults, MockDouban, MockProxy
+from src.loadtest.library import make_books
+
+def measure(target_url, proxy_urls, duration, threads):
+    """在 duration 秒内用 threads 个线程通过代理池持续请求，返回 (完成的请求数, 实际用时)"""
+    REQUEST_CONFIG['proxies'] = proxy_urls
+    reset_proxy_pool()
+    done = [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < stop_at:
+            if safe_request(target_url) is not None:
+                with lock:
+                    done[0] += 1
+
+    # 测量期间不输出每个请求的日志
+    configure_logging('WARNING')
+    start = time.monotonic()
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.monotonic() - start
+    configure_logging()
+    return done[0], elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="代理池吞吐测试：本地模拟的豆瓣搜索页 + 本地转发代理")
+    parser.add_argument("--proxies", type=int, nargs="+", default=[1, 3], help="依次测试的代理数量 (默认: 1 3)")
+    parser.add_argument("--request-delay", type=float, nargs=2, default=REQUEST_CONFIG['request_delay'],
+                        metavar=("MIN", "MAX"), help="每个代理的请求间隔（秒），默认使用配置中的 request_delay")
+    parser.add_argument("--latency", type=float, nargs=2, default=[0.05, 0.15], metavar=("MIN", "MAX"),
+                        help="模拟豆瓣每个请求的延迟范围（秒）")
+    parser.add_argument("--duration", type=float, default=20, help="每种代理数量的测试时长（秒）")
+    parser.add_argument("--threads", type=int, default=8, help="并发请求线程数")
+    options = parser.parse_args()
+
+    REQUEST_CONFIG['request_delay'] = list(options.request_delay)
+    douban = MockDouban(make_books(10, 0), Faults(latency=tuple(options.latency))).start()
+    proxies = [MockProxy().start() for _ in range(max(options.proxies))]
+    try:
+        print_section("代理池吞吐")
+        print_info(f"request_delay {options.request_delay[0]}-{options.request_delay[1]} 秒，"
+                   f"{options.threads} 个线程，每项 {options.duration:.0f} 秒")
+        target = f"{douban.search_url}?q=bench"
+        for count in options.proxies:
+            done, elapsed = measure(target, [proxy.url for proxy in proxies[:count]], options.duration, options.threads)
+            print_highlight(f"{count} 个代理: {done} 个请求，{done / elapsed:.2f} 请求/秒")
+    finally:
+        for server in [douban, *proxies]:
+            server.stop()
+
+if __name__ == "__main__":
+    main()
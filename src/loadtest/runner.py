@@ -0,0 +1,27 @@
+import argparse
+import json
+import time
+
+from src.config.config import load_config
+from src.utils import metrics
+from src.utils.logger import configure_logging
+from src.main import rename_books
+
+def main():
+    """压力测试的子进程：在 EBOOK_RENAMER_HOME 指定的数据目录中无人值守地运行一次 rename_books
+    配置文件（模拟服务地址、AI自动确认等）已由 src.loadtest.driver 写入数据目录
+    """
+    parser = argparse.ArgumentParser(description="压力测试子进程")
+    parser.add_argument("--result", required=True, help="结果JSON的输出路径")
+    args = parser.parse_args()
+
+    load_config()
+    configure_logging()
+    start = time.monotonic()
+    rename_books()
+    elapsed = time.monotonic() - start
+    with open(args.result, 'w', encoding='utf-8') as f:
+        json.dump({'elapsed': elapsed, 'metrics': metrics.export()}, f, ensure_ascii=False)
+
+if __name__ == "__main__":
+    main()
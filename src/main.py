@@ -1,22 +1,44 @@
+import argparse
+import functools
 import os
-import re
-
-import PyPDF2
+import threading
 
 from src.config.config import (
     BOOKS_DIR, PREFERENCES, WEBDAV_CONFIG, DEEPSEEK_CONFIG,
-    REQUEST_CONFIG, load_config, save_config, generate_folder_name
+    REQUEST_CONFIG, FINGERPRINT_CONFIG, load_config, save_config, generate_folder_name
 )
 from src.utils.logger import (
     print_info, print_error, print_warning, print_section,
-    print_divider, print_prompt, print_success, ASCII_ART, AUTHOR_INFO
+    print_divider, print_prompt, print_success, ASCII_ART, AUTHOR_INFO,
+    configure_logging, book_context
+)
+from src.utils.filename_parser import parse_filename
+from src.services.resolver import resolve_book_info, find_isbn
+from src.services.catalog import import_catalog
+from src.services.metadata_extractor import TASK_FINGERPRINT, get_extractor_pool, shutdown_extractor_pool
+from src.services.fingerprint import (
+    FINGERPRINT_FORMATS, FingerprintIndex, get_fingerprint_index, flag_near_duplicates, find_library_duplicates
+)
+from src.services.metadata_store import get_metadata_store
+from src.services.file_service import fetch_cover_bytes, build_nfo_content, book_naming
+from src.services.plan import (
+    OP_UPLOAD, RESULT_DONE, RESULT_SKIPPED,
+    build_book_operations, write_plan, load_plan, apply_operations, summarize_results
 )
-from src.utils.filename_parser import parse_filename, extract_pdf_metadata, extract_ebook_metadata
-from src.services.douban import search_douban
-from src.services.file_service import download_cover, generate_nfo, create_book_folder
-from src.services.webdav import upload_to_webdav, clean_local_folder
+from src.services.relayout import relayout, undo_relayout, reshard
+from src.services.backfill import backfill
+from src.services.webdav import get_uploader, shutdown_uploader
+from src.services.upload_queue import get_upload_queue
 from src.services.ai_service import ai_extract_title_author, ai_confirm_rename
 from src.utils.text_utils import sanitize_filename
+from src.utils.network import report_network_stats
+from src.utils import metrics, tracing
+from src.utils.proxy_pool import reset_proxy_pool
+from src.utils.dir_watcher import DirectoryWatcher
+from src.utils.lookahead import Lookahead
+from src.utils.library_layout import library_path, iter_book_folders
+from src.utils.author_utils import ALIAS_MIN_TITLE_SIMILARITY, get_author_aliases, same_author
+from src.utils.deadline import DeadlineExceeded, deadline_scope, paused_deadline
 
 def rename_books():
     """遍历目录，重命名书籍文件，并整理到独立文件夹"""
@@ -29,178 +51,636 @@ def rename_books():
     # 获取所有文件
     files = [f for f in os.listdir(BOOKS_DIR) if os.path.isfile(os.path.join(BOOKS_DIR, f))]
     print_info(f"找到 {len(files)} 个文件待处理")
+    prefetch_metadata(files)
+
+    # 启动后台上传队列（同时会继续处理上次运行遗留的任务）
+    upload_queue = None
+    if PREFERENCES.webdav_enabled and PREFERENCES.auto_upload_webdav:
+        upload_queue = get_upload_queue()
+        upload_queue.start()
+    stream_upload = bool(upload_queue) and PREFERENCES.auto_clean_local and PREFERENCES.stream_upload
+    if stream_upload:
+        print_info("已启用远程直传模式，书籍不会在本地建立文件夹")
         
+    # 需要用户确认时，在用户阅读当前这本书的信息期间提前识别后面几本
+    lookahead = pending = None
+    if PREFERENCES.lookahead > 0 and not (PREFERENCES.ai_enabled and PREFERENCES.auto_confirm_rename):
+        # 提前识别的书还未进入书库，指纹先放在内存索引中，供同一批后面的书比较；
+        # 书进入书库或不再处理（取消、搁置、失败）时由 process_book 移除
+        pending = FingerprintIndex(':memory:')
+        lookahead = Lookahead(functools.partial(lookup_ahead, pending=pending), files, PREFERENCES.lookahead)
+
+    # 超出时间预算的书先搁置，其余书处理完后再用更宽裕的预算重试
+    try:
+        parked = [f for f in files
+                  if not process_book(f, upload_queue, stream_upload, REQUEST_CONFIG['book_deadline'],
+                                      lookahead, pending)]
+    finally:
+        if lookahead:
+            lookahead.close()
+    if parked:
+        print_warning(f"{len(parked)} 本书超出时间预算被搁置，现在重试")
+        for filename in parked:
+            if not process_book(filename, upload_queue, stream_upload, REQUEST_CONFIG['parked_deadline']):
+                print_error(f"再次超出时间预算，保留在书籍目录中等待下次运行: {filename}")
+
+    report_network_stats()
+    if upload_queue:
+        finish_upload_queue(upload_queue)
+
+# 提前识别的几本书并行检查指纹，比较和加入内存索引要一起完成，否则两本重复的书可能互相都没看到对方
+# （只锁比较和加入，读取指纹可能要等到提取超时，不能让其他书排在后面）
+_pending_lock = threading.Lock()
+
+def lookup_ahead(filename, pending):
+    """在后台提前识别一本书，与当场处理时使用相同的时间预算
+    先检查指纹，会被跳过的疑似重复不再查询豆瓣
+    Args:
+        filename: 书籍目录中的文件名
+        pending: 同一批中已经检查过、还未进入书库的书的指纹索引
+    Returns:
+        (是否跳过这本书, 指纹, lookup_book 的结果)
+    """
+    with book_context(filename), deadline_scope(REQUEST_CONFIG['book_deadline']):
+        signature = read_signature(filename)
+        with _pending_lock:
+            skip = check_fingerprint(filename, signature, pending)
+            if signature and not skip:
+                pending.add(filename, signature)
+        if skip:
+            return True, signature, None
+        return False, signature, lookup_book(filename)
+
+def watch_books(settle=2.0, poll_interval=5.0, use_inotify=True):
+    """常驻监视书籍目录，新文件写入完成后立即处理，直到 Ctrl+C
+    HTTP会话、缓存、WebDAV客户端、上传队列和元数据提取进程在各本书之间复用
+    Args:
+        settle: 文件大小保持不变多少秒后视为写入完成
+        poll_interval: 无法使用 inotify 时扫描目录的间隔（秒）
+        use_inotify: 是否使用 inotify
+    """
+    os.makedirs(BOOKS_DIR, exist_ok=True)
+    if not (PREFERENCES.ai_enabled and PREFERENCES.auto_confirm_rename):
+        print_warning("未启用AI自动确认，遇到需要确认的书时会等待输入")
+
+    upload_queue = None
+    if PREFERENCES.webdav_enabled and PREFERENCES.auto_upload_webdav:
+        upload_queue = get_upload_queue()
+        upload_queue.start()
+    stream_upload = bool(upload_queue) and PREFERENCES.auto_clean_local and PREFERENCES.stream_upload
+
+    watcher = DirectoryWatcher(BOOKS_DIR, settle, poll_interval, use_inotify)
+    parked = []
+    try:
+        while True:
+            ready = watcher.wait_ready()
+            prefetch_metadata(ready)
+            for filename in ready:
+                if not process_book(filename, upload_queue, stream_upload, REQUEST_CONFIG['book_deadline']):
+                    parked.append(filename)
+            # 空闲时再用更宽裕的预算重试被搁置的书，每次一本，不耽误新到的书
+            if not ready and parked:
+                filename = parked.pop(0)
+                if os.path.isfile(os.path.join(BOOKS_DIR, filename)) and \
+                        not process_book(filename, upload_queue, stream_upload, REQUEST_CONFIG['parked_deadline']):
+                    print_error(f"再次超出时间预算，保留在书籍目录中: {filename}")
+    except KeyboardInterrupt:
+        print_info("\n停止监视书籍目录")
+    finally:
+        watcher.close()
+        report_network_stats()
+        if upload_queue:
+            finish_upload_queue(upload_queue)
+
+def prefetch_metadata(files):
+    """文件名中缺少标题或作者的书，先交给后台的提取进程读取元数据，处理到这本书时直接取结果；
+    启用文本指纹时，所有书的指纹也在后台预先计算
+    """
+    items, fingerprint_items = [], []
     for filename in files:
-        file_path = os.path.join(BOOKS_DIR, filename)
-        print_info(f"\n开始处理文件: {filename}")
-        
-        # 解析文件名
+        author, title, _, ext = parse_filename(filename)
+        if not title or not author:
+            items.append((os.path.join(BOOKS_DIR, filename), ext))
+        fingerprint_items.append((os.path.join(BOOKS_DIR, filename), ext))
+    get_extractor_pool().prefetch(items)
+    if FINGERPRINT_CONFIG.get('enabled', True):
+        get_extractor_pool().prefetch(fingerprint_items, TASK_FINGERPRINT)
+
+def process_book(filename, upload_queue, stream_upload, budget, lookahead=None, pending=None):
+    """在时间预算内处理一本书
+    Args:
+        filename: 书籍目录中的文件名
+        upload_queue: 上传队列（未启用上传时为None）
+        stream_upload: 是否远程直传
+        budget: 时间预算（秒），0表示不限制
+        lookahead: 提前识别后面几本书的 Lookahead（可选）
+        pending: 与 lookahead 配套的同一批书的指纹索引（可选），处理结束后移除这本书
+    Returns:
+        bool: False 表示超出时间预算被搁置，其他情况（包括跳过、取消）返回 True
+    """
+    def forget():
+        # 这本书已进入书库索引，或者被取消、搁置、处理失败，都不再代表本批中待处理的书
+        if pending is not None:
+            pending.remove(filename)
+
+    metrics.count_book(filename)
+    streamed = False
+    try:
+        with book_context(filename), deadline_scope(budget), metrics.timed('book'):
+            found, prepared = lookahead.take(filename) if lookahead else (False, None)
+            if found:
+                skip, signature, lookup = prepared
+            else:
+                signature, lookup = read_signature(filename), None
+                skip = check_fingerprint(filename, signature)
+            if skip:
+                return True
+            resolution = resolve_book(filename, lookup)
+            if not resolution:
+                return True
+            resolution['signature'] = signature
+
+            # 远程直传模式：源文件直接上传，NFO和封面在内存中生成，本地不落盘
+            if stream_upload:
+                stream_book(os.path.join(BOOKS_DIR, filename), resolution['folder_name'],
+                            resolution['title'], resolution['ext'], resolution['douban_info'],
+                            metadata=resolution['douban_info'] or resolution['naming'],
+                            signature=signature, settled=forget)
+                streamed = True
+                return True
+
+            # 立即执行这本书的操作（与 plan/apply 使用同一套操作和执行器）
+            operations = build_book_operations(resolution, filename, upload=bool(upload_queue),
+                                               clean_local=PREFERENCES.auto_clean_local)
+            results = apply_operations(operations)
+    except DeadlineExceeded as e:
+        print_warning(f"搁置书籍 {filename}: {e}")
+        return False
+    finally:
+        # 远程直传要等上传结束才知道是否进入书库，由 stream_book 的回调处理
+        if not streamed:
+            forget()
+
+    if all(result in (RESULT_DONE, RESULT_SKIPPED) for op_id, result in results.items()
+           if not op_id.endswith(':cover')):
+        print_success(f"文件处理完成: {resolution['title']}")
+    return True
+
+def read_signature(filename):
+    """读取一本书的正文指纹（通常已在后台预取）
+    Returns:
+        指纹；未启用或无法提取足够的正文时为None
+    """
+    ext = os.path.splitext(filename)[1].lstrip('.').lower()
+    if not FINGERPRINT_CONFIG.get('enabled', True) or ext not in FINGERPRINT_FORMATS:
+        return None
+    with metrics.timed('fingerprint'):
+        return get_extractor_pool().get(os.path.join(BOOKS_DIR, filename), ext, TASK_FINGERPRINT)['signature']
+
+def check_fingerprint(filename, signature, pending=None):
+    """识别之前先用正文指纹与书库比较，同一本书的另一个扫描版、转换版不必再查询和上传
+    Args:
+        filename: 书籍目录中的文件名
+        signature: read_signature 的结果
+        pending: 同一批中已经计划或正在处理、还未进入书库的书的指纹索引（可选），也参与比较
+    Returns:
+        bool: 是否跳过这本书
+    """
+    if not flag_near_duplicates(filename, signature, pending):
+        return False
+    metrics.count('near_duplicates')
+    if FINGERPRINT_CONFIG.get('on_duplicate', 'flag') == 'skip':
+        print_warning(f"跳过疑似重复的书，文件保留在书籍目录中: {filename}")
+        return True
+    return False
+
+def lookup_book(filename):
+    """识别一本书：文件名/元数据/AI提取，有标题时查询豆瓣
+    不与用户交互、不修改任何文件，可以在后台提前执行（见 Lookahead）
+    Args:
+        filename: 书籍目录中的文件名
+    Returns:
+        dict: author、title、year、ext、douban_info（没有标题时为None）
+    """
+    file_path = os.path.join(BOOKS_DIR, filename)
+    print_info(f"\n开始处理文件: {filename}")
+
+    # 解析文件名
+    with metrics.timed('parse'):
         author, title, year, ext = parse_filename(filename)
-        print_info(f"文件名解析结果: 作者='{author}', 标题='{title}', 年份='{year}', 格式='{ext}'")
+    print_info(f"文件名解析结果: 作者='{author}', 标题='{title}', 年份='{year}', 格式='{ext}'")
 
-        # 如果无法从文件名解析，尝试从元数据获取
-        file_content = None
-        if not title or not author:
+    # 如果无法从文件名解析，尝试从元数据获取
+    file_content = None
+    if not title or not author:
+        with metrics.timed('metadata'):
             print_info("尝试从文件元数据获取信息")
-            if ext.lower() == "pdf":
-                meta_author, meta_title = extract_pdf_metadata(file_path)
-                if not author and meta_author: 
-                    author = meta_author
-                    print_info(f"从PDF元数据获取作者: {author}")
-                if not title and meta_title: 
-                    title = meta_title
-                    print_info(f"从PDF元数据获取标题: {title}")
-                # 获取PDF内容预览用于AI分析
-                try:
-                    with open(file_path, 'rb') as f:
-                        reader = PyPDF2.PdfReader(f)
-                        if len(reader.pages) > 0:
-                            file_content = reader.pages[0].extract_text()[:500]
-                except:
-                    pass
-            elif ext.lower() in ["epub", "mobi", "azw3","azw"]:
-                meta_author, meta_title = extract_ebook_metadata(file_path)
-                if not author and meta_author: 
-                    author = meta_author
-                    print_info(f"从电子书元数据获取作者: {author}")
-                if not title and meta_title: 
-                    title = meta_title
-                    print_info(f"从电子书元数据获取标题: {title}")
-        
-        # 如果仍然无法获取标题或作者，使用AI尝试提取
-        if (not title or not author) and PREFERENCES.ai_enabled:
-            ai_title, ai_author = ai_extract_title_author(filename, file_content)
-            if not title and ai_title:
-                title = ai_title
-                print_info(f"AI提取标题: {title}")
-            if not author and ai_author:
-                author = ai_author
-                print_info(f"AI提取作者: {author}")
-        
-        # 如果仍然无法获取，请求用户输入
-        if not title:
+            # 在提取进程中解析（通常已在后台预取），失败时只使用文件名
+            metadata = get_extractor_pool().get(file_path, ext)
+            if not author and metadata['author']:
+                author = metadata['author']
+                print_info(f"从文件元数据获取作者: {author}")
+            if not title and metadata['title']:
+                title = metadata['title']
+                print_info(f"从文件元数据获取标题: {title}")
+            # PDF第一页的内容预览用于AI分析
+            file_content = metadata['preview']
+
+    # 如果仍然无法获取标题或作者，使用AI尝试提取
+    if (not title or not author) and PREFERENCES.ai_enabled:
+        ai_title, ai_author = ai_extract_title_author(filename, file_content)
+        if not title and ai_title:
+            title = ai_title
+            print_info(f"AI提取标题: {title}")
+        if not author and ai_author:
+            author = ai_author
+            print_info(f"AI提取作者: {author}")
+
+    douban_info = lookup_douban(filename, title, author) if title else None
+    return {'author': author, 'title': title, 'year': year, 'ext': ext, 'douban_info': douban_info}
+
+def lookup_douban(filename, title, author):
+    """按标题（和预期作者、文件名中的ISBN）查询书籍信息，本地书目优先"""
+    print_info(f"尝试从豆瓣获取信息: {title}")
+    douban_info = resolve_book_info(title, expected_author=author, isbn=find_isbn(filename), filename=filename)
+    if douban_info:
+        print_info(f"成功获取豆瓣信息: {douban_info['title']}")
+    return douban_info
+
+def resolve_book(filename, lookup=None):
+    """解析一本书：识别书籍信息，并由AI或用户确认（不修改任何文件）
+    Args:
+        filename: 书籍目录中的文件名
+        lookup: 已经提前完成的 lookup_book 结果（可选，没有时当场识别）
+    Returns:
+        解析结果字典，跳过或取消时返回None
+    """
+    if lookup is None:
+        lookup = lookup_book(filename)
+    author, title, year, ext = lookup['author'], lookup['title'], lookup['year'], lookup['ext']
+    douban_info = lookup['douban_info']
+
+    # 如果仍然无法获取，请求用户输入
+    if not title:
+        with paused_deadline():
             title = print_prompt("⚠️ 未能获取到书籍标题，请手动输入").strip()
-            print_info(f"用户输入标题: {title}")
+        print_info(f"用户输入标题: {title}")
 
-            
         # 确保必要信息存在
         if not title:
             print_error(f"无法处理文件 {filename}：缺少必要的标题")
-            continue
-
-        # 从豆瓣获取信息
-        douban_info = None
-        if title:
-            print_info(f"尝试从豆瓣获取信息: {title}")
-            # 传递预期的作者信息
-            douban_info = search_douban(title, expected_author=author)
-            if douban_info:
-                print_info(f"成功获取豆瓣信息: {douban_info['title']}")
-                # 优先使用豆瓣的作者信息
-                title = douban_info["title"]
-                year = douban_info.get("year")
-                
-                # 优先使用豆瓣详情页的authors字段
-                if douban_info.get("authors") and len(douban_info["authors"]) > 0:
-                    author = douban_info["authors"][0]
-                    print_info(f"使用豆瓣详情页作者: {author}")
-                else:
-                    author = douban_info["author"]
-                    print_info(f"使用豆瓣搜索结果作者: {author}")
-                
-                # 清理作者名中的国籍标记
-                if author:
-                    original_author = author
-                    author = re.sub(r'[\[（\(【〔][^\]）\)】〕]*[\]）\)】〕]', '', author).strip()
-                    if author != original_author:
-                        print_info(f"清理作者名中的国籍标记: '{original_author}' -> '{author}'")
-
-            # 根据是否有年份信息使用不同的命名模式
-        folder_name = generate_folder_name({
+            return None
+        douban_info = lookup_douban(filename, title, author)
+
+    source_author = author
+    if douban_info:
+        # 优先使用豆瓣的标题、作者和年份
+        naming = book_naming(douban_info)
+        title, author, year = naming['title'], naming['author'], naming['year']
+        print_info(f"使用豆瓣作者: {author}")
+
+    # 根据是否有年份信息使用不同的命名模式
+    folder_name = library_path(generate_folder_name({
+        'title': title,
+        'author': author,
+        'year': year,
+    }))
+
+    # 使用AI判断是否确认重命名
+    should_rename = True
+    confirmed = False
+    if PREFERENCES.ai_enabled and PREFERENCES.auto_confirm_rename:
+        should_rename = ai_confirm_rename(filename, f"{folder_name}/{title}.{ext}", douban_info or {
             'title': title,
             'author': author,
-            'year': year,
+            'year': year
         })
-
-        # 使用AI判断是否确认重命名
-        should_rename = True
-        if PREFERENCES.ai_enabled and PREFERENCES.auto_confirm_rename:
-            should_rename = ai_confirm_rename(filename, f"{folder_name}/{title}.{ext}", douban_info or {
-                'title': title,
-                'author': author,
-                'year': year
-            })
-            if should_rename:
-                print_info("AI确认进行重命名")
-                # 显示操作信息但不要求确认
-                print_section("执行以下操作")
-                print_info(f"原文件: {filename}")
-                print_info(f"新文件夹: {folder_name}")
-                print_info(f"新文件名: {title}.{ext}")
-                if douban_info and douban_info.get("cover_url"):
-                    print_info("将下载豆瓣封面")
-                print_info("将生成NFO文件")
-            else:
-                print_warning("AI不建议进行重命名，跳过此文件")
-                continue
-        else:
-            # 显示将要执行的操作并等待用户确认
-            print_section("即将执行以下操作")
+        if should_rename:
+            print_info("AI确认进行重命名")
+            # 显示操作信息但不要求确认
+            print_section("执行以下操作")
             print_info(f"原文件: {filename}")
             print_info(f"新文件夹: {folder_name}")
             print_info(f"新文件名: {title}.{ext}")
             if douban_info and douban_info.get("cover_url"):
                 print_info("将下载豆瓣封面")
             print_info("将生成NFO文件")
-            
+        else:
+            print_warning("AI不建议进行重命名，跳过此文件")
+            return None
+    else:
+        # 显示将要执行的操作并等待用户确认
+        print_section("即将执行以下操作")
+        print_info(f"原文件: {filename}")
+        print_info(f"新文件夹: {folder_name}")
+        print_info(f"新文件名: {title}.{ext}")
+        if douban_info and source_author and not same_author(source_author, author):
+            # 用户确认时看得到两种写法，确认后记为作者别名
+            print_info(f"作者: {source_author} -> {author}（确认后记为同一作者）")
+        if douban_info and douban_info.get("cover_url"):
+            print_info("将下载豆瓣封面")
+        print_info("将生成NFO文件")
+
+        with paused_deadline():
             confirm = print_prompt("是否继续？(输入 'no' 取消，其他任意键继续)").strip().lower()
-            if confirm == 'no':
-                print_info("用户取消操作")
-                continue
+        if confirm == 'no':
+            print_info("用户取消操作")
+            return None
+        confirmed = True
+
+    # 已确认的匹配中，文件名里的作者写法与豆瓣不同时（音译、笔名等）记入别名表；
+    # 写法差异大又没有经过用户确认的只放入待确认列表
+    if douban_info and douban_info.get('similarity', 0) >= ALIAS_MIN_TITLE_SIMILARITY:
+        get_author_aliases().learn(source_author, author, confirmed=confirmed, title=title)
+
+    return {
+        'filename': filename,
+        'title': title,
+        'author': author,
+        'year': year,
+        'ext': ext,
+        'folder_name': folder_name,
+        'naming': {'title': title, 'author': author, 'year': year},
+        'douban_info': douban_info
+    }
 
-        # 执行文件操作
+def stream_book(file_path, folder_name, title, ext, douban_info, metadata=None, signature=None, settled=None):
+    """远程直传一本书：上传并校验成功后删除源文件，失败则保留源文件等待下次运行
+    Args:
+        file_path: 源文件路径
+        folder_name: 远程文件夹名称
+        title: 书名
+        ext: 文件扩展名
+        douban_info: 豆瓣信息字典
+        metadata: 上传成功后存入元数据缓存的书籍信息（可选，与 plan 的 write-nfo 操作相同），
+            之后的 backfill、relayout 才能找到这本书
+        signature: 正文指纹（可选），上传成功后才加入书库索引
+        settled: 上传结束（不论成败）后调用的函数（可选）
+    """
+    safe_title = sanitize_filename(title)
+    extra_files = {}
+    if douban_info and douban_info.get("cover_url"):
+        cover = fetch_cover_bytes(douban_info["cover_url"], douban_info.get("douban_id"))
+        if cover:
+            extra_files[f"{safe_title}.jpg"] = cover
+    nfo_content = build_nfo_content(douban_info)
+    if nfo_content is not None:
+        extra_files[f"{safe_title}.nfo"] = nfo_content.encode("utf-8")
+
+    def on_done(future):
         try:
-            # 创建文件夹并移动文件
-            folder_path, new_file_path = create_book_folder({
-                'title': title,
-                'author': author,
-                'year': year
-            }, file_path)
-            
-            if not folder_path or not new_file_path:
+            if future.result():
+                # 与 plan 的移动操作一样，书确实进入书库后才记录指纹；
+                # 失败时保留的源文件下次运行不会被当成自己的重复
+                if signature:
+                    get_fingerprint_index().add(folder_name, signature)
+                if metadata:
+                    get_metadata_store().save(folder_name, metadata)
+                os.remove(file_path)
+                print_success(f"远程直传完成，已删除源文件: {os.path.basename(file_path)}")
+            else:
+                print_error(f"远程直传失败，保留源文件: {os.path.basename(file_path)}")
+        finally:
+            if settled:
+                settled()
+
+    get_uploader().submit_stream(folder_name, file_path, f"{safe_title}.{ext}", extra_files).add_done_callback(on_done)
+
+def finish_upload_queue(upload_queue):
+    """等待已到期的上传任务完成，退避中的任务留给下次运行或 drain-uploads"""
+    print_info("等待后台上传任务完成...")
+    upload_queue.wait_idle()
+    upload_queue.stop()
+    shutdown_uploader()
+    remaining = upload_queue.counts()
+    if remaining.get('pending'):
+        print_warning(f"还有 {remaining['pending']} 个上传任务等待重试，可稍后运行 drain-uploads 继续")
+    if remaining.get('failed'):
+        print_warning(f"有 {remaining['failed']} 个上传任务失败，可运行 drain-uploads --retry-failed 重试")
+
+def drain_uploads(retry_failed=False):
+    """处理上传队列中积压的任务，直到全部完成或失败
+    Args:
+        retry_failed: 是否重新尝试已失败的任务
+    """
+    load_config()
+    if not PREFERENCES.webdav_enabled:
+        print_error("未启用WebDAV，无法上传")
+        return
+    upload_queue = get_upload_queue()
+    if retry_failed:
+        print_info(f"重新排队 {upload_queue.retry_failed()} 个失败任务")
+    counts = upload_queue.counts()
+    print_info(f"上传队列: 等待 {counts.get('pending', 0)} 个, 失败 {counts.get('failed', 0)} 个")
+    upload_queue.start()
+    upload_queue.drain()
+    upload_queue.stop()
+    shutdown_uploader()
+    counts = upload_queue.counts()
+    print_success(f"上传队列处理完成: 完成 {counts.get('done', 0)} 个, 失败 {counts.get('failed', 0)} 个")
+
+def review_aliases(accept=None, reject=None):
+    """列出待确认的作者别名，或接受/丢弃其中的条目
+    Args:
+        accept: 要加入别名表的别名（文件名中的作者写法）列表
+        reject: 要丢弃的别名列表
+    """
+    aliases = get_author_aliases()
+    for alias, approved in [(a, True) for a in accept or []] + [(r, False) for r in reject or []]:
+        if not aliases.resolve_pending(alias, approved):
+            print_warning(f"待确认列表中没有: {alias}")
+        elif not approved:
+            print_info(f"已丢弃: {alias}")
+    pending = aliases.pending()
+    print_section("待确认的作者别名")
+    for entry in pending:
+        print_info(f"{entry['alias']} -> {entry['canonical']}（《{entry['title'] or '?'}》，{entry['count']} 次）")
+    print_info(f"共 {len(pending)} 条；用 aliases --accept 别名 加入别名表，--reject 别名 丢弃")
+
+def dedupe_library(threshold=None):
+    """为书籍目录中还没有指纹的书籍文件夹补算指纹，然后列出整个书库中正文相似的书
+    已上传并清理了本地文件的书，使用整理时记录的指纹
+    Args:
+        threshold: 最小正文相似度，默认使用配置中的 fingerprint.threshold
+    """
+    index = get_fingerprint_index()
+    pending = []
+    if os.path.isdir(BOOKS_DIR):
+        for folder in sorted(iter_book_folders()):
+            folder_path = os.path.join(BOOKS_DIR, folder)
+            if folder in index:
                 continue
+            # 同一文件夹中有多种格式时只取第一个
+            for name in sorted(os.listdir(folder_path)):
+                ext = os.path.splitext(name)[1].lstrip('.').lower()
+                if ext in FINGERPRINT_FORMATS:
+                    pending.append((folder, os.path.join(folder_path, name), ext))
+                    break
 
-            # 获取安全的文件名（与create_book_folder中使用相同的处理方式）
-            safe_title = sanitize_filename(title)
+    print_section("文本指纹")
+    pool = get_extractor_pool()
+    pool.prefetch([(path, ext) for _, path, ext in pending], TASK_FINGERPRINT)
+    added = 0
+    for folder, path, ext in pending:
+        signature = pool.get(path, ext, TASK_FINGERPRINT)['signature']
+        if signature:
+            index.add(folder, signature)
+            added += 1
+    if pending:
+        print_info(f"新建立指纹 {added} 个，{len(pending) - added} 个无法提取足够的正文")
+    for group in find_library_duplicates(threshold):
+        print_warning(f"疑似重复: {' | '.join(group)}")
 
-            if douban_info and douban_info.get("cover_url"):
-                cover_path = os.path.join(folder_path, f"{safe_title}.jpg")
-                download_cover(douban_info["cover_url"], cover_path)
+def plan_books(output):
+    """计划阶段：解析并确认书籍目录中的所有文件，把需要执行的操作写入计划文件，不修改任何书籍文件
+    Args:
+        output: 计划文件路径
+    """
+    load_config()
+    if not os.path.isdir(BOOKS_DIR):
+        print_error(f"书籍目录不存在: {BOOKS_DIR}")
+        return
+    files = sorted(f for f in os.listdir(BOOKS_DIR) if os.path.isfile(os.path.join(BOOKS_DIR, f)))
+    print_info(f"找到 {len(files)} 个文件待处理")
+    prefetch_metadata(files)
 
-            nfo_path = os.path.join(folder_path, f"{safe_title}.nfo")
-            generate_nfo(douban_info, nfo_path)
-            
-            print_success(f"文件处理完成: {title}")
-
-            # 上传到WebDAV
-            if PREFERENCES.webdav_enabled and PREFERENCES.auto_upload_webdav:
-                print_info("开始上传到WebDAV")
-                upload_success = upload_to_webdav(folder_path, os.path.basename(folder_path))
-                if upload_success:
-                    print_success("上传成功")
-                    # 根据用户偏好决定是否清理本地文件
-                    if PREFERENCES.auto_clean_local:
-                        print_info("根据用户偏好，清理本地文件")
-                        clean_local_folder(folder_path)
-                        print_success("本地文件已清理")
-
-                else:
-                    print_error("WebDAV上传失败，保留本地文件")
-        except Exception as e:
-            print_error(f"处理文件时出错: {e}")
+    upload = PREFERENCES.webdav_enabled and PREFERENCES.auto_upload_webdav
+    operations = []
+    # 计划中的书要到 apply 时才进入书库，同一批中的重复靠已计划的指纹发现
+    planned = FingerprintIndex(':memory:')
+
+    def plan_files(names, budget):
+        """解析一组文件并加入计划，返回超出时间预算的文件"""
+        parked = []
+        for filename in names:
+            metrics.count_book(filename)
+            try:
+                with book_context(filename), deadline_scope(budget), metrics.timed('book'):
+                    signature = read_signature(filename)
+                    skip = check_fingerprint(filename, signature, planned)
+                    resolution = None if skip else resolve_book(filename)
+                    if resolution:
+                        resolution['signature'] = signature
+                        if signature:
+                            planned.add(resolution['folder_name'], signature)
+            except DeadlineExceeded as e:
+                print_warning(f"搁置书籍 {filename}: {e}")
+                parked.append(filename)
+                continue
+            if resolution:
+                operations.extend(build_book_operations(resolution, filename, upload=upload,
+                                                        clean_local=PREFERENCES.auto_clean_local))
+        return parked
+
+    parked = plan_files(files, REQUEST_CONFIG['book_deadline'])
+    if parked:
+        print_warning(f"{len(parked)} 本书超出时间预算被搁置，现在重试")
+        for filename in plan_files(parked, REQUEST_CONFIG['parked_deadline']):
+            print_error(f"再次超出时间预算，不写入计划: {filename}")
+    report_network_stats()
+    write_plan(operations, output)
+
+def apply_plan_file(path, workers=4):
+    """执行阶段：按依赖关系并行执行计划文件中的操作，可重复执行
+    Args:
+        path: 计划文件路径
+        workers: 并行线程数
+    """
+    load_config()
+    operations = load_plan(path)
+    upload_queue = None
+    if any(op['type'] == OP_UPLOAD for op in operations):
+        upload_queue = get_upload_queue()
+        upload_queue.start()
+    summarize_results(apply_operations(operations, workers))
+    if upload_queue:
+        finish_upload_queue(upload_queue)
 
 def main():
     """主程序入口"""
+    parser = argparse.ArgumentParser(description="电子书文件整理工具")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="控制台日志级别 (默认: INFO)")
+    parser.add_argument("--log-file", help="同时把日志以 JSON Lines 格式写入该文件")
+    parser.add_argument("--metrics-file", help="运行结束时把性能指标以 Prometheus 文本格式写入该文件")
+    parser.add_argument("--trace", metavar="FILE", help="记录每本书各步骤的时间线，结束时写入 Chrome trace-event JSON（可用 Perfetto 打开）")
+    subparsers = parser.add_subparsers(dest="command")
+    drain_parser = subparsers.add_parser("drain-uploads", help="处理上传队列中积压的任务")
+    drain_parser.add_argument("--retry-failed", action="store_true", help="重新尝试已失败的任务")
+    relayout_parser = subparsers.add_parser("relayout", help="根据已保存的元数据离线重新布局书籍库（不联网）")
+    relayout_parser.add_argument("--dry-run", action="store_true", help="只显示计划，不执行")
+    relayout_parser.add_argument("--workers", type=int, default=8, help="并行线程数 (默认: 8)")
+    relayout_parser.add_argument("--undo", metavar="LOG", help="按撤销日志恢复一次重新布局")
+    reshard_parser = subparsers.add_parser("reshard", help="按当前的分片配置（layout）原地迁移书库的目录结构")
+    reshard_parser.add_argument("--dry-run", action="store_true", help="只显示计划，不执行")
+    reshard_parser.add_argument("--workers", type=int, default=8, help="并行线程数 (默认: 8)")
+    reshard_parser.add_argument("--remote", action="store_true", help="同时迁移WebDAV服务器上的书库（远程移动，不重新上传）")
+    catalog_parser = subparsers.add_parser("import-catalog", help="导入豆瓣书目导出文件（JSON Lines）到本地书目")
+    catalog_parser.add_argument("files", nargs="+", help="导出文件路径（支持 .gz）")
+    plan_parser = subparsers.add_parser("plan", help="解析所有书籍并生成操作计划（不修改文件）")
+    plan_parser.add_argument("-o", "--output", default="plan.json", help="计划文件路径 (默认: plan.json)")
+    apply_parser = subparsers.add_parser("apply", help="执行操作计划（可重复执行）")
+    apply_parser.add_argument("plan", help="计划文件路径")
+    apply_parser.add_argument("--workers", type=int, default=4, help="并行线程数 (默认: 4)")
+    backfill_parser = subparsers.add_parser("backfill", help="低速补全整理时跳过的豆瓣详情信息（ISBN、标签、完整简介）")
+    backfill_parser.add_argument("--limit", type=int, help="最多处理多少本书")
+    backfill_parser.add_argument("--interval", type=float, help="每两本书之间的间隔秒数 (默认: 配置中的 backfill_interval)")
+    backfill_parser.add_argument("--dry-run", action="store_true", help="只列出需要补全的书")
+    aliases_parser = subparsers.add_parser("aliases", help="审核自动发现、还未生效的作者别名")
+    aliases_parser.add_argument("--accept", nargs="+", metavar="ALIAS", help="把这些别名加入作者别名表")
+    aliases_parser.add_argument("--reject", nargs="+", metavar="ALIAS", help="丢弃这些待确认的别名")
+    dedupe_parser = subparsers.add_parser("dedupe", help="为书库建立文本指纹，并列出正文相似的书（不同扫描版、转换版）")
+    dedupe_parser.add_argument("--threshold", type=float, help="最小正文相似度 (默认: 配置中的 fingerprint.threshold)")
+    watch_parser = subparsers.add_parser("watch", help="常驻监视书籍目录，新文件到达后立即处理")
+    watch_parser.add_argument("--settle", type=float, default=2.0, help="文件大小保持不变多少秒后开始处理 (默认: 2)")
+    watch_parser.add_argument("--poll", action="store_true", help="不使用 inotify，定时扫描目录")
+    watch_parser.add_argument("--interval", type=float, default=5.0, help="定时扫描的间隔秒数 (默认: 5)")
+    args = parser.parse_args()
+
+    # 先读取配置中的日志设置，命令行参数优先
+    load_config()
+    configure_logging(args.log_level, args.log_file)
+    if args.trace:
+        tracing.start_tracing(args.trace)
+
+    try:
+        if args.command == "drain-uploads":
+            drain_uploads(args.retry_failed)
+        elif args.command == "relayout":
+            if args.undo:
+                undo_relayout(args.undo)
+            else:
+                relayout(args.dry_run, args.workers)
+        elif args.command == "reshard":
+            reshard(args.dry_run, args.workers, args.remote)
+            if args.remote:
+                shutdown_uploader()
+        elif args.command == "import-catalog":
+            import_catalog(args.files)
+        elif args.command == "plan":
+            plan_books(args.output)
+        elif args.command == "apply":
+            apply_plan_file(args.plan, args.workers)
+        elif args.command == "backfill":
+            backfill(args.limit, args.interval, args.dry_run)
+        elif args.command == "aliases":
+            review_aliases(args.accept, args.reject)
+        elif args.command == "dedupe":
+            dedupe_library(args.threshold)
+        elif args.command == "watch":
+            watch_books(args.settle, args.interval, not args.poll)
+        else:
+            run_interactive()
+    finally:
+        shutdown_extractor_pool()
+        # 中途中断（Ctrl+C）时也写出已记录的时间线
+        tracing.finish_tracing()
+
+    # 各阶段耗时汇总（上传队列已在上面排空，上传耗时也包含在内）
+    metrics.report()
+    metrics.write_prometheus_textfile(args.metrics_file)
+
+def run_interactive():
+    """交互式整理流程"""
     # 显示字符画和作者信息
     print(ASCII_ART)
     print(AUTHOR_INFO)
@@ -241,6 +721,16 @@ def main():
                     'https': proxy_url
                 }
                 print_success(f"已设置代理: {proxy_url}")
+                REQUEST_CONFIG['proxies'] = [proxy_url]
+            # 多个代理组成代理池，请求在代理之间分摊，每个代理单独限速
+            extra = print_prompt("其他代理地址，多个用逗号分隔 (例如: http://127.0.0.1:7891，可留空)").strip()
+            if extra:
+                extra_proxies = [p.strip() for p in extra.split(',') if p.strip()]
+                REQUEST_CONFIG['proxies'] = REQUEST_CONFIG['proxies'] + [
+                    p if '://' in p else f"http://{p}" for p in extra_proxies
+                ]
+                print_success(f"代理池共 {len(REQUEST_CONFIG['proxies'])} 个代理")
+            reset_proxy_pool()
         
         # 配置请求延迟
         custom_delay = print_prompt("是否自定义请求延迟? (y/n, 默认: n)").strip().lower() == 'y'
@@ -263,6 +753,7 @@ def main():
             WEBDAV_CONFIG['username'] = print_prompt("请输入用户名").strip()
             WEBDAV_CONFIG['password'] = print_prompt("请输入密码").strip()
             WEBDAV_CONFIG['root_path'] = print_prompt("请输入远程根目录 (默认: /books)").strip() or '/books'
+            WEBDAV_CONFIG['sync_mode'] = print_prompt("是否启用增量同步，跳过远程已存在的相同文件? (y/n, 默认: y)").strip().lower() != 'n'
             
             # 测试WebDAV连接
             from src.services.webdav import init_webdav_client
@@ -299,6 +790,8 @@ def main():
                     PREFERENCES.auto_upload_webdav = print_prompt("是否自动上传到WebDAV? (y/n, 默认: y)").strip().lower() != 'n'
                     if PREFERENCES.auto_upload_webdav:
                         PREFERENCES.auto_clean_local = print_prompt("是否自动清理本地文件? (y/n, 默认: n)").strip().lower() == 'y'
+                        if PREFERENCES.auto_clean_local:
+                            PREFERENCES.stream_upload = print_prompt("是否启用远程直传，不在本地建立书籍文件夹? (y/n, 默认: n)").strip().lower() == 'y'
                 
                 print_section("AI选择阈值设置")
                 try:
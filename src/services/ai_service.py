@@ -4,7 +4,10 @@ import os
 
 import requests
 from src.config.config import DEEPSEEK_CONFIG, PREFERENCES
-from src.utils.logger import print_error, print_info, print_debug
+from src.utils.logger import DEBUG, print_error, print_info, print_debug, is_enabled
+from src.utils.deadline import capped_timeout, check_deadline
+from src.utils.network import get_session
+from src.utils import metrics, tracing
 
 def call_deepseek_api(prompt, context=None):
     """调用DeepSeek API进行智能决策
@@ -36,12 +39,13 @@ def call_deepseek_api(prompt, context=None):
     }
     
     try:
-        response = requests.post(
-            DEEPSEEK_CONFIG['api_url'],
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+        with tracing.span("DeepSeek API", cat='ai', prompt_chars=len(prompt)):
+            response = get_session().post(
+                DEEPSEEK_CONFIG['api_url'],
+                headers=headers,
+                json=data,
+                timeout=capped_timeout(30)
+            )
         
         response.raise_for_status()  # 抛出非200状态码的异常
         
@@ -51,11 +55,13 @@ def call_deepseek_api(prompt, context=None):
             return None
             
         content = result['choices'][0]['message']['content'].strip()
-        print_debug(f"DeepSeek API响应: {content[:200]}...")  # 打印响应预览
+        if is_enabled(DEBUG):
+            print_debug(f"DeepSeek API响应: {content[:200]}...")  # 打印响应预览
         return content
         
     except requests.exceptions.Timeout:
         print_error("DeepSeek API请求超时")
+        check_deadline("DeepSeek API")
     except requests.exceptions.RequestException as e:
         print_error(f"DeepSeek API请求失败: {str(e)}")
     except json.JSONDecodeError:
@@ -126,12 +132,14 @@ def ai_select_best_match(matches):
     print_debug(f"发送选择请求，共 {len(matches)} 个选项...")
     
     # 调用DeepSeek API
-    response = call_deepseek_api(prompt)
+    with metrics.timed('ai_select'):
+        response = call_deepseek_api(prompt)
     if not response:
         print_debug("AI响应失败，使用默认选择逻辑")
         return default_select_best_match(matches)
     
-    print_debug(f"AI响应内容: {response}")
+    if is_enabled(DEBUG):
+        print_debug(f"AI响应内容: {response}")
     
     # 解析响应，提取选择的编号
     try:
@@ -166,17 +174,14 @@ def default_select_best_match(matches):
     # 按评分和评价人数筛选
     qualified_matches = []
     for match in matches:
-        try:
-            rating = float(match['rating']) if match.get('rating') else 0
-            rating_people = int(match['rating_people'].replace(',', '')) if match.get('rating_people') else 0
-            
-            if (rating >= PREFERENCES.min_rating_threshold and 
-                rating_people >= PREFERENCES.min_rating_people):
-                qualified_matches.append(match)
+        # 评分和评价人数在 BookRecord 中已经是数字
+        rating = match.get('rating', 0)
+        rating_people = match.get('rating_people', 0)
+        if (rating >= PREFERENCES.min_rating_threshold and
+            rating_people >= PREFERENCES.min_rating_people):
+            qualified_matches.append(match)
+            if is_enabled(DEBUG):
                 print_debug(f"合格匹配: {match['title']} (评分: {rating}, 评价人数: {rating_people})")
-        except (ValueError, AttributeError) as e:
-            print_debug(f"解析评分信息失败: {str(e)}")
-            continue
     
     if not qualified_matches:
         print_debug("没有满足评分条件的匹配，返回相似度最高的结果")
@@ -245,12 +250,14 @@ def ai_confirm_rename(old_name, new_name, book_info):
 请直接回答：APPROVE 或 REJECT ，然后换行说明原因。
 """
     
-    response = call_deepseek_api(prompt)
+    with metrics.timed('ai_confirm'):
+        response = call_deepseek_api(prompt)
     if not response:
         print_debug("AI响应失败，默认同意重命名")
         return True
     
-    print_debug(f"AI响应内容: {response}")
+    if is_enabled(DEBUG):
+        print_debug(f"AI响应内容: {response}")
     
     # 检查第一行的决定
     first_line = response.split('\n')[0].strip().upper()
@@ -0,0 +1,78 @@
+import os
+import time
+
+from src.config.config import BOOKS_DIR, DOUBAN_CONFIG
+from src.utils.logger import print_info, print_error, print_warning, print_success, print_section, book_context
+from src.utils.file_ops import atomic_write
+from src.services.douban import TIER_FULL, fetch_douban_book_info, missing_fields
+from src.services.file_service import build_nfo_content
+from src.services.metadata_store import get_metadata_store
+
+def _subject_url(book_info):
+    """详情页地址：优先按豆瓣ID使用当前配置的地址模板（可能已改为镜像），没有ID时用保存的地址"""
+    if book_info.get('douban_id'):
+        return DOUBAN_CONFIG['subject_url'].format(douban_id=book_info['douban_id'])
+    return book_info.get('url')
+
+def _rewrite_nfo(folder, book_info):
+    """书籍文件夹还在本地时，用补全后的信息重写其中的NFO（内容不变时不写）"""
+    folder_path = os.path.join(BOOKS_DIR, folder)
+    if not os.path.isdir(folder_path):
+        return False
+    nfo_names = [name for name in os.listdir(folder_path) if name.lower().endswith('.nfo')]
+    if not nfo_names:
+        return False
+    content = build_nfo_content(book_info)
+    nfo_path = os.path.join(folder_path, nfo_names[0])
+    with open(nfo_path, 'r', encoding='utf-8') as f:
+        if f.read() == content:
+            return False
+    atomic_write(nfo_path, content)
+    return True
+
+def backfill(limit=None, interval=None, dry_run=False):
+    """后台补全元数据：对整理时跳过了详情页的书逐本获取详情页，更新元数据缓存和本地NFO
+    请求间隔较长，适合放在夜间或 watch 之外单独运行；可随时中断，已补全的书不会重复请求
+    Args:
+        limit: 最多处理多少本书
+        interval: 每两本书之间的间隔（秒），默认使用 DOUBAN_CONFIG['backfill_interval']
+        dry_run: 只列出需要补全的书
+    """
+    interval = DOUBAN_CONFIG.get('backfill_interval', 30) if interval is None else interval
+    store = get_metadata_store()
+    pending = [(folder, book) for folder, book in store.iter_books()
+               if _subject_url(book) and missing_fields(book, TIER_FULL)]
+    print_section("补全元数据")
+    print_info(f"{len(pending)} 本书缺少完整元数据")
+    if limit:
+        pending = pending[:limit]
+    if dry_run:
+        for folder, book in pending:
+            print_info(f"{folder}: 缺少 {', '.join(missing_fields(book, TIER_FULL))}")
+        return
+
+    done = failed = rewritten = 0
+    try:
+        for index, (folder, book) in enumerate(pending):
+            if index:
+                time.sleep(interval)
+            with book_context(folder):
+                print_info(f"[{index + 1}/{len(pending)}] {folder}")
+                detail = fetch_douban_book_info(_subject_url(book))
+                if not detail:
+                    failed += 1
+                    continue
+                book.update(detail)
+                book['detail_fetched'] = True
+                store.save(folder, book)
+                done += 1
+                try:
+                    if _rewrite_nfo(folder, book):
+                        rewritten += 1
+                except OSError as e:
+                    print_error(f"重写NFO失败: {folder} ({e})")
+    except KeyboardInterrupt:
+        print_warning("\n补全被中断，下次运行时继续")
+    print_success(f"补全完成: {done} 本，失败 {failed} 本，重写NFO {rewritten} 个")
+    if done:
+        print_info("作者等命名字段可能已更新，可运行 relayout 按新信息重新命名")
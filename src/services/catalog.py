@@ -0,0 +1,281 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from src.config.config import CACHE_DIR
+from src.utils.logger import print_info, print_error, print_warning, print_success, print_debug
+from src.utils.text_utils import to_simplified, normalize_title
+from src.utils.book_record import BookRecord
+from src.utils.author_utils import clean_author_names
+
+# 本地豆瓣书目数据库
+CATALOG_DB = os.path.join(CACHE_DIR, "catalog.db")
+
+# 导入时每批写入的记录数
+IMPORT_BATCH = 5000
+
+# 标题检索最多取出的候选数
+MAX_CANDIDATES = 50
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def title_grams(title_norm):
+    """归一化标题的二元组（单字标题返回自身），用于模糊检索"""
+    if len(title_norm) < 2:
+        return {title_norm} if title_norm else set()
+    return {title_norm[i:i + 2] for i in range(len(title_norm) - 1)}
+
+def normalize_isbn(isbn):
+    """只保留ISBN中的数字和X"""
+    return re.sub(r'[^0-9X]', '', str(isbn).upper()) if isbn else None
+
+def is_valid_isbn(isbn):
+    """校验ISBN-10/ISBN-13的校验位（参数为 normalize_isbn 的结果）"""
+    if not isbn:
+        return False
+    if len(isbn) == 13 and isbn.isdigit():
+        return sum(int(d) * (1 if i % 2 == 0 else 3) for i, d in enumerate(isbn)) % 10 == 0
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == 'X'):
+        digits = [int(d) for d in isbn[:9]] + [10 if isbn[9] == 'X' else int(isbn[9])]
+        return sum(d * (10 - i) for i, d in enumerate(digits)) % 11 == 0
+    return False
+
+def _first(record, *keys):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, '', []):
+            return value
+    return None
+
+def _names(value):
+    """作者/译者字段可能是列表、字典列表或用 / 分隔的字符串"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'\s*/\s*', value)
+    return [to_simplified(v.get('name', '') if isinstance(v, dict) else str(v)).strip() for v in value if v]
+
+def record_to_book_info(record):
+    """把导出数据中的一条记录转换为与 search_douban 结果相同的 BookRecord
+    Args:
+        record: JSON对象（字段名兼容 id/douban_id、authors/author、summary/intro 等写法）
+    Returns:
+        BookRecord，缺少ID或标题时返回None
+    """
+    douban_id = _first(record, 'douban_id', 'id')
+    title = _first(record, 'title')
+    if not douban_id or not title:
+        return None
+    douban_id = str(douban_id)
+    title = to_simplified(str(title).replace(' ', ''))
+
+    raw_authors = _names(_first(record, 'authors', 'author'))
+    publish_year = _first(record, 'publish_year', 'pubdate', 'year')
+    tags = [to_simplified(t.get('name', '') if isinstance(t, dict) else str(t)) for t in record.get('tags') or []]
+    intro = _first(record, 'intro', 'summary')
+    intro = to_simplified(str(intro)) if intro else None
+    rating = _first(record, 'rating')
+    if isinstance(rating, dict):
+        rating = rating.get('average') or rating.get('value')
+    publisher = _first(record, 'publisher')
+
+    return BookRecord(
+        title=title,
+        author=raw_authors[0] if raw_authors else "",
+        year=publish_year,
+        publisher=to_simplified(publisher) if publisher else None,
+        cover_url=_first(record, 'cover_url', 'image', 'cover'),
+        rating=rating,
+        rating_people=_first(record, 'rating_people', 'num_raters', 'numRaters'),
+        intro=intro[:200] if intro else None,
+        url=f"https://book.douban.com/subject/{douban_id}/",
+        douban_id=douban_id,
+        isbn=normalize_isbn(_first(record, 'isbn', 'isbn13', 'isbn10')),
+        pages=_first(record, 'pages'),
+        price=_first(record, 'price'),
+        binding=_first(record, 'binding'),
+        series=_first(record, 'series'),
+        publish_year=str(publish_year) if publish_year else None,
+        authors=clean_author_names(raw_authors),
+        translators=_names(_first(record, 'translators', 'translator')),
+        tags=list(dict.fromkeys(t for t in tags if t)),
+        full_intro=intro
+    )
+
+class Catalog:
+    """本地豆瓣书目：压缩存储书籍信息，并按标题二元组、归一化标题、作者和ISBN建立索引"""
+    def __init__(self, db_path=CATALOG_DB):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS books (
+                    douban_id TEXT PRIMARY KEY,
+                    title_norm TEXT NOT NULL,
+                    author_norm TEXT,
+                    isbn TEXT,
+                    data BLOB NOT NULL
+                ) WITHOUT ROWID
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS title_grams (
+                    gram TEXT NOT NULL,
+                    douban_id TEXT NOT NULL,
+                    PRIMARY KEY (gram, douban_id)
+                ) WITHOUT ROWID
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_books_title ON books (title_norm)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_books_author ON books (author_norm)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_books_isbn ON books (isbn)")
+
+    @staticmethod
+    def _pack(book):
+        return zlib.compress(book.pack().encode('utf-8'))
+
+    @staticmethod
+    def _unpack(data):
+        # 旧版本导入的记录是完整的JSON对象，unpack 同样能读取
+        return BookRecord.unpack(zlib.decompress(data).decode('utf-8'))
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+
+    def add_many(self, books):
+        """批量写入（同一ID覆盖旧记录）
+        Args:
+            books: BookRecord 列表（record_to_book_info 的结果）
+        """
+        rows, grams = [], []
+        for book in books:
+            title_norm = normalize_title(book['title'])
+            author_norm = normalize_title(book['authors'][0]) if book['authors'] else None
+            rows.append((book['douban_id'], title_norm, author_norm, book['isbn'], self._pack(book)))
+            grams.extend((gram, book['douban_id']) for gram in title_grams(title_norm))
+        ids = [row[0] for row in rows]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                # 覆盖记录时标题可能变化，按旧标题删除旧的二元组（分段查询，避免超出SQL参数个数限制）
+                old_grams = []
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    for douban_id, old_title in self._db.execute(
+                            f"SELECT douban_id, title_norm FROM books WHERE douban_id IN ({placeholders})", chunk):
+                        old_grams.extend((gram, douban_id) for gram in title_grams(old_title))
+                self._db.executemany("DELETE FROM title_grams WHERE gram = ? AND douban_id = ?", old_grams)
+                self._db.executemany("INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.executemany("INSERT OR IGNORE INTO title_grams VALUES (?, ?)", grams)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _load(self, ids):
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(f"SELECT data FROM books WHERE douban_id IN ({placeholders})", list(ids)).fetchall()
+        return [self._unpack(row[0]) for row in rows]
+
+    def find_by_isbn(self, isbn):
+        """按ISBN精确查找"""
+        isbn = normalize_isbn(isbn)
+        if not isbn:
+            return []
+        with self._lock:
+            ids = [row[0] for row in self._db.execute("SELECT douban_id FROM books WHERE isbn = ?", (isbn,))]
+        return self._load(ids)
+
+    def find_by_author(self, author, limit=MAX_CANDIDATES):
+        """按作者（第一作者，归一化后）精确查找"""
+        author_norm = normalize_title(author)
+        if not author_norm:
+            return []
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT douban_id FROM books WHERE author_norm = ? LIMIT ?", (author_norm, limit))]
+        return self._load(ids)
+
+    def find_by_title(self, title, limit=MAX_CANDIDATES):
+        """按标题检索候选：归一化标题完全相同的记录，加上共享二元组最多的记录"""
+        title_norm = normalize_title(title)
+        grams = list(title_grams(title_norm))
+        if not grams:
+            return []
+        placeholders = ",".join("?" * len(grams))
+        with self._lock:
+            ids = [row[0] for row in self._db.execute(
+                "SELECT douban_id FROM books WHERE title_norm = ? LIMIT ?", (title_norm, limit))]
+            ids += [row[0] for row in self._db.execute(
+                f"SELECT douban_id FROM title_grams WHERE gram IN ({placeholders}) "
+                f"GROUP BY douban_id ORDER BY COUNT(*) DESC LIMIT ?", (*grams, limit))]
+        return self._load(list(dict.fromkeys(ids)))
+
+def get_catalog():
+    """获取本地书目，数据库不存在（从未导入）时返回None"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None and os.path.exists(CATALOG_DB):
+            _catalog = Catalog()
+        return _catalog
+
+def _open_dump(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+def import_catalog(paths):
+    """导入豆瓣书目导出文件（JSON Lines，可以是 .gz 压缩文件）
+    Args:
+        paths: 文件路径列表
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = Catalog()
+        catalog = _catalog
+
+    start = time.monotonic()
+    imported = skipped = 0
+    for path in paths:
+        print_info(f"导入书目: {path}")
+        batch = []
+        try:
+            with _open_dump(path) as f:
+                for line_no, line in enumerate(f, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        book = record_to_book_info(json.loads(line))
+                    except (ValueError, TypeError, AttributeError) as e:
+                        print_debug(f"{path}:{line_no} 解析失败: {e}")
+                        book = None
+                    if not book:
+                        skipped += 1
+                        continue
+                    batch.append(book)
+                    if len(batch) >= IMPORT_BATCH:
+                        catalog.add_many(batch)
+                        imported += len(batch)
+                        batch = []
+                        print_info(f"已导入 {imported} 条 ({imported / (time.monotonic() - start):.0f} 条/秒)")
+            if batch:
+                catalog.add_many(batch)
+                imported += len(batch)
+        except OSError as e:
+            print_error(f"读取书目文件失败: {path} ({e})")
+    if skipped:
+        print_warning(f"跳过 {skipped} 条无效记录（缺少ID或标题，或不是有效的JSON）")
+    print_success(f"书目导入完成: {imported} 条，本地书目共 {catalog.count()} 条 "
+                  f"(用时 {time.monotonic() - start:.1f} 秒)")
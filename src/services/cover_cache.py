@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from src.config.config import CACHE_DIR, CACHE_CONFIG, REQUEST_CONFIG
+from src.utils.logger import print_info, print_error, print_debug, print_warning
+from src.utils.network import get_random_headers
+from src.utils.file_ops import atomic_open, atomic_write, _temp_path
+from src.utils.deadline import capped_timeout
+from src.utils import metrics
+from src.utils.proxy_pool import get_proxy_pool
+from src.utils.circuit_breaker import OUTCOME_SUCCESS, OUTCOME_FAILURE
+
+# 封面缓存目录
+COVER_CACHE_DIR = os.path.join(CACHE_DIR, "covers")
+
+# Linux 上 btrfs/xfs 等文件系统的 FICLONE ioctl，用于写时复制(reflink)
+FICLONE = 0x40049409
+
+# 缓存命中统计
+COVER_STATS = {'hits': 0, 'revalidated': 0, 'downloaded': 0, 'bytes': 0}
+_stats_lock = threading.Lock()
+
+# 每个线程复用一个会话，保持与图片CDN的连接
+_thread_local = threading.local()
+
+def _session():
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _thread_local.session = session
+    return session
+
+# 同时计入全局性能指标的统计项
+_METRIC_NAMES = {'hits': 'cover_cache_hits', 'revalidated': 'cover_cache_revalidated', 'bytes': 'cover_bytes_downloaded'}
+
+def _count(**deltas):
+    with _stats_lock:
+        for key, value in deltas.items():
+            COVER_STATS[key] += value
+    for key, value in deltas.items():
+        if key in _METRIC_NAMES:
+            metrics.count(_METRIC_NAMES[key], value)
+
+def cover_key(url, douban_id=None):
+    """封面缓存键：优先使用豆瓣ID，否则使用URL的哈希"""
+    if douban_id:
+        return f"douban-{douban_id}"
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+def _cache_paths(key):
+    """返回 (图片路径, 元数据路径)，按键的哈希前两位分目录"""
+    shard = hashlib.sha1(key.encode('utf-8')).hexdigest()[:2]
+    base = os.path.join(COVER_CACHE_DIR, shard, key)
+    return base + ".jpg", base + ".json"
+
+def _load_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_meta(meta_path, meta):
+    atomic_write(meta_path, json.dumps(meta))
+
+def get_cover(url, douban_id=None):
+    """获取封面的本地缓存路径，必要时下载或向服务器条件校验
+    Args:
+        url: 封面图片URL
+        douban_id: 豆瓣ID（可选）
+    Returns:
+        str: 缓存中的图片路径，失败时返回None
+    """
+    data_path, meta_path = _cache_paths(cover_key(url, douban_id))
+    # 缓存的图片为空（例如之前写入失败）时同样视为没有缓存
+    meta = _load_meta(meta_path) if os.path.exists(data_path) and os.path.getsize(data_path) else None
+    if meta and meta.get('url') != url:
+        # 同一本书的封面地址变了，重新下载
+        meta = None
+
+    max_age = CACHE_CONFIG.get('cover_revalidate_days', 30) * 86400
+    if meta and time.time() - meta.get('checked', 0) < max_age:
+        _count(hits=1)
+        print_debug(f"封面缓存命中: {url}")
+        return data_path
+
+    headers = get_random_headers()
+    if meta:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    print_info(f"下载封面: {url}")
+    # 图片CDN不按 request_delay 限速，但同样在代理之间分摊并参与代理评分
+    pool = get_proxy_pool()
+    lease = pool.acquire(urlsplit(url).netloc, pace=False)
+    outcome = OUTCOME_FAILURE
+    try:
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        res = _session().get(url, headers=headers, proxies=lease.proxies,
+                             timeout=capped_timeout(REQUEST_CONFIG['timeout']), stream=True)
+        if res.status_code == 304 and not meta:
+            # 没有可用的缓存却收到304（中间缓存按自己的记录回应），当作未命中，要求完整下载
+            res.close()
+            print_debug(f"没有封面缓存却收到304，重新完整下载: {url}")
+            headers['Cache-Control'] = 'no-cache'
+            res = _session().get(url, headers=headers, proxies=lease.proxies,
+                                 timeout=capped_timeout(REQUEST_CONFIG['timeout']), stream=True)
+        with res:
+            if res.status_code == 304:
+                if not meta:
+                    raise RuntimeError("服务器返回304，但本地没有封面缓存")
+                outcome = OUTCOME_SUCCESS
+                meta['checked'] = time.time()
+                _save_meta(meta_path, meta)
+                _count(revalidated=1)
+                print_debug(f"封面未变化，继续使用缓存: {url}")
+                return data_path
+            res.raise_for_status()
+            outcome = OUTCOME_SUCCESS
+
+            # 边下载边写入临时文件，完成后原子替换
+            size = 0
+            with atomic_open(data_path, 'wb') as f:
+                for chunk in res.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+                    size += len(chunk)
+            _save_meta(meta_path, {
+                'url': url,
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified'),
+                'checked': time.time(),
+                'size': size
+            })
+            _count(downloaded=1, bytes=size)
+            return data_path
+    except Exception as e:
+        if meta:
+            print_warning(f"封面校验失败，使用旧缓存: {e}")
+            return data_path
+        print_error(f"下载封面失败: {e}")
+        return None
+    finally:
+        pool.release(lease, outcome)
+
+def _reflink(src, dst):
+    """尝试写时复制克隆文件（仅支持的文件系统可用）"""
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+def place_cover(cache_path, save_path):
+    """把缓存中的封面放到书籍文件夹：优先硬链接，其次reflink，最后复制
+    Args:
+        cache_path: 缓存中的图片路径
+        save_path: 目标路径
+    """
+    # 临时文件名按进程和线程区分，同一本书的两个格式同时放置同一张封面时互不干扰
+    tmp_path = _temp_path(save_path)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        try:
+            os.link(cache_path, tmp_path)
+        except OSError:
+            try:
+                _reflink(cache_path, tmp_path)
+            except (OSError, ImportError):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                shutil.copyfile(cache_path, tmp_path)
+        os.replace(tmp_path, save_path)
+        # 目标已经是同一文件的硬链接时 rename 什么也不做，临时链接还留着
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_cover(url, douban_id=None):
+    """读取封面内容（经过缓存）
+    Returns:
+        bytes或None
+    """
+    path = get_cover(url, douban_id)
+    if not path:
+        return None
+    with open(path, 'rb') as f:
+        return f.read()
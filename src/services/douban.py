@@ -1,28 +1,68 @@
-import difflib
 import re
 
 import requests
 from bs4 import BeautifulSoup
 from src.utils.network import safe_request
 from src.utils.text_utils import to_simplified, calculate_title_similarity
-from src.utils.logger import print_info, print_error, print_debug, print_warning
+from src.utils.book_record import BookRecord
+from src.utils.author_utils import AUTHOR_MATCH_THRESHOLD, author_similarity, clean_author_names
+from src.utils.logger import DEBUG, print_info, print_error, print_debug, print_warning, is_enabled
 from src.services.ai_service import ai_select_best_match
+from src.config.config import DOUBAN_CONFIG
+from src.utils import metrics
 
-DOUBAN_SEARCH_URL = "https://www.douban.com/search"
+# 元数据级别及各级别需要的字段
+TIER_NAMING = 'naming'
+TIER_NFO = 'nfo'
+TIER_FULL = 'full'
+TIER_FIELDS = {
+    TIER_NAMING: ('title', 'author', 'year'),
+    TIER_NFO: ('title', 'author', 'year', 'publisher', 'cover_url', 'intro'),
+    TIER_FULL: ('title', 'author', 'year', 'publisher', 'cover_url', 'intro', 'isbn', 'tags', 'full_intro'),
+}
+
+def missing_fields(book_info, tier=None):
+    """书籍信息中缺少、而元数据级别要求的字段（已获取过详情页的不再算缺少）
+    Args:
+        book_info: 书籍信息
+        tier: 元数据级别，默认使用 DOUBAN_CONFIG['metadata_tier']
+    Returns:
+        list: 缺少的字段名
+    """
+    if book_info.get('detail_fetched'):
+        return []
+    fields = TIER_FIELDS.get(tier or DOUBAN_CONFIG.get('metadata_tier'), TIER_FIELDS[TIER_FULL])
+    return [field for field in fields if not book_info.get(field)]
 
 def search_douban(query, expected_author=None, fetch_detail=True, min_similarity=0.6):
     """在豆瓣搜索书籍，返回匹配度最高的书籍信息
     Args:
         query: 搜索关键词
         expected_author: 预期的作者名（可选，用于比较）
-        fetch_detail: 是否获取详情页信息（可选，默认True）
+        fetch_detail: 是否允许获取详情页信息（可选，默认True；只在缺少元数据级别要求的字段时获取）
         min_similarity: 最小标题相似度（可选，默认0.6）
     Returns:
-        匹配的书籍信息字典
+        匹配的书籍信息（BookRecord）
+    """
+    matched_results = search_douban_candidates(query, min_similarity)
+    best_match = select_best_match(matched_results or [], expected_author)
+    if not best_match:
+        return None
+    return complete_book_info(best_match, fetch_detail)
+
+def search_douban_candidates(query, min_similarity=0.6, match_title=None):
+    """在豆瓣搜索书籍，返回标题相似度合格的全部候选（不做选择）
+    Args:
+        query: 搜索关键词
+        min_similarity: 最小标题相似度
+        match_title: 计算相似度时比较的标题（可选，默认为搜索关键词；关键词中带有作者时使用）
+    Returns:
+        带 similarity、index 字段的 BookRecord 列表，请求失败时返回None
     """
     print_info(f"搜索豆瓣: '{query}'")
     params = {"cat": "1001", "q": query}
-    res = safe_request(DOUBAN_SEARCH_URL, params=params)
+    with metrics.timed('douban_search'):
+        res = safe_request(DOUBAN_CONFIG['search_url'], params=params)
     
     if not res:
         print_error("豆瓣搜索失败")
@@ -35,13 +75,16 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
     
     # 存储所有匹配的结果，按相似度排序
     matched_results = []
+    # 逐条结果的调试日志较多，未开启 DEBUG 时不构造
+    debug = is_enabled(DEBUG)
     
     for index, result in enumerate(results):
         try:
             # 获取标题和链接
             title_elem = result.select_one('.title h3 a')
             if not title_elem:
-                print_debug(f"结果 #{index+1}: 无法找到标题元素")
+                if debug:
+                    print_debug(f"结果 #{index+1}: 无法找到标题元素")
                 continue
             
             # 获取标题并转为简体字
@@ -49,12 +92,13 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
             book_url = title_elem.get('href', '')
             
             # 计算标题相似度
-            similarity = calculate_title_similarity(query, title)
+            similarity = calculate_title_similarity(match_title or query, title)
             print_info(f"结果 #{index+1}: 标题='{title}', 相似度={similarity:.2f}")
             
             # 如果相似度太低，跳过
             if similarity < min_similarity:
-                print_debug(f"结果 #{index+1}: 标题相似度过低 ({similarity:.2f} < {min_similarity})")
+                if debug:
+                    print_debug(f"结果 #{index+1}: 标题相似度过低 ({similarity:.2f} < {min_similarity})")
                 continue
             
             # 从重定向URL中提取真实的豆瓣图书链接
@@ -74,23 +118,27 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
                     subject_id = subject_match.group(1)
             
             if not subject_id:
-                print_debug(f"结果 #{index+1}: 无法提取豆瓣ID")
+                if debug:
+                    print_debug(f"结果 #{index+1}: 无法提取豆瓣ID")
                 continue
                 
             # 构建真实的豆瓣图书URL
-            real_book_url = f'https://book.douban.com/subject/{subject_id}/'
-            print_debug(f"结果 #{index+1}: 豆瓣URL={real_book_url}")
+            real_book_url = DOUBAN_CONFIG['subject_url'].format(douban_id=subject_id)
+            if debug:
+                print_debug(f"结果 #{index+1}: 豆瓣URL={real_book_url}")
             
             # 获取评分信息
             rating_info = result.select_one('.rating-info')
             if not rating_info:
-                print_debug(f"结果 #{index+1}: 无法找到评分信息")
+                if debug:
+                    print_debug(f"结果 #{index+1}: 无法找到评分信息")
                 continue
                 
             # 获取出版信息
             subject_cast = rating_info.select_one('.subject-cast')
             if not subject_cast:
-                print_debug(f"结果 #{index+1}: 无法找到出版信息")
+                if debug:
+                    print_debug(f"结果 #{index+1}: 无法找到出版信息")
                 continue
                 
             subject_info = to_simplified(subject_cast.get_text(strip=True))
@@ -108,7 +156,8 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
                     year = part.strip()
                     break
             
-            print_debug(f"结果 #{index+1}: 作者='{author}', 出版社='{publisher}', 年份='{year}'")
+            if debug:
+                print_debug(f"结果 #{index+1}: 作者='{author}', 出版社='{publisher}', 年份='{year}'")
             
             # 获取封面图片URL
             cover_elem = result.select_one('.pic img')
@@ -123,26 +172,27 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
             rating_people = rating_info.select_one('.rating_nums + span')
             rating_people = rating_people.get_text(strip=True).strip('(人评价)') if rating_people else None
             
-            print_debug(f"结果 #{index+1}: 评分={rating}, 评价人数={rating_people}")
+            if debug:
+                print_debug(f"结果 #{index+1}: 评分={rating}, 评价人数={rating_people}")
             
             # 获取简介
             intro = result.select_one('.content p')
             intro = to_simplified(intro.get_text(strip=True)) if intro else None
 
-            book_info = {
-                "title": title,
-                "author": author,
-                "year": year,
-                "publisher": publisher,
-                "cover_url": cover_url,
-                "rating": rating,
-                "rating_people": rating_people,
-                "intro": intro,
-                "url": real_book_url,
-                "douban_id": subject_id,
-                "similarity": similarity,
-                "index": index + 1  # 保存结果的序号，用于用户选择
-            }
+            book_info = BookRecord(
+                title=title,
+                author=author,
+                year=year,
+                publisher=publisher,
+                cover_url=cover_url,
+                rating=rating,
+                rating_people=rating_people,
+                intro=intro,
+                url=real_book_url,
+                douban_id=subject_id,
+                similarity=similarity,
+                index=index + 1  # 保存结果的序号，用于用户选择
+            )
             
             # 将结果添加到匹配列表
             matched_results.append(book_info)
@@ -151,6 +201,32 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
             print_error(f"解析搜索结果 #{index+1} 时出错: {e}")
             continue
     
+    return matched_results
+
+def complete_book_info(best_match, fetch_detail=True):
+    """补全选定的搜索结果：缺少当前元数据级别需要的字段（ISBN、标签等）时才获取详情页，其余留给 backfill"""
+    missing = missing_fields(best_match) if fetch_detail and best_match["url"] else []
+    if missing:
+        print_info(f"获取详情页信息 (缺少 {', '.join(missing)}): {best_match['url']}")
+        detail_info = fetch_douban_book_info(best_match["url"])
+        if detail_info:
+            best_match.update(detail_info)
+            best_match['detail_fetched'] = True
+    elif fetch_detail:
+        metrics.count('douban_detail_skipped')
+        print_debug("搜索结果已包含所需字段，跳过详情页")
+
+    return best_match
+
+def select_best_match(matched_results, expected_author=None):
+    """从已过滤的候选结果中选出最佳匹配：最高标题相似度 -> 作者相似度 -> AI/默认选择
+    本地目录和在线搜索共用这套规则
+    Args:
+        matched_results: 带 similarity 字段的书籍信息列表
+        expected_author: 预期的作者名（可选）
+    Returns:
+        最佳匹配的书籍信息，没有候选时返回None
+    """
     # 如果没有匹配的结果，返回None
     if not matched_results:
         print_warning("没有找到匹配的书籍")
@@ -174,22 +250,12 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
     else:
         # 如果有多个匹配且提供了预期作者，尝试匹配作者
         if expected_author and len(top_matches) > 1:
-            # 清理预期作者名
-            expected_author = re.sub(r'[\[（\(【〔][^\]）\)】〕]*[\]）\)】〕]', '', expected_author).strip()
-            expected_author = to_simplified(expected_author)
-            
-            # 尝试找到作者匹配的结果
+            # 尝试找到作者匹配的结果（别名表中的同一作者相似度为1）
             author_matches = []
             for match in top_matches:
-                # 清理作者名以便比较
-                clean_author = re.sub(r'[\[（\(【〔][^\]）\)】〕]*[\]）\)】〕]', '', match["author"]).strip()
-                
-                # 计算作者相似度
-                author_similarity = difflib.SequenceMatcher(None, expected_author.lower(), clean_author.lower()).ratio()
-                match["author_similarity"] = author_similarity
-                
-                # 如果作者相似度高，加入匹配列表
-                if author_similarity > 0.7:
+                similarity = author_similarity(expected_author, match["author"])
+                match["author_similarity"] = similarity
+                if similarity > AUTHOR_MATCH_THRESHOLD:
                     author_matches.append(match)
             
             # 如果找到作者匹配的结果，按作者相似度排序
@@ -203,14 +269,7 @@ def search_douban(query, expected_author=None, fetch_detail=True, min_similarity
         else:
             # 如果没有预期作者或只有一个匹配，使用AI选择
             best_match = ai_select_best_match(top_matches)
-    
-    # 获取详情页信息（ISBN等）
-    if fetch_detail and best_match["url"]:
-        print_info(f"获取详情页信息: {best_match['url']}")
-        detail_info = fetch_douban_book_info(best_match["url"])
-        if detail_info:
-            best_match.update(detail_info)
-    
+
     return best_match
 
 def fetch_douban_book_info(book_url):
@@ -222,7 +281,8 @@ def fetch_douban_book_info(book_url):
     """
     print_info(f"获取书籍详情: {book_url}")
     try:
-        res = safe_request(book_url)
+        with metrics.timed('douban_detail'):
+            res = safe_request(book_url)
         if not res:
             print_error("获取详情页失败")
             return None
@@ -266,21 +326,7 @@ def fetch_douban_book_info(book_url):
             # 获取作者span后面的所有作者链接
             author_links = author_span.find_parent('span').find_all('a')
             if author_links:
-                authors = [to_simplified(a.get_text(strip=True)) for a in author_links]
-                # 处理作者名：去除国籍标记和英文名
-                cleaned_authors = []
-                for author in authors:
-                    # 去除国籍标记 [美] [英] 等
-                    author = re.sub(r'[\[（\(【〔][^\]）\)】〕]*[\]）\)】〕]', '', author)
-                    # 去除括号内的英文名
-                    author = re.sub(r'\s*\([^)]*\)', '', author)
-                    # 去除英文名（通常在点号或空格后）
-                    author = re.sub(r'(?<=[\u4e00-\u9fff])\s*[A-Za-z\s.]+(?:\s+[A-Za-z\s.]+)*$', '', author)
-                    # 清理多余的空格
-                    author = author.strip()
-                    if author:
-                        cleaned_authors.append(author)
-                authors = cleaned_authors
+                authors = clean_author_names(to_simplified(a.get_text(strip=True)) for a in author_links)
                 print_debug(f"找到作者: {authors}")
             
         # 获取译者（如果有）
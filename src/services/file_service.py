@@ -1,42 +1,106 @@
 import os
+from xml.etree import ElementTree
 from xml.sax.saxutils import escape
 from src.utils.logger import print_info, print_error, print_debug, print_warning
 from src.utils.text_utils import safe_xml
-from src.utils.network import safe_request
+from src.utils.author_utils import strip_markers
+from src.utils.file_ops import atomic_write, move_file
+from src.services.cover_cache import get_cover, place_cover, read_cover
 from src.config.config import BOOKS_DIR, NEW_NAME_PATTERN, generate_folder_name
-import re
+from src.utils.library_layout import library_path
 
-def download_cover(url, save_path):
+def book_naming(book_info):
+    """从书籍信息中取出命名所需的字段，规则与整理书籍时一致
+    Args:
+        book_info: 书籍信息字典（豆瓣信息或 title/author/year）
+    Returns:
+        包含 title、author、year 的字典
+    """
+    # 优先使用豆瓣详情页的authors字段
+    if book_info.get("authors"):
+        author = book_info["authors"][0]
+    else:
+        author = book_info.get("author")
+    # 清理作者名中的国籍标记
+    if author:
+        author = strip_markers(author)
+    return {
+        'title': book_info.get("title"),
+        'author': author,
+        'year': book_info.get("year")
+    }
+
+def parse_nfo(nfo_path):
+    """读取已生成的 NFO 文件，还原为书籍信息字典（generate_nfo 的逆过程）
+    Args:
+        nfo_path: NFO文件路径
+    Returns:
+        书籍信息字典，解析失败返回None
+    """
+    try:
+        root = ElementTree.parse(nfo_path).getroot()
+    except (OSError, ElementTree.ParseError) as e:
+        print_error(f"读取NFO文件失败: {nfo_path} ({e})")
+        return None
+
+    def field(tag):
+        return (root.findtext(tag) or "").strip() or None
+
+    tags = field("tag")
+    artist = field("artist")
+    return {
+        "title": field("title"),
+        "publish_year": field("publish_date"),
+        "year": field("year"),
+        "isbn": field("isbn"),
+        "tags": [t.strip() for t in tags.split(" / ")] if tags else [],
+        "publisher": field("publisher"),
+        "author": artist,
+        "authors": [artist] if artist else [],
+        "full_intro": field("introduction")
+    }
+
+def fetch_cover_bytes(url, douban_id=None):
+    """获取豆瓣封面内容（经过本地封面缓存）
+    Args:
+        url: 封面图片URL
+        douban_id: 豆瓣ID（可选，作为缓存键）
+    Returns:
+        bytes或None
+    """
+    try:
+        return read_cover(url, douban_id)
+    except Exception as e:
+        print_error(f"读取封面失败: {e}")
+        return None
+
+def download_cover(url, save_path, douban_id=None):
     """下载豆瓣封面
     Args:
         url: 封面图片URL
         save_path: 保存路径
+        douban_id: 豆瓣ID（可选，作为缓存键）
     """
-    print_info(f"下载封面: {url}")
+    cache_path = get_cover(url, douban_id)
+    if not cache_path:
+        return
     try:
-        res = safe_request(url)
-        if not res:
-            print_error("下载封面失败")
-            return
-            
-        with open(save_path, "wb") as f:
-            f.write(res.content)
+        place_cover(cache_path, save_path)
         print_info(f"封面已保存到: {save_path}")
     except Exception as e:
-        print_error(f"下载封面失败: {e}")
+        print_error(f"保存封面失败: {e}")
 
-def generate_nfo(book_info, save_path):
-    """创建 NFO 文件，XML格式
+def build_nfo_content(book_info):
+    """生成 NFO 文件内容，XML格式
     Args:
         book_info: 书籍信息字典
-        save_path: 保存路径
+    Returns:
+        str: XML内容，没有书籍信息时返回None
     """
     if not book_info:
         print_warning("没有书籍信息，无法生成NFO文件")
-        return
-    
-    print_info(f"生成NFO文件: {save_path}")
-        
+        return None
+
     # 构建XML内容
     xml_content = '<?xml version="1.0" encoding="UTF-8"?>\n'
     xml_content += '<book>\n'
@@ -76,7 +140,7 @@ def generate_nfo(book_info, save_path):
     # 清理作者名中的国籍标记
     if artist:
         original_artist = artist
-        artist = re.sub(r'[\[（\(【〔][^\]）\)】〕]*[\]）\)】〕]', '', artist).strip()
+        artist = strip_markers(artist)
         if artist != original_artist:
             print_debug(f"清理作者名中的国籍标记: '{original_artist}' -> '{artist}'")
         
@@ -89,11 +153,23 @@ def generate_nfo(book_info, save_path):
     xml_content += f'    <introduction>{safe_xml(intro)}</introduction>\n'
     
     xml_content += '</book>'
-    
+    return xml_content
+
+def generate_nfo(book_info, save_path):
+    """创建 NFO 文件，XML格式
+    Args:
+        book_info: 书籍信息字典
+        save_path: 保存路径
+    """
+    xml_content = build_nfo_content(book_info)
+    if xml_content is None:
+        return
+
+    print_info(f"生成NFO文件: {save_path}")
+
     # 写入文件
     try:
-        with open(save_path, "w", encoding="utf-8") as f:
-            f.write(xml_content)
+        atomic_write(save_path, xml_content)
         print_info(f"NFO文件已保存: {save_path}")
     except Exception as e:
         print_error(f"保存NFO文件失败: {e}")
@@ -113,7 +189,7 @@ def create_book_folder(book_info, original_file_path):
     ext = os.path.splitext(original_file_path)[1].lstrip(".")
     
     # 生成文件夹名
-    folder_name = generate_folder_name(book_info)
+    folder_name = library_path(generate_folder_name(book_info))
     print_info(f"生成文件夹名: {folder_name}")
     
     # 创建文件夹
@@ -127,7 +203,7 @@ def create_book_folder(book_info, original_file_path):
         os.makedirs(folder_path, exist_ok=True)
         print_info(f"创建文件夹: {folder_path}")
         
-        os.rename(original_file_path, new_file_path)
+        move_file(original_file_path, new_file_path)
         print_info(f"重命名文件: {original_file_path} -> {new_file_path}")
         
         return folder_path, new_file_path
@@ -0,0 +1,307 @@
+import hashlib
+import html
+import os
+import posixpath
+import re
+import sqlite3
+import threading
+import zipfile
+from array import array
+from xml.etree import ElementTree
+
+import PyPDF2
+
+from src.config.config import CACHE_DIR, FINGERPRINT_CONFIG
+from src.utils.logger import print_info, print_warning, print_debug
+from src.utils.text_utils import to_simplified
+
+# 文本指纹索引：记录书库中每个书籍文件夹的 MinHash 签名，以及 LSH 分桶
+FINGERPRINT_DB = os.path.join(CACHE_DIR, "fingerprints.db")
+
+# 可以提取正文的格式
+FINGERPRINT_FORMATS = ['pdf', 'epub']
+
+# 参与指纹计算的正文范围：PDF的前几页，或EPUB按阅读顺序的前若干字
+MAX_PAGES = 10
+MAX_CHARS = 20000
+
+# 正文太短（例如没有文字层的扫描版PDF）时不计算指纹
+MIN_CHARS = 200
+
+# 按字符切分的片段长度（中文没有空格分词，按字符更稳定）
+SHINGLE_SIZE = 5
+
+# 签名长度和 LSH 分段：32段 x 每段4个值，相似度约0.45以上的两本书大概率落入同一个桶
+# 改变这些值后已有的索引不再可比，需要删除指纹数据库重新建立
+NUM_PERM = 128
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+
+# 单次置换 MinHash：片段哈希的低位决定所在的格子，每格取高位的最小值
+_BIN_BITS = NUM_PERM.bit_length() - 1
+_EMPTY = 1 << (64 - _BIN_BITS)
+
+# 忽略的字符：空白、标点和数字（页码、页眉中的数字在不同扫描版中各不相同）
+_IGNORED_RE = re.compile(r'[\s\d\W_]+', re.UNICODE)
+
+_index = None
+_index_lock = threading.Lock()
+
+def _pdf_text(file_path):
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        parts = []
+        for page in reader.pages[:MAX_PAGES]:
+            parts.append(page.extract_text() or "")
+            if sum(map(len, parts)) >= MAX_CHARS:
+                break
+    return "".join(parts)
+
+def _epub_documents(archive):
+    """EPUB中按阅读顺序（spine）排列的正文文件，找不到 OPF 时按文件名排序"""
+    names = archive.namelist()
+    try:
+        container = ElementTree.fromstring(archive.read('META-INF/container.xml'))
+        rootfile = next(el for el in container.iter() if el.tag.endswith('rootfile'))
+        opf_path = rootfile.get('full-path')
+        opf = ElementTree.fromstring(archive.read(opf_path))
+    except (KeyError, StopIteration, ElementTree.ParseError):
+        return sorted(name for name in names if name.lower().endswith(('.xhtml', '.html', '.htm')))
+    base = posixpath.dirname(opf_path)
+    manifest = {el.get('id'): el.get('href') for el in opf.iter() if el.tag.endswith('item')}
+    documents = []
+    for itemref in (el for el in opf.iter() if el.tag.endswith('itemref')):
+        href = manifest.get(itemref.get('idref'))
+        if href:
+            documents.append(posixpath.normpath(posixpath.join(base, href)))
+    return [name for name in documents if name in names]
+
+def _epub_text(file_path):
+    parts = []
+    with zipfile.ZipFile(file_path) as archive:
+        for name in _epub_documents(archive):
+            markup = archive.read(name).decode('utf-8', errors='replace')
+            markup = re.sub(r'(?is)<(script|style)[^>]*>.*?</\1>', ' ', markup)
+            parts.append(html.unescape(re.sub(r'<[^>]+>', ' ', markup)))
+            if sum(map(len, parts)) >= MAX_CHARS:
+                break
+    return "".join(parts)
+
+def extract_text(file_path, ext):
+    """提取用于指纹的正文：PDF前 MAX_PAGES 页的文字，或EPUB按阅读顺序的正文"""
+    ext = ext.lower()
+    if ext == 'pdf':
+        return _pdf_text(file_path)
+    if ext == 'epub':
+        return _epub_text(file_path)
+    return ""
+
+def normalize_text(text):
+    """转为简体、小写，去掉空白、标点和数字，使同一本书的不同扫描版、转换版尽量一致"""
+    return _IGNORED_RE.sub('', to_simplified(text[:MAX_CHARS * 2]).lower())[:MAX_CHARS]
+
+def minhash(text):
+    """正文的 MinHash 签名（NUM_PERM 个整数）
+    Args:
+        text: normalize_text 处理后的正文
+    Returns:
+        tuple，正文太短时返回None
+    """
+    if len(text) < MIN_CHARS:
+        return None
+    # 每个片段只哈希一次（单次置换），比逐个置换求最小值快两个数量级，估计的仍是 Jaccard 相似度
+    signature = [_EMPTY] * NUM_PERM
+    for i in range(len(text) - SHINGLE_SIZE + 1):
+        value = int.from_bytes(hashlib.blake2b(text[i:i + SHINGLE_SIZE].encode('utf-8'), digest_size=8).digest(), 'little')
+        slot, value = value & (NUM_PERM - 1), value >> _BIN_BITS
+        if value < signature[slot]:
+            signature[slot] = value
+    # 空格子从右侧最近的非空格子借值（加上距离区分来源），两本书按同样的规则填充，保持可比
+    filled = [slot for slot in range(NUM_PERM) if signature[slot] != _EMPTY]
+    for slot in range(NUM_PERM):
+        if signature[slot] == _EMPTY:
+            source = next((s for s in filled if s > slot), filled[0])
+            distance = (source - slot) % NUM_PERM
+            signature[slot] = signature[source] | (distance << (64 - _BIN_BITS))
+    return tuple(signature)
+
+def read_signature(file_path, ext):
+    """读取文件正文并计算签名（在元数据提取进程中运行，解析出错时直接抛出异常）
+    Returns:
+        dict: signature（无法提取足够的正文时为None）
+    """
+    signature = minhash(normalize_text(extract_text(file_path, ext)))
+    return {'signature': list(signature) if signature else None}
+
+def similarity(a, b):
+    """由两个签名估计正文的 Jaccard 相似度"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+def _band_keys(signature):
+    """每段签名的桶编号（有符号64位整数，便于存入SQLite）"""
+    data = array('Q', signature).tobytes()
+    size = ROWS * 8
+    return [int.from_bytes(hashlib.blake2b(data[i * size:(i + 1) * size], digest_size=8).digest(), 'little', signed=True)
+            for i in range(BANDS)]
+
+class FingerprintIndex:
+    """书库的文本指纹索引：以书籍文件夹为键保存签名，并按 LSH 分段建立桶索引，
+    查询时只比较至少有一段落入同一个桶的书，不需要遍历整个书库
+    """
+    def __init__(self, db_path=FINGERPRINT_DB):
+        # db_path 为 ':memory:' 时只在内存中保存（一批书处理期间的临时索引）
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    folder TEXT PRIMARY KEY,
+                    signature BLOB NOT NULL
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    folder TEXT NOT NULL,
+                    PRIMARY KEY (band, bucket, folder)
+                ) WITHOUT ROWID
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_buckets_folder ON buckets (folder)")
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def __contains__(self, folder):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM signatures WHERE folder = ?", (folder,)).fetchone() is not None
+
+    def add(self, folder, signature):
+        """保存（覆盖）一个文件夹的签名"""
+        blob = array('Q', signature).tobytes()
+        rows = [(band, bucket, folder) for band, bucket in enumerate(_band_keys(signature))]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.execute("DELETE FROM buckets WHERE folder = ?", (folder,))
+                self._db.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?)", (folder, blob))
+                self._db.executemany("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def remove(self, folder):
+        """删除一个文件夹的签名（不存在时忽略）"""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for table in ('signatures', 'buckets'):
+                    self._db.execute(f"DELETE FROM {table} WHERE folder = ?", (folder,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def move(self, old_folder, new_folder):
+        """文件夹改名后同步更新键"""
+        if old_folder == new_folder:
+            return
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for table in ('signatures', 'buckets'):
+                    self._db.execute(f"DELETE FROM {table} WHERE folder = ?", (new_folder,))
+                    self._db.execute(f"UPDATE {table} SET folder = ? WHERE folder = ?", (new_folder, old_folder))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def find_similar(self, signature, threshold=None, exclude=None):
+        """查找正文相似的书
+        Args:
+            signature: 签名
+            threshold: 最小相似度，默认使用 FINGERPRINT_CONFIG['threshold']
+            exclude: 不参与比较的文件夹（查询书库中已有的书时排除自身）
+        Returns:
+            [(文件夹, 相似度), ...]，按相似度从高到低排列
+        """
+        threshold = FINGERPRINT_CONFIG.get('threshold', 0.6) if threshold is None else threshold
+        with self._lock:
+            candidates = set()
+            for band, bucket in enumerate(_band_keys(signature)):
+                candidates.update(row[0] for row in self._db.execute(
+                    "SELECT folder FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)))
+            candidates.discard(exclude)
+            rows = [self._db.execute("SELECT folder, signature FROM signatures WHERE folder = ?", (folder,)).fetchone()
+                    for folder in candidates]
+        matches = []
+        for folder, blob in filter(None, rows):
+            score = similarity(signature, array('Q', blob))
+            if score >= threshold:
+                matches.append((folder, score))
+        print_debug(f"指纹候选 {len(candidates)} 个，相似度合格 {len(matches)} 个")
+        return sorted(matches, key=lambda match: match[1], reverse=True)
+
+    def iter_signatures(self):
+        """遍历所有签名，返回 (folder, signature)"""
+        with self._lock:
+            rows = self._db.execute("SELECT folder, signature FROM signatures ORDER BY folder").fetchall()
+        for folder, blob in rows:
+            yield folder, array('Q', blob)
+
+def get_fingerprint_index():
+    """获取全局指纹索引，首次调用时创建"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = FingerprintIndex()
+        return _index
+
+def flag_near_duplicates(filename, signature, pending=None):
+    """处理一本书之前检查书库中是否已有正文相似的书（不同的扫描版、转换版）
+    Args:
+        filename: 书籍目录中的文件名
+        signature: 这本书的签名（None时不检查）
+        pending: 同一批中已经计划或正在处理、还未进入书库的书的索引（可选），也参与比较
+    Returns:
+        [(文件夹, 相似度), ...]
+    """
+    if not signature:
+        return []
+    matches = [(folder, score, "书库中的") for folder, score in get_fingerprint_index().find_similar(signature)]
+    if pending is not None:
+        matches += [(folder, score, "本批中的") for folder, score in pending.find_similar(signature)]
+    matches.sort(key=lambda match: match[1], reverse=True)
+    for folder, score, where in matches[:3]:
+        print_warning(f"疑似重复: {filename} 与{where} {folder} 正文相似度 {score:.2f}")
+    return [(folder, score) for folder, score, _ in matches]
+
+def find_library_duplicates(threshold=None):
+    """在整个指纹索引中找出正文相似的书籍文件夹组
+    Returns:
+        list: 每组是按文件夹名排序的列表
+    """
+    index = get_fingerprint_index()
+    parent = {}
+
+    def root(folder):
+        while parent.get(folder, folder) != folder:
+            folder = parent[folder]
+        return folder
+
+    for folder, signature in index.iter_signatures():
+        for other, _ in index.find_similar(signature, threshold, exclude=folder):
+            a, b = root(folder), root(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+    groups = {}
+    for folder in parent:
+        groups.setdefault(root(folder), set()).update((folder, root(folder)))
+    result = [sorted(group) for group in groups.values()]
+    print_info(f"指纹索引共 {index.count()} 本书，发现 {len(result)} 组疑似重复")
+    return result
@@ -0,0 +1,215 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config.config import EXTRACT_CONFIG
+from src.utils.logger import print_warning, print_debug
+from src.utils.filename_parser import METADATA_FORMATS, read_file_metadata
+from src.services.fingerprint import FINGERPRINT_FORMATS, read_signature
+from src.utils import metrics
+
+# 提取失败的类型
+FAILURE_TIMEOUT = 'timeout'  # 超过时间上限，进程被结束
+FAILURE_MEMORY = 'memory'  # 超过内存上限
+FAILURE_CRASH = 'crash'  # 进程意外退出（例如被系统OOM结束）
+FAILURE_PARSE = 'parse'  # 文件无法解析
+
+# 提取任务：读取元数据，或计算正文的文本指纹
+TASK_METADATA = 'metadata'
+TASK_FINGERPRINT = 'fingerprint'
+_TASKS = {
+    TASK_METADATA: (METADATA_FORMATS, read_file_metadata),
+    TASK_FINGERPRINT: (FINGERPRINT_FORMATS, read_signature),
+}
+
+# 全局进程池实例
+_pool = None
+_pool_lock = threading.Lock()
+
+def _empty_result(error=None):
+    return {'author': None, 'title': None, 'preview': None, 'signature': None, 'error': error}
+
+def _limit_memory(memory_mb):
+    """在提取进程中限制地址空间：当前用量再加 memory_mb（不支持的平台上忽略）"""
+    try:
+        import resource
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (ImportError, OSError, ValueError):
+        return
+    limit = current + memory_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+def _worker_main(conn, memory_mb):
+    """提取进程的主循环：逐个接收 (任务, 路径, 扩展名)，返回 ('ok', 结果) 或 ('error', 类型, 说明)"""
+    _limit_memory(memory_mb)
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        task, file_path, ext = job
+        try:
+            conn.send(('ok', _TASKS[task][1](file_path, ext)))
+        except MemoryError:
+            conn.send(('error', FAILURE_MEMORY, f"超出内存上限 ({memory_mb} MB)"))
+        except Exception as e:
+            conn.send(('error', FAILURE_PARSE, f"{type(e).__name__}: {e}"))
+
+class _Worker:
+    """一个提取进程及其通信管道"""
+    def __init__(self, context, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, memory_mb),
+                                       name="metadata-extractor", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def run(self, task, file_path, ext, timeout):
+        """执行一个任务，返回 ('ok', 结果) 或 ('error', 类型, 说明)；超时或进程退出时进程不可再用"""
+        self.jobs += 1
+        try:
+            self.conn.send((task, file_path, ext))
+            if not self.conn.poll(timeout):
+                return ('error', FAILURE_TIMEOUT, f"解析超过 {timeout} 秒")
+            return self.conn.recv()
+        except (EOFError, OSError):
+            return ('error', FAILURE_CRASH, f"提取进程意外退出 (退出码 {self.process.exitcode})")
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self, force=False):
+        try:
+            if not force:
+                self.conn.send(None)
+                self.process.join(timeout=1)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1)
+        self.conn.close()
+
+class MetadataExtractorPool:
+    """元数据提取进程池
+    每个文件在独立进程中解析，有时间和内存上限；卡住或崩溃的进程会被结束并替换，
+    失败时返回带有 error 的结果，调用方退回只用文件名解析
+    """
+    def __init__(self, workers=None):
+        self.size = workers or EXTRACT_CONFIG.get('workers') or os.cpu_count() or 1
+        # forkserver 避免从多线程的主进程直接 fork
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self._context = multiprocessing.get_context(method)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._prefetched = {}
+        self._executor = None
+
+    def _checkout(self):
+        """取一个空闲进程，没有空闲进程且未达上限时新建一个"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return _Worker(self._context, EXTRACT_CONFIG.get('memory_mb', 512))
+        return self._idle.get()
+
+    def _checkin(self, worker, healthy):
+        if healthy and worker.alive and worker.jobs < EXTRACT_CONFIG.get('max_jobs', 200):
+            self._idle.put(worker)
+            return
+        # 回收进程：卡住/崩溃的直接结束，正常的按任务数轮换
+        worker.stop(force=not healthy)
+        with self._lock:
+            self._created -= 1
+
+    def extract(self, file_path, ext, task=TASK_METADATA):
+        """在提取进程中读取一个文件的元数据（或计算文本指纹）
+        Returns:
+            dict: author、title、preview（指纹任务为 signature），以及 error（成功时为None，失败时为 {'type', 'message'}）
+        """
+        if ext.lower() not in _TASKS[task][0]:
+            return _empty_result()
+        worker = self._checkout()
+        start = time.monotonic()
+        reply = worker.run(task, file_path, ext, EXTRACT_CONFIG.get('timeout', 30))
+        # 解析错误不影响进程本身；超时、崩溃和内存耗尽后的进程都要替换
+        healthy = reply[0] == 'ok' or reply[1] == FAILURE_PARSE
+        self._checkin(worker, healthy)
+        if reply[0] == 'ok':
+            print_debug(f"{'元数据提取' if task == TASK_METADATA else '指纹计算'}完成 "
+                        f"({time.monotonic() - start:.2f}秒): {os.path.basename(file_path)}")
+            return dict(_empty_result(), **reply[1])
+        failure_type, message = reply[1], reply[2]
+        metrics.count(f'extract_{failure_type}')
+        print_warning(f"元数据提取失败 [{failure_type}] {os.path.basename(file_path)}: {message}")
+        return _empty_result({'type': failure_type, 'message': message})
+
+    def prefetch(self, items, task=TASK_METADATA):
+        """在后台用全部提取进程预先解析一批文件，之后 get 时直接取结果
+        Args:
+            items: [(文件路径, 扩展名), ...]
+            task: 提取任务
+        """
+        items = [(path, ext) for path, ext in items if ext.lower() in _TASKS[task][0]]
+        if not items:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="extract")
+        for path, ext in items:
+            if (task, path) not in self._prefetched:
+                self._prefetched[(task, path)] = self._executor.submit(self.extract, path, ext, task)
+
+    def get(self, file_path, ext, task=TASK_METADATA):
+        """取预先解析的结果，没有预取时当场解析"""
+        future = self._prefetched.pop((task, file_path), None)
+        if future is not None:
+            return future.result()
+        return self.extract(file_path, ext, task)
+
+    def shutdown(self):
+        """取消未开始的预取任务并结束所有提取进程"""
+        if self._executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._prefetched.clear()
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+        with self._lock:
+            self._created = 0
+
+def get_extractor_pool():
+    """获取全局元数据提取进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MetadataExtractorPool()
+        return _pool
+
+def shutdown_extractor_pool():
+    """结束全局进程池（未创建时不做任何事）"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown()
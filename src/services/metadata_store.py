@@ -0,0 +1,72 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.config.config import CACHE_DIR
+from src.utils.book_record import BookRecord
+
+# 元数据缓存数据库：记录每个书籍文件夹对应的完整书籍信息
+METADATA_DB = os.path.join(CACHE_DIR, "metadata.db")
+
+_store = None
+_store_lock = threading.Lock()
+
+class MetadataStore:
+    """书籍元数据缓存，以书籍文件夹名（相对于书籍目录）为键"""
+    def __init__(self, db_path=METADATA_DB):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS books (
+                    folder TEXT PRIMARY KEY,
+                    douban_id TEXT,
+                    data TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_books_douban_id ON books (douban_id)")
+
+    def save(self, folder, book_info):
+        """保存（覆盖）一个文件夹的书籍信息（BookRecord 或字典）"""
+        if isinstance(book_info, BookRecord):
+            book_info = book_info.to_dict()
+        data = json.dumps(book_info, ensure_ascii=False)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO books (folder, douban_id, data, updated) VALUES (?, ?, ?, ?)",
+                (folder, book_info.get('douban_id'), data, time.time())
+            )
+
+    def get(self, folder):
+        """读取文件夹的书籍信息（BookRecord），不存在时返回None"""
+        with self._lock:
+            row = self._db.execute("SELECT data FROM books WHERE folder = ?", (folder,)).fetchone()
+        return BookRecord(json.loads(row[0])) if row else None
+
+    def move(self, old_folder, new_folder):
+        """文件夹改名后同步更新键"""
+        if old_folder == new_folder:
+            return
+        with self._lock:
+            self._db.execute("DELETE FROM books WHERE folder = ?", (new_folder,))
+            self._db.execute("UPDATE books SET folder = ?, updated = ? WHERE folder = ?",
+                             (new_folder, time.time(), old_folder))
+
+    def iter_books(self):
+        """遍历所有记录，返回 (folder, BookRecord)"""
+        with self._lock:
+            rows = self._db.execute("SELECT folder, data FROM books ORDER BY folder").fetchall()
+        for folder, data in rows:
+            yield folder, BookRecord(json.loads(data))
+
+def get_metadata_store():
+    """获取全局元数据缓存，首次调用时创建"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MetadataStore()
+        return _store
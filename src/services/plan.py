@@ -0,0 +1,249 @@
+import contextvars
+import json
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.config.config import BOOKS_DIR
+from src.utils.logger import print_info, print_error, print_warning, print_success, print_debug
+from src.utils.text_utils import sanitize_filename
+from src.utils.file_ops import atomic_write, move_file
+from src.utils.deadline import DeadlineExceeded
+from src.utils import metrics
+from src.services.file_service import build_nfo_content, download_cover
+from src.services.metadata_store import get_metadata_store
+from src.services.fingerprint import get_fingerprint_index
+from src.services.upload_queue import get_upload_queue
+
+PLAN_VERSION = 1
+
+# 操作类型
+OP_MKDIR = 'mkdir'
+OP_MOVE = 'move'
+OP_WRITE_NFO = 'write-nfo'
+OP_FETCH_COVER = 'fetch-cover'
+OP_UPLOAD = 'upload'
+
+# 操作结果
+RESULT_DONE = 'done'
+RESULT_SKIPPED = 'skipped'  # 目标状态已经满足（幂等重放）
+RESULT_FAILED = 'failed'
+RESULT_BLOCKED = 'blocked'  # 依赖的操作失败
+
+# 计入性能指标的操作类型及对应阶段
+STAGES = {OP_MOVE: 'move', OP_WRITE_NFO: 'nfo', OP_FETCH_COVER: 'cover'}
+
+def _abs(rel_path):
+    """计划中的路径都相对于书籍目录，便于在另一台机器上执行"""
+    return os.path.join(BOOKS_DIR, *rel_path.split('/'))
+
+def build_book_operations(resolution, book_id, upload=False, clean_local=False):
+    """把一本书的解析结果转换为带依赖关系的操作列表
+    Args:
+        resolution: resolve_book 的结果（filename、title、ext、folder_name、naming、douban_info）
+        book_id: 书籍在计划中的编号，用作操作ID前缀
+        upload: 是否上传到WebDAV
+        clean_local: 上传成功后是否清理本地文件
+    Returns:
+        list: 操作字典列表
+    """
+    folder = resolution['folder_name']
+    safe_title = sanitize_filename(resolution['title'])
+    douban_info = resolution['douban_info']
+    # 计划要保存为JSON，书籍信息转换为普通字典
+    book_info = douban_info.to_dict() if douban_info else None
+
+    def op(name, op_type, deps, **fields):
+        return {'id': f"{book_id}:{name}", 'book': book_id, 'type': op_type,
+                'deps': [f"{book_id}:{d}" for d in deps], **fields}
+
+    operations = [
+        op('mkdir', OP_MKDIR, [], path=folder),
+        op('move', OP_MOVE, ['mkdir'], src=resolution['filename'],
+           dst=f"{folder}/{safe_title}.{resolution['ext']}", signature=resolution.get('signature')),
+        op('nfo', OP_WRITE_NFO, ['mkdir'], path=f"{folder}/{safe_title}.nfo",
+           book_info=book_info, metadata=book_info or resolution['naming'])
+    ]
+    file_ops = ['move', 'nfo']
+    if douban_info and douban_info.get('cover_url'):
+        # 封面下载失败不影响后续上传
+        operations.append(op('cover', OP_FETCH_COVER, ['mkdir'], path=f"{folder}/{safe_title}.jpg",
+                             url=douban_info['cover_url'], douban_id=douban_info.get('douban_id'),
+                             optional=True))
+        file_ops.append('cover')
+    if upload:
+        operations.append(op('upload', OP_UPLOAD, file_ops, folder=folder, clean_local=clean_local))
+    return operations
+
+def write_plan(operations, path):
+    """把计划保存为JSON文档"""
+    plan = {
+        'version': PLAN_VERSION,
+        'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'operations': operations
+    }
+    atomic_write(path, json.dumps(plan, ensure_ascii=False, indent=2))
+    print_success(f"计划已保存: {path} ({len(operations)} 个操作)")
+
+def load_plan(path):
+    """读取计划文档
+    Returns:
+        list: 操作列表
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"不支持的计划版本: {plan.get('version')}")
+    return plan['operations']
+
+def _run_mkdir(op):
+    path = _abs(op['path'])
+    if os.path.isdir(path):
+        return RESULT_SKIPPED
+    os.makedirs(path, exist_ok=True)
+    print_info(f"创建文件夹: {path}")
+    return RESULT_DONE
+
+def _run_move(op):
+    src, dst = _abs(op['src']), _abs(op['dst'])
+    if not os.path.exists(src):
+        if os.path.exists(dst):
+            _record_signature(op)
+            return RESULT_SKIPPED
+        raise FileNotFoundError(f"源文件不存在: {src}")
+    if os.path.exists(dst):
+        raise FileExistsError(f"目标文件已存在: {dst}")
+    move_file(src, dst)
+    print_info(f"重命名文件: {src} -> {dst}")
+    _record_signature(op)
+    return RESULT_DONE
+
+def _record_signature(op):
+    # 书籍进入文件夹后把正文指纹加入索引，之后的扫描版、转换版可以与它比较
+    if op.get('signature'):
+        get_fingerprint_index().add(posixpath.dirname(op['dst']), op['signature'])
+
+def _run_write_nfo(op):
+    path = _abs(op['path'])
+    # 元数据缓存以文件夹（含分片目录）为键，重放时覆盖写入即可
+    get_metadata_store().save(posixpath.dirname(op['path']), op['metadata'])
+    content = build_nfo_content(op['book_info'])
+    if content is None:
+        return RESULT_SKIPPED
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            if f.read() == content:
+                return RESULT_SKIPPED
+    atomic_write(path, content)
+    print_info(f"NFO文件已保存: {path}")
+    return RESULT_DONE
+
+def _run_fetch_cover(op):
+    path = _abs(op['path'])
+    if os.path.exists(path):
+        return RESULT_SKIPPED
+    download_cover(op['url'], path, op.get('douban_id'))
+    if not os.path.exists(path):
+        raise RuntimeError(f"封面下载失败: {op['url']}")
+    return RESULT_DONE
+
+def _run_upload(op):
+    # 文件夹之前上传过也重新排队：可能又移入了同一本书的其他格式，远程已有的相同文件在同步模式下会被跳过
+    # （整本书已上传并清理的情况由 _completed_books 在重放时跳过）
+    get_upload_queue().enqueue(_abs(op['folder']), op['folder'], op.get('clean_local', False))
+    return RESULT_DONE
+
+HANDLERS = {
+    OP_MKDIR: _run_mkdir,
+    OP_MOVE: _run_move,
+    OP_WRITE_NFO: _run_write_nfo,
+    OP_FETCH_COVER: _run_fetch_cover,
+    OP_UPLOAD: _run_upload
+}
+
+def _completed_books(operations):
+    """源文件已经移走且上传完成的书籍（本地文件可能已被清理），重放时整本跳过"""
+    moved = {op['book'] for op in operations if op['type'] == OP_MOVE and not os.path.exists(_abs(op['src']))}
+    completed = set()
+    for op in operations:
+        if (op['type'] == OP_UPLOAD and op['book'] in moved
+                and get_upload_queue().is_done(_abs(op['folder']), op['folder'])):
+            completed.add(op['book'])
+    return completed
+
+def apply_operations(operations, workers=4):
+    """按依赖关系并行执行操作；依赖失败的操作不会执行
+    Args:
+        operations: 操作列表
+        workers: 并行线程数
+    Returns:
+        dict: 操作ID -> 结果
+    """
+    results = {}
+    ops_by_id = {op['id']: op for op in operations}
+    dependents = {op['id']: [] for op in operations}
+    waiting = {}
+    for op in operations:
+        waiting[op['id']] = len(op['deps'])
+        for dep in op['deps']:
+            dependents[dep].append(op['id'])
+
+    completed = _completed_books(operations)
+    if completed:
+        print_info(f"跳过 {len(completed)} 本已上传完成的书籍")
+        for op in operations:
+            if op['book'] in completed:
+                results[op['id']] = RESULT_SKIPPED
+
+    def block(op_id):
+        """依赖失败，递归标记后续操作"""
+        for child in dependents[op_id]:
+            if child not in results:
+                results[child] = RESULT_BLOCKED
+                block(child)
+
+    def run(op):
+        try:
+            stage = STAGES.get(op['type'])
+            if stage is None:
+                return HANDLERS[op['type']](op)
+            with metrics.timed(stage):
+                return HANDLERS[op['type']](op)
+        except (Exception, DeadlineExceeded) as e:
+            print_error(f"操作失败 [{op['id']} {op['type']}]: {e}")
+            return RESULT_FAILED
+
+    def submit(op_id):
+        # 在调用方的上下文中执行，书籍的截止时间等上下文变量随之传入工作线程
+        return executor.submit(contextvars.copy_context().run, run, ops_by_id[op_id])
+
+    ready = [op_id for op_id, count in waiting.items() if count == 0 and op_id not in results]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {submit(op_id): op_id for op_id in ready}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                op_id = running.pop(future)
+                result = future.result()
+                results[op_id] = result
+                print_debug(f"操作完成 [{op_id}]: {result}")
+                if result == RESULT_FAILED and not ops_by_id[op_id].get('optional'):
+                    block(op_id)
+                    continue
+                for child in dependents[op_id]:
+                    waiting[child] -= 1
+                    if waiting[child] == 0 and child not in results:
+                        running[submit(child)] = child
+    return results
+
+def summarize_results(results):
+    """打印执行结果统计"""
+    counts = {}
+    for result in results.values():
+        counts[result] = counts.get(result, 0) + 1
+    print_info(f"执行完成: 完成 {counts.get(RESULT_DONE, 0)}, 已满足跳过 {counts.get(RESULT_SKIPPED, 0)}, "
+               f"失败 {counts.get(RESULT_FAILED, 0)}, 因依赖失败未执行 {counts.get(RESULT_BLOCKED, 0)}")
+    if counts.get(RESULT_FAILED) or counts.get(RESULT_BLOCKED):
+        print_warning("部分操作未完成，修复问题后可以重新执行同一计划")
+    return counts
@@ -0,0 +1,145 @@
+import contextvars
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config.config import DOUBAN_CONFIG
+from src.utils.logger import print_info, print_debug, buffered_console, replay_console
+from src.utils.text_utils import to_simplified, normalize_title
+from src.services.douban import search_douban_candidates
+
+# 副标题：冒号、破折号或 " - " 之后的部分
+_SUBTITLE_RE = re.compile(r'\s*(?:[:：]|——|—|--|\s-\s).*$')
+
+# 标题末尾的分卷标记：（上）、(全3册)、第一卷、卷二、下册、套装共5册、Vol.2、末尾单独的卷号
+_VOLUME_RE = re.compile(
+    r'\s*(?:[（(【\[]\s*(?:[上中下]|全?[一二三四五六七八九十\d]+)\s*[册卷部集]?\s*[)）】\]]'
+    r'|(?:第|全)[一二三四五六七八九十百\d]+\s*[册卷部集]'
+    r'|[（(【\[]?\s*卷[一二三四五六七八九十\d]+\s*[)）】\]]?'
+    r'|[一二三四五六七八九十\d]+\s*[册卷]'
+    r'|[上中下]\s*[册卷部集]'
+    r'|[（(]?套装.*'
+    r'|vol(?:ume)?\.?\s*\d+'
+    r'|\s\d{1,2})$', re.I)
+
+# 标题中的括号内容
+_BRACKET_RE = re.compile(r'[（(【\[][^）)】\]]*[）)】\]]')
+
+def strip_subtitle(title):
+    """去掉副标题：'三体：地球往事' -> '三体'"""
+    return _SUBTITLE_RE.sub('', title).strip()
+
+def strip_volume(title):
+    """去掉末尾的分卷标记（可能有多个）：'明朝那些事儿（全7册）' -> '明朝那些事儿'"""
+    while True:
+        stripped = _VOLUME_RE.sub('', title).strip()
+        if stripped == title:
+            return title
+        title = stripped
+
+def original_form(title, filename):
+    """文件名中与（已转为简体的）标题对应的原始写法，即繁体原文；与标题相同或找不到时返回None"""
+    if not filename or not title:
+        return None
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if to_simplified(stem) == stem:
+        return None
+    size = len(title)
+    for start in range(len(stem) - size + 1):
+        chunk = stem[start:start + size]
+        if chunk != title and to_simplified(chunk) == title:
+            return chunk
+    return None
+
+def query_variants(title, author=None, filename=None):
+    """由标题生成改写后的查询，按可靠程度排序（越靠前改动越小）
+    Args:
+        title: 解析出的标题（简体）
+        author: 预期作者（可选，用于“标题 作者”查询）
+        filename: 原始文件名（可选，用于找出繁体原文）
+    Returns:
+        [(查询, 计算相似度时比较的标题), ...]，不含原标题本身
+    """
+    without_volume = strip_volume(title)
+    without_subtitle = strip_subtitle(title)
+    shortest = strip_volume(without_subtitle)
+    traditional = original_form(title, filename)
+    candidates = [
+        without_volume,
+        without_subtitle,
+        shortest,
+        _BRACKET_RE.sub(' ', title),
+    ]
+    if traditional:
+        candidates += [traditional, strip_volume(strip_subtitle(traditional))]
+
+    variants = []
+    seen = {re.sub(r'\s+', '', title)}
+    for query in candidates:
+        query = re.sub(r'\s+', ' ', query).strip()
+        key = query.replace(' ', '')
+        # 太短的查询（单字）匹配面太广，不使用
+        if key in seen or len(normalize_title(query)) < 2:
+            continue
+        seen.add(key)
+        variants.append((query, query))
+    if author:
+        # 最后用最短的标题加上作者搜索，相似度仍只按标题计算
+        base = shortest if len(normalize_title(shortest)) >= 2 else title
+        variants.append((f"{base} {author}", base))
+    return variants
+
+def merge_candidates(candidate_lists):
+    """合并多个查询的候选：按豆瓣ID去重，保留相似度最高的一条，并重新编号"""
+    merged = {}
+    for candidates in candidate_lists:
+        for book in candidates or []:
+            douban_id = book['douban_id']
+            if douban_id not in merged or book['similarity'] > merged[douban_id]['similarity']:
+                merged[douban_id] = book
+    books = sorted(merged.values(), key=lambda book: book['similarity'], reverse=True)
+    for index, book in enumerate(books):
+        book['index'] = index + 1
+    return books
+
+def _search(query, match_title, min_similarity):
+    # 各查询的输出先暂存，全部完成后按排序依次输出，避免并发的日志交错
+    with buffered_console() as lines:
+        try:
+            return search_douban_candidates(query, min_similarity, match_title), None, lines
+        except BaseException as e:
+            # 包括超出时间预算，输出暂存的日志后在调用线程中重新抛出
+            return None, e, lines
+
+def search_douban_variants(variants, min_similarity=0.6):
+    """并发执行多个豆瓣查询并合并候选
+    请求仍经过 safe_request，代理池的请求间隔和熔断同样适用，并发只是让等待重叠
+    Args:
+        variants: query_variants 的结果
+        min_similarity: 最小标题相似度
+    Returns:
+        合并去重后的候选列表
+    """
+    if not variants:
+        return []
+    print_info(f"并发尝试 {len(variants)} 个改写后的查询: {' | '.join(query for query, _ in variants)}")
+    with ThreadPoolExecutor(max_workers=len(variants), thread_name_prefix="variant") as executor:
+        # 在当前上下文中执行，书籍关联ID、截止时间等随之传递
+        futures = [executor.submit(contextvars.copy_context().run, _search, query, match_title, min_similarity)
+                   for query, match_title in variants]
+        results = [future.result() for future in futures]
+
+    candidate_lists, error = [], None
+    for candidates, exc, lines in results:
+        replay_console(lines)
+        candidate_lists.append(candidates)
+        error = error or exc
+    if error is not None:
+        raise error
+    books = merge_candidates(candidate_lists)
+    print_debug(f"改写查询共得到 {len(books)} 个不重复的候选")
+    return books
+
+def variant_limit():
+    """每本书最多尝试的改写查询数"""
+    return max(int(DOUBAN_CONFIG.get('query_variants', 4) or 0), 0)
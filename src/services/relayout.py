@@ -0,0 +1,397 @@
+import json
+import os
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config.config import BOOKS_DIR, CACHE_DIR, SUPPORTED_FORMATS, generate_folder_name
+from src.utils.logger import print_info, print_error, print_warning, print_section, print_success
+from src.utils.text_utils import sanitize_filename
+from src.utils.file_ops import atomic_write, fsync_dir
+from src.services.file_service import book_naming, build_nfo_content, parse_nfo
+from src.services.metadata_store import get_metadata_store
+from src.services.fingerprint import get_fingerprint_index
+from src.services.upload_queue import STATUS_PENDING, STATUS_RUNNING, STATUS_VERIFIED, get_upload_queue
+from src.services.webdav import list_remote_book_folders, move_remote_folder, remove_remote_dir
+from src.utils.library_layout import library_path, iter_book_folders, prune_empty_shards
+
+# 撤销日志目录
+RELAYOUT_LOG_DIR = os.path.join(CACHE_DIR, "relayout")
+
+# 除电子书外，随书籍一起改名的附属文件
+COMPANION_EXTS = ['jpg', 'nfo']
+
+# 移动书籍文件夹和删除空分片目录互斥，避免一个线程删掉另一个线程刚创建的分片目录
+_folder_lock = threading.Lock()
+
+class UndoLog:
+    """追加写入的撤销日志（JSON Lines），每条记录对应一个已完成的操作"""
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def record(self, **entry):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+def _load_book_info(folder):
+    """读取书籍文件夹的元数据：优先使用元数据缓存，其次使用文件夹中的NFO"""
+    book_info = get_metadata_store().get(folder)
+    if book_info:
+        return book_info, 'cache'
+    folder_path = os.path.join(BOOKS_DIR, folder)
+    for name in sorted(os.listdir(folder_path)):
+        if name.lower().endswith('.nfo'):
+            book_info = parse_nfo(os.path.join(folder_path, name))
+            if book_info:
+                return book_info, 'nfo'
+    return None, None
+
+def _plan_book(folder):
+    """计算单个书籍文件夹需要的改名和NFO重写操作（只读，不修改任何文件）"""
+    folder_path = os.path.join(BOOKS_DIR, folder)
+    book_info, source = _load_book_info(folder)
+    if not book_info or not book_info.get('title'):
+        return {'folder': folder, 'error': "缺少元数据（没有缓存记录或NFO）"}
+
+    naming = book_naming(book_info)
+    new_folder = library_path(generate_folder_name(naming))
+    safe_title = sanitize_filename(naming['title'])
+
+    renames = []
+    targets = {}
+    old_nfo = None
+    for name in sorted(os.listdir(folder_path)):
+        if not os.path.isfile(os.path.join(folder_path, name)):
+            continue
+        ext = os.path.splitext(name)[1].lstrip('.')
+        if ext.lower() not in SUPPORTED_FORMATS and ext.lower() not in COMPANION_EXTS:
+            continue
+        new_name = f"{safe_title}.{ext}"
+        if new_name in targets:
+            return {'folder': folder, 'error': f"文件名冲突: {targets[new_name]} 和 {name} 都会改名为 {new_name}"}
+        targets[new_name] = name
+        if ext.lower() == 'nfo':
+            old_nfo = name
+        if new_name != name:
+            renames.append((name, new_name))
+
+    nfo_name = f"{safe_title}.nfo"
+    nfo_content = build_nfo_content(book_info)
+    if nfo_content is not None and old_nfo:
+        with open(os.path.join(folder_path, old_nfo), 'r', encoding='utf-8', errors='replace') as f:
+            if f.read() == nfo_content:
+                nfo_content = None
+
+    return {
+        'folder': folder,
+        'new_folder': new_folder,
+        'renames': renames,
+        'nfo_name': nfo_name,
+        'nfo_content': nfo_content,
+        'source': source,
+        'book_info': book_info if source == 'nfo' else None
+    }
+
+def build_relayout_plan(workers=8):
+    """扫描书籍目录，为所有书籍文件夹计算完整的重新布局计划
+    Returns:
+        (changes, skipped): 需要执行的条目列表，跳过的条目列表（含原因）
+    """
+    folders = sorted(iter_book_folders())
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = list(executor.map(_plan_book, folders))
+
+    skipped = [e for e in entries if e.get('error')]
+    changes = [
+        e for e in entries
+        if not e.get('error') and (e['new_folder'] != e['folder'] or e['renames'] or e['nfo_content'] is not None)
+    ]
+    return _check_conflicts(changes, skipped)
+
+def build_reshard_plan():
+    """按当前的分片配置，为位置不对的书籍文件夹计算移动计划（不改名文件、不重写NFO）
+    Returns:
+        (changes, skipped): 与 build_relayout_plan 相同
+    """
+    changes = []
+    for folder in sorted(iter_book_folders()):
+        new_folder = library_path(folder)
+        if new_folder != folder:
+            changes.append({
+                'folder': folder,
+                'new_folder': new_folder,
+                'renames': [],
+                'nfo_name': None,
+                'nfo_content': None,
+                'source': None,
+                'book_info': None
+            })
+    return _check_conflicts(changes, [])
+
+def _check_conflicts(changes, skipped):
+    """冲突检测：多个文件夹映射到同一目标，或目标已被其他文件夹占用"""
+    by_target = {}
+    for entry in changes:
+        by_target.setdefault(entry['new_folder'], []).append(entry)
+    valid = []
+    for entry in changes:
+        sources = by_target[entry['new_folder']]
+        target_path = os.path.join(BOOKS_DIR, entry['new_folder'])
+        if len(sources) > 1:
+            entry['error'] = "多个文件夹映射到同一目标: " + ", ".join(e['folder'] for e in sources)
+        elif (entry['new_folder'] != entry['folder'] and os.path.exists(target_path)
+              and not os.path.samefile(target_path, os.path.join(BOOKS_DIR, entry['folder']))):
+            entry['error'] = f"目标文件夹已存在: {entry['new_folder']}"
+        if entry.get('error'):
+            skipped.append(entry)
+        else:
+            valid.append(entry)
+    return valid, skipped
+
+def _rename(old_path, new_path):
+    """改名或移动到其他分片目录（自动创建上级目录），兼容只改变大小写的情况"""
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    if old_path.lower() == new_path.lower() and old_path != new_path:
+        tmp_path = f"{old_path}.relayout-tmp"
+        os.rename(old_path, tmp_path)
+        os.rename(tmp_path, new_path)
+    else:
+        os.rename(old_path, new_path)
+
+def _apply_entry(entry, undo_log):
+    """执行单个书籍文件夹的改名和NFO重写，每一步完成后写入撤销日志"""
+    folder, new_folder = entry['folder'], entry['new_folder']
+    folder_path = os.path.join(BOOKS_DIR, folder)
+
+    for old_name, new_name in entry['renames']:
+        _rename(os.path.join(folder_path, old_name), os.path.join(folder_path, new_name))
+        undo_log.record(op='rename', src=os.path.join(folder, old_name), dst=os.path.join(folder, new_name))
+
+    if entry['nfo_content'] is not None:
+        nfo_path = os.path.join(folder_path, entry['nfo_name'])
+        previous = None
+        if os.path.exists(nfo_path):
+            with open(nfo_path, 'r', encoding='utf-8', errors='replace') as f:
+                previous = f.read()
+        atomic_write(nfo_path, entry['nfo_content'])
+        undo_log.record(op='nfo', path=os.path.join(folder, entry['nfo_name']), previous=previous)
+
+    store = get_metadata_store()
+    if new_folder != folder:
+        with _folder_lock:
+            _rename(folder_path, os.path.join(BOOKS_DIR, new_folder))
+            undo_log.record(op='rename', src=folder, dst=new_folder, folder=True)
+            prune_empty_shards(folder)
+        store.move(folder, new_folder)
+        get_fingerprint_index().move(folder, new_folder)
+    if entry['book_info']:
+        # 从NFO读取的元数据顺便写入缓存，下次直接使用
+        store.save(new_folder, entry['book_info'])
+
+def _move_keys(old_folder, new_folder):
+    """远程文件夹移动后更新元数据缓存和指纹索引的键（本地文件夹已经一起移动过时不重复处理）"""
+    store = get_metadata_store()
+    if store.get(old_folder):
+        store.move(old_folder, new_folder)
+    index = get_fingerprint_index()
+    if old_folder in index:
+        index.move(old_folder, new_folder)
+
+def _apply_remote_move(move, undo_log):
+    src, dst = move
+    move_remote_folder(src, dst)
+    undo_log.record(op='remote-move', src=src, dst=dst)
+    _move_keys(src, dst)
+
+def apply_relayout_plan(changes, workers=8, remote_moves=None):
+    """并行执行重新布局计划
+    Args:
+        changes: build_relayout_plan / build_reshard_plan 的结果
+        workers: 并行线程数
+        remote_moves: 需要在远程服务器上移动的文件夹 [(原路径, 新路径), ...]，在本地操作之后执行
+    Returns:
+        str: 撤销日志路径
+    """
+    log_path = os.path.join(RELAYOUT_LOG_DIR, time.strftime("undo-%Y%m%d-%H%M%S.jsonl"))
+    undo_log = UndoLog(log_path)
+    failed = remote_failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_apply_entry, entry, undo_log): entry for entry in changes}
+            for future, entry in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print_error(f"重新布局失败: {entry['folder']} ({e})")
+            futures = {executor.submit(_apply_remote_move, move, undo_log): move for move in remote_moves or []}
+            for future, (src, dst) in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    remote_failed += 1
+                    print_error(f"远程移动失败: {src} -> {dst} ({e})")
+    finally:
+        undo_log.close()
+        fsync_dir(BOOKS_DIR)
+    print_success(f"重新布局完成: 成功 {len(changes) - failed} 个, 失败 {failed} 个")
+    if remote_moves:
+        print_success(f"远程移动完成: 成功 {len(remote_moves) - remote_failed} 个, 失败 {remote_failed} 个")
+    print_info(f"撤销日志: {log_path}")
+    return log_path
+
+def undo_relayout(log_path):
+    """按撤销日志倒序恢复重新布局前的状态"""
+    with open(log_path, 'r', encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    store = get_metadata_store()
+    restored = 0
+    for entry in reversed(entries):
+        try:
+            if entry['op'] == 'rename':
+                _rename(os.path.join(BOOKS_DIR, entry['dst']), os.path.join(BOOKS_DIR, entry['src']))
+                if entry.get('folder'):
+                    prune_empty_shards(entry['dst'])
+                    store.move(entry['dst'], entry['src'])
+                    get_fingerprint_index().move(entry['dst'], entry['src'])
+            elif entry['op'] == 'remote-move':
+                move_remote_folder(entry['dst'], entry['src'])
+                _move_keys(entry['dst'], entry['src'])
+            elif entry['op'] == 'nfo':
+                path = os.path.join(BOOKS_DIR, entry['path'])
+                if entry['previous'] is None:
+                    os.remove(path)
+                else:
+                    atomic_write(path, entry['previous'])
+            restored += 1
+        except Exception as e:
+            print_error(f"撤销操作失败: {entry} ({e})")
+    print_success(f"已撤销 {restored}/{len(entries)} 个操作")
+
+def relayout(dry_run=False, workers=8):
+    """离线重新布局整个书籍库：根据缓存的元数据重新命名文件夹和文件、重写NFO，不发起任何网络请求
+    Args:
+        dry_run: 只显示计划，不执行
+        workers: 并行线程数
+    """
+    if not os.path.isdir(BOOKS_DIR):
+        print_error(f"书籍目录不存在: {BOOKS_DIR}")
+        return
+
+    start = time.monotonic()
+    changes, skipped = build_relayout_plan(workers)
+    print_section("重新布局计划")
+    for entry in changes:
+        actions = []
+        if entry['new_folder'] != entry['folder']:
+            actions.append(f"-> {entry['new_folder']}")
+        if entry['renames']:
+            actions.append(f"改名 {len(entry['renames'])} 个文件")
+        if entry['nfo_content'] is not None:
+            actions.append("重写NFO")
+        print_info(f"{entry['folder']}: {', '.join(actions)}")
+    for entry in skipped:
+        print_warning(f"跳过 {entry['folder']}: {entry['error']}")
+    print_info(f"需要处理 {len(changes)} 个文件夹，跳过 {len(skipped)} 个 (用时 {time.monotonic() - start:.1f} 秒)")
+
+    if dry_run or not changes:
+        return
+    apply_relayout_plan(changes, workers)
+    print_info(f"总用时 {time.monotonic() - start:.1f} 秒")
+
+def _remote_reshard_moves():
+    """远程书库中位置不对的书籍文件夹（不论本地是否还有这本书）
+    Returns:
+        [(原路径, 新路径), ...]，获取远程目录失败时返回None
+    """
+    folders = list_remote_book_folders()
+    if folders is None:
+        return None
+    existing = set(folders)
+    targets = {}
+    moves = []
+    for folder in folders:
+        new_folder = library_path(folder)
+        if new_folder == folder:
+            continue
+        if new_folder in existing or new_folder in targets:
+            print_warning(f"跳过远程 {folder}: 目标文件夹已存在或重复: {new_folder}")
+            continue
+        targets[new_folder] = folder
+        moves.append((folder, new_folder))
+    print_info(f"远程共 {len(folders)} 个书籍文件夹，需要移动 {len(moves)} 个")
+    return moves
+
+def _ancestors(folder):
+    parent = posixpath.dirname(folder)
+    while parent:
+        yield parent
+        parent = posixpath.dirname(parent)
+
+def _prune_remote_shards(moved_folders):
+    """删除远程已经不含任何书籍文件夹的旧分片目录"""
+    folders = list_remote_book_folders()
+    if folders is None:
+        return
+    in_use = {parent for folder in folders for parent in _ancestors(folder)} | set(folders)
+    stale = {parent for folder in moved_folders for parent in _ancestors(folder)} - in_use
+    # DELETE 会连同子目录一起删除，只需删除最上层的空目录
+    for parent in sorted(stale):
+        if any(ancestor in stale for ancestor in _ancestors(parent)):
+            continue
+        try:
+            remove_remote_dir(parent)
+        except Exception as e:
+            print_warning(f"删除远程空目录失败: {parent} ({e})")
+
+def reshard(dry_run=False, workers=8, remote=False):
+    """按当前的分片配置（layout.shard / layout.depth）原地迁移整个书库，可用 relayout --undo 撤销
+    Args:
+        dry_run: 只显示计划，不执行
+        workers: 并行线程数
+        remote: 同时在WebDAV服务器上移动书籍文件夹（使用 MOVE，不重新上传）
+    """
+    if not os.path.isdir(BOOKS_DIR):
+        print_error(f"书籍目录不存在: {BOOKS_DIR}")
+        return
+    # 上传任务记录的是本地文件夹路径，移动后找不到文件，先让队列处理完
+    counts = get_upload_queue().counts()
+    queued = sum(counts.get(status, 0) for status in (STATUS_PENDING, STATUS_RUNNING, STATUS_VERIFIED))
+    if queued:
+        print_error(f"上传队列中还有 {queued} 个未完成的任务，请先运行 drain-uploads")
+        return
+
+    start = time.monotonic()
+    changes, skipped = build_reshard_plan()
+    print_section("分片迁移计划")
+    for entry in changes:
+        print_info(f"{entry['folder']} -> {entry['new_folder']}")
+    for entry in skipped:
+        print_warning(f"跳过 {entry['folder']}: {entry['error']}")
+    print_info(f"本地需要移动 {len(changes)} 个文件夹，跳过 {len(skipped)} 个")
+
+    remote_moves = []
+    if remote:
+        remote_moves = _remote_reshard_moves()
+        if remote_moves is None:
+            print_error("无法获取远程目录，未做任何修改")
+            return
+        for src, dst in remote_moves:
+            print_info(f"远程 {src} -> {dst}")
+
+    if dry_run or not (changes or remote_moves):
+        return
+    apply_relayout_plan(changes, workers, remote_moves)
+    if remote_moves:
+        _prune_remote_shards([src for src, _ in remote_moves])
+    print_info(f"总用时 {time.monotonic() - start:.1f} 秒")
@@ -0,0 +1,145 @@
+import re
+
+from src.utils.logger import print_info, print_debug
+from src.utils.text_utils import calculate_title_similarity
+from src.utils import metrics
+from src.services.catalog import get_catalog, normalize_isbn, is_valid_isbn
+from src.utils.author_utils import AUTHOR_MATCH_THRESHOLD, author_similarity
+from src.services.douban import search_douban, select_best_match, complete_book_info
+from src.services.query_variants import query_variants, merge_candidates, search_douban_variants, variant_limit
+
+# ISBN命中时标题至少要有的相似度：ISBN可能来自文件名中碰巧符合校验位的数字，或者书目数据有误
+ISBN_MIN_TITLE_SIMILARITY = 0.3
+
+def find_isbn(text):
+    """从文件名等文本中找出校验位正确的ISBN（13位或10位）"""
+    if not text:
+        return None
+    for match in re.finditer(r'(?<!\d)(97[89][\d-]{10,14}|\d{9}[\dXx])(?![\dXx])', text):
+        isbn = normalize_isbn(match.group(1))
+        if is_valid_isbn(isbn):
+            return isbn
+    return None
+
+def _isbn_hit_plausible(book, query, expected_author, min_similarity):
+    """ISBN命中的书与文件名的标题、作者是否大致相符"""
+    if not query:
+        return True
+    if book['similarity'] < ISBN_MIN_TITLE_SIMILARITY:
+        return False
+    # 标题只是勉强相似时，还要求作者相符
+    if book['similarity'] < min_similarity and expected_author:
+        return author_similarity(expected_author, book['author']) > AUTHOR_MATCH_THRESHOLD
+    return True
+
+def search_catalog(query, expected_author=None, isbn=None, min_similarity=0.6):
+    """在本地书目中查找，候选的评分和选择规则与 search_douban 相同
+    Args:
+        query: 书名
+        expected_author: 预期的作者名（可选）
+        isbn: ISBN（可选，命中时直接使用）
+        min_similarity: 最小标题相似度
+    Returns:
+        书籍信息字典，未找到时返回None
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        return None
+
+    if isbn:
+        books = catalog.find_by_isbn(isbn)
+        if len(books) == 1:
+            book = books[0]
+            book['similarity'] = calculate_title_similarity(query, book['title']) if query else 1.0
+            book['index'] = 1
+            if _isbn_hit_plausible(book, query, expected_author, min_similarity):
+                print_info(f"本地书目ISBN命中: '{book['title']}' (ISBN: {isbn})")
+                return book
+            print_info(f"本地书目ISBN命中的 '{book['title']}' 与标题/作者不符，改按标题查找")
+
+    matched_results = catalog_candidates(query, min_similarity) if query else []
+    if not matched_results:
+        return None
+    return select_best_match(matched_results, expected_author)
+
+def catalog_candidates(query, min_similarity=0.6):
+    """本地书目中标题相似度合格的全部候选（不做选择），没有本地书目时返回空列表"""
+    catalog = get_catalog()
+    if catalog is None:
+        return []
+    candidates = catalog.find_by_title(query)
+    matched_results = []
+    for index, book in enumerate(candidates):
+        similarity = calculate_title_similarity(query, book['title'])
+        if similarity < min_similarity:
+            continue
+        book['similarity'] = similarity
+        book['index'] = index + 1
+        matched_results.append(book)
+    print_debug(f"本地书目候选 {len(candidates)} 个，相似度合格 {len(matched_results)} 个")
+    return matched_results
+
+def _author_checked(books, expected_author):
+    """改写后的查询更宽泛，有预期作者时只保留作者相符的候选"""
+    if not expected_author:
+        return books
+    kept = [book for book in books if author_similarity(expected_author, book['author']) > AUTHOR_MATCH_THRESHOLD]
+    if len(kept) < len(books):
+        print_info(f"改写查询的候选中 {len(books) - len(kept)} 个与预期作者不符，已排除")
+    return kept
+
+def resolve_variants(query, expected_author=None, filename=None):
+    """原标题查不到时，用改写后的查询（去掉副标题/分卷标记、繁体原文、标题加作者）再找一次
+    先在本地书目中逐个查询，仍未找到时并发搜索豆瓣；候选按豆瓣ID合并后再统一选择
+    Args:
+        query: 原标题
+        expected_author: 预期的作者名（可选）
+        filename: 原始文件名（可选）
+    Returns:
+        书籍信息，或None
+    """
+    variants = query_variants(query, expected_author, filename)[:variant_limit()]
+    if not variants:
+        return None
+
+    if get_catalog() is not None:
+        with metrics.timed('catalog'):
+            titles = list(dict.fromkeys(match_title for _, match_title in variants))
+            books = _author_checked(merge_candidates(catalog_candidates(title) for title in titles), expected_author)
+            book_info = select_best_match(books, expected_author) if books else None
+        if book_info:
+            metrics.count('catalog_hits')
+            metrics.count('query_variant_hits')
+            print_info(f"改写查询后使用本地书目: {book_info['title']}")
+            return book_info
+
+    books = _author_checked(search_douban_variants(variants), expected_author)
+    book_info = select_best_match(books, expected_author)
+    if not book_info:
+        return None
+    metrics.count('query_variant_hits')
+    print_info(f"改写查询后匹配: {book_info['title']}")
+    return complete_book_info(book_info)
+
+def resolve_book_info(query, expected_author=None, isbn=None, filename=None):
+    """本地优先的书籍信息查询：先查本地书目，未命中时才在线搜索豆瓣，仍未找到时尝试改写后的查询
+    Args:
+        query: 书名
+        expected_author: 预期的作者名（可选）
+        isbn: ISBN（可选）
+        filename: 原始文件名（可选，用于生成繁体原文的查询）
+    Returns:
+        与 search_douban 相同结构的书籍信息字典，或None
+    """
+    with metrics.timed('catalog'):
+        book_info = search_catalog(query, expected_author, isbn)
+    if book_info:
+        metrics.count('catalog_hits')
+        print_info(f"使用本地书目: {book_info['title']}")
+        return book_info
+    if get_catalog() is not None:
+        metrics.count('catalog_misses')
+    book_info = search_douban(query, expected_author=expected_author)
+    if book_info or not query:
+        return book_info
+    return resolve_variants(query, expected_author, filename)
@@ -0,0 +1,280 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from src.config.config import WEBDAV_CONFIG, CACHE_DIR
+from src.utils.logger import print_info, print_error, print_warning, print_success, print_debug
+from src.utils import tracing
+from src.services.webdav import get_uploader, verify_remote_folder, clean_local_folder
+
+# 上传队列数据库
+QUEUE_DB = os.path.join(CACHE_DIR, "upload_queue.db")
+
+# 任务状态
+STATUS_PENDING = 'pending'    # 等待上传（包括退避等待中）
+STATUS_RUNNING = 'running'    # 正在上传
+STATUS_VERIFIED = 'verified'  # 已上传并校验，等待清理本地文件
+STATUS_DONE = 'done'          # 已完成
+STATUS_FAILED = 'failed'      # 超过最大尝试次数
+
+# 全局队列实例
+_queue = None
+_queue_lock = threading.Lock()
+
+class UploadQueue:
+    """持久化的WebDAV上传队列
+    - 任务保存在SQLite中，程序重启后继续处理
+    - 后台线程消费任务，失败后按指数退避重试
+    - 只有在远程校验通过后才会删除本地文件
+    """
+    def __init__(self, db_path=QUEUE_DB, workers=None):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.workers = workers or WEBDAV_CONFIG.get('queue_workers', 2)
+        self.max_attempts = WEBDAV_CONFIG.get('queue_max_attempts', 8)
+        self.backoff = WEBDAV_CONFIG.get('queue_backoff', [5, 600])
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._threads = []
+        self._stopping = False
+        self._running = 0
+        self._init_db()
+
+    def _init_db(self):
+        with self._lock:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    local_folder TEXT NOT NULL,
+                    folder_name TEXT NOT NULL,
+                    clean_local INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_attempt)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_folder ON jobs (local_folder, status)")
+            # 上次运行中断时正在上传的任务重新排队
+            self._db.execute("UPDATE jobs SET status = ? WHERE status = ?", (STATUS_PENDING, STATUS_RUNNING))
+
+    def enqueue(self, local_folder, folder_name, clean_local=False):
+        """加入上传任务，同一本地文件夹的未完成任务会被合并
+        该文件夹正在上传时另建一个等待中的任务，等正在进行的任务结束后再重新上传（见 _claim）
+        Args:
+            local_folder: 本地文件夹路径
+            folder_name: 远程文件夹名称
+            clean_local: 上传校验成功后是否删除本地文件
+        Returns:
+            int: 任务ID
+        """
+        now = time.time()
+        with self._cond:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE local_folder = ? AND status IN (?, ?)",
+                (local_folder, STATUS_PENDING, STATUS_FAILED)
+            ).fetchone()
+            if row:
+                job_id = row[0]
+                self._db.execute(
+                    "UPDATE jobs SET folder_name = ?, clean_local = ?, status = ?, attempts = 0, "
+                    "next_attempt = 0, updated = ? WHERE id = ?",
+                    (folder_name, int(clean_local), STATUS_PENDING, now, job_id)
+                )
+            else:
+                job_id = self._db.execute(
+                    "INSERT INTO jobs (local_folder, folder_name, clean_local, status, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (local_folder, folder_name, int(clean_local), STATUS_PENDING, now, now)
+                ).lastrowid
+            self._cond.notify()
+        print_info(f"已加入上传队列: {folder_name}")
+        return job_id
+
+    def retry_failed(self):
+        """把失败的任务重新放回队列
+        Returns:
+            int: 重新排队的任务数
+        """
+        with self._cond:
+            count = self._db.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, next_attempt = 0, updated = ? WHERE status = ?",
+                (STATUS_PENDING, time.time(), STATUS_FAILED)
+            ).rowcount
+            self._cond.notify_all()
+        return count
+
+    def is_done(self, local_folder, folder_name):
+        """该文件夹是否已经上传完成"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM jobs WHERE local_folder = ? AND folder_name = ? AND status = ? LIMIT 1",
+                (local_folder, folder_name, STATUS_DONE)
+            ).fetchone()
+        return row is not None
+
+    def counts(self):
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+    def _claim(self):
+        """取出一个到期的任务（调用方持有锁）
+        同一本地文件夹已有任务在运行时跳过，避免两个线程同时上传、清理同一个文件夹
+        """
+        row = self._db.execute(
+            "SELECT id, local_folder, folder_name, clean_local, status, attempts FROM jobs "
+            "WHERE ((status = ? AND next_attempt <= ?) OR status = ?) AND NOT EXISTS ("
+            "SELECT 1 FROM jobs AS active WHERE active.local_folder = jobs.local_folder AND active.status = ?) "
+            "ORDER BY id LIMIT 1",
+            (STATUS_PENDING, time.time(), STATUS_VERIFIED, STATUS_RUNNING)
+        ).fetchone()
+        if not row:
+            return None
+        job = dict(zip(('id', 'local_folder', 'folder_name', 'clean_local', 'status', 'attempts'), row))
+        # 标记为运行中防止重复领取；job['status'] 保留原状态，已校验的任务只剩清理步骤
+        self._db.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                         (STATUS_RUNNING, time.time(), job['id']))
+        return job
+
+    def _next_due_in(self):
+        """距离最近一个退避任务到期的秒数（调用方持有锁）"""
+        row = self._db.execute(
+            "SELECT MIN(next_attempt) FROM jobs WHERE status = ?", (STATUS_PENDING,)
+        ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def _set_status(self, job_id, status, **fields):
+        fields['status'] = status
+        fields['updated'] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._cond:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._cond.notify_all()
+
+    def _process(self, job):
+        """执行一个任务：上传 -> 校验 -> 清理"""
+        local_folder, folder_name = job['local_folder'], job['folder_name']
+
+        if job['status'] == STATUS_PENDING:
+            if not os.path.isdir(local_folder):
+                self._set_status(job['id'], STATUS_FAILED, last_error="本地文件夹不存在")
+                print_error(f"上传任务失败，本地文件夹不存在: {local_folder}")
+                return
+            try:
+                with tracing.span("上传文件夹", cat='upload', folder=folder_name) as upload_span:
+                    uploaded = get_uploader().upload_folder(local_folder, folder_name)
+                    if uploaded and not verify_remote_folder(local_folder, folder_name):
+                        uploaded = False
+                    upload_span.args['uploaded'] = uploaded
+                error = None if uploaded else "上传或校验失败"
+            except Exception as e:
+                uploaded, error = False, str(e)
+
+            if not uploaded:
+                self._retry_later(job, error)
+                return
+            self._set_status(job['id'], STATUS_VERIFIED, last_error=None)
+            print_success(f"上传并校验成功: {folder_name}")
+
+        # 只有在校验通过后才清理本地文件
+        if job['clean_local'] and os.path.isdir(local_folder):
+            print_info("根据用户偏好，清理本地文件")
+            clean_local_folder(local_folder)
+        self._set_status(job['id'], STATUS_DONE)
+
+    def _retry_later(self, job, error):
+        """按指数退避安排重试，超过最大次数则标记失败"""
+        attempts = job['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self._set_status(job['id'], STATUS_FAILED, attempts=attempts, last_error=error)
+            print_error(f"上传失败次数过多，已放弃: {job['folder_name']} ({error})，保留本地文件")
+            return
+        base, limit = self.backoff
+        delay = min(base * 2 ** (attempts - 1), limit) * random.uniform(0.8, 1.2)
+        self._set_status(job['id'], STATUS_PENDING, attempts=attempts,
+                         next_attempt=time.time() + delay, last_error=error)
+        print_warning(f"上传失败，{delay:.0f}秒后第 {attempts + 1} 次尝试: {job['folder_name']} ({error})")
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._stopping:
+                    job = self._claim()
+                    if job:
+                        self._running += 1
+                        break
+                    due_in = self._next_due_in()
+                    self._cond.wait(timeout=min(due_in, 5.0) if due_in is not None else 5.0)
+                if job is None:
+                    return
+            try:
+                self._process(job)
+            except Exception as e:
+                print_error(f"处理上传任务时出错: {e}")
+                self._retry_later(job, str(e))
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def start(self):
+        """启动后台工作线程"""
+        if self._threads:
+            return
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"upload-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print_debug(f"上传队列已启动: {self.workers} 个工作线程")
+
+    def _has_work(self, include_backoff):
+        """是否还有未完成的任务（调用方持有锁）"""
+        if self._running:
+            return True
+        if include_backoff:
+            sql = "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)"
+            params = (STATUS_PENDING, STATUS_VERIFIED)
+        else:
+            sql = "SELECT COUNT(*) FROM jobs WHERE (status = ? AND next_attempt <= ?) OR status = ?"
+            params = (STATUS_PENDING, time.time(), STATUS_VERIFIED)
+        return self._db.execute(sql, params).fetchone()[0] > 0
+
+    def wait_idle(self):
+        """等待所有已到期的任务处理完（退避中的任务留到以后）"""
+        with self._cond:
+            while self._has_work(include_backoff=False):
+                self._cond.wait(timeout=1.0)
+
+    def drain(self):
+        """等待队列中所有任务完成或失败（包括退避中的任务）"""
+        with self._cond:
+            while self._has_work(include_backoff=True):
+                self._cond.wait(timeout=1.0)
+
+    def stop(self):
+        """停止工作线程（正在处理的任务会先完成）"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+def get_upload_queue():
+    """获取全局上传队列，首次调用时创建"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = UploadQueue()
+        return _queue
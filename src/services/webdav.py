@@ -1,24 +1,49 @@
+import contextvars
+import json
 import os
-from webdav3.client import Client
-from src.config.config import WEBDAV_CONFIG
-from src.utils.logger import print_info, print_error, print_debug
+import posixpath
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
 
-def init_webdav_client():
-    """初始化WebDAV客户端
-    Returns:
-        Client对象或None
-    """
+from webdav3.client import Client, WebDavXmlUtils
+from webdav3.exceptions import MethodNotSupported, ResponseErrorCode
+from webdav3.urn import Urn
+from src.config.config import WEBDAV_CONFIG, CACHE_DIR
+from src.utils.logger import print_info, print_error, print_debug, print_warning, print_section
+from src.utils.deadline import DeadlineExceeded, current_deadline
+from src.utils import metrics, tracing
+
+# 远程目录树缓存文件
+REMOTE_INDEX_FILE = os.path.join(CACHE_DIR, "webdav_index.json")
 
-        
-    options = {
+# 每个上传线程持有一个长期复用的客户端（内部的requests.Session保持连接池）
+_thread_local = threading.local()
+
+# 同时计入全局性能指标的统计项
+_METRIC_NAMES = {'files_uploaded': 'upload_files', 'bytes_uploaded': 'upload_bytes', 'files_skipped': 'upload_skipped_files'}
+
+# 全局上传器实例
+_uploader = None
+_uploader_lock = threading.Lock()
+
+def _client_options():
+    """根据当前配置生成WebDAV客户端参数"""
+    return {
         'webdav_hostname': WEBDAV_CONFIG['hostname'],
         'webdav_login': WEBDAV_CONFIG['username'],
         'webdav_password': WEBDAV_CONFIG['password'],
         'disable_check': True
     }
-    
+
+def init_webdav_client():
+    """初始化WebDAV客户端
+    Returns:
+        Client对象或None
+    """
     try:
-        client = Client(options)
+        client = Client(_client_options())
         # 测试连接
         client.check()
         print_info("WebDAV连接测试成功")
@@ -27,6 +52,418 @@ def init_webdav_client():
         print_error(f"WebDAV连接失败: {e}")
         return None
 
+def get_thread_client():
+    """获取当前线程复用的WebDAV客户端，首次调用时创建
+    Returns:
+        Client对象
+    """
+    client = getattr(_thread_local, 'client', None)
+    if client is None:
+        client = Client(_client_options())
+        _thread_local.client = client
+        print_debug(f"创建WebDAV客户端: {threading.current_thread().name}")
+    return client
+
+def build_remote_path(*parts):
+    """拼接远程路径（始终使用 / 分隔）"""
+    return os.path.join(WEBDAV_CONFIG['root_path'], *parts).replace('\\', '/')
+
+def _is_below_root(remote_path):
+    """远程路径是否在 root_path 之下（不含 root_path 本身）"""
+    root = _normalize_remote_path(WEBDAV_CONFIG['root_path'])
+    path = _normalize_remote_path(remote_path)
+    return path != root and path.startswith(root.rstrip('/') + '/')
+
+def _execute(client, action, remote_path, data=None, directory=False):
+    """执行WebDAV请求并读完响应体，使连接能回到连接池"""
+    urn = Urn(remote_path, directory=directory)
+    response = client.execute_request(action=action, path=urn.quote(), data=data)
+    # 读取响应体以释放连接
+    _ = response.content
+    return response
+
+def _normalize_remote_path(path):
+    """去掉服务器地址中的路径前缀和末尾的 /，得到与 build_remote_path 一致的路径"""
+    prefix = urlsplit(WEBDAV_CONFIG['hostname']).path.rstrip('/')
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    return path.rstrip('/') or '/'
+
+def _parse_modified(value):
+    """把 getlastmodified 转换为时间戳"""
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+def propfind(client, remote_path, depth='1'):
+    """对远程路径执行一次 PROPFIND
+    Args:
+        client: WebDAV客户端
+        remote_path: 远程目录
+        depth: '1' 或 'infinity'
+    Returns:
+        list: 每项包含 path、isdir、size、etag、modified
+    """
+    urn = Urn(remote_path, directory=True)
+    response = client.execute_request(action='list', path=urn.quote(), headers_ext=[f"Depth: {depth}"])
+    entries = []
+    for info in WebDavXmlUtils.parse_get_list_info_response(response.content):
+        entries.append({
+            'path': _normalize_remote_path(info['path']),
+            'isdir': info['isdir'],
+            'size': int(info['size']) if info.get('size') else None,
+            'etag': info.get('etag'),
+            'modified': _parse_modified(info.get('modified'))
+        })
+    return entries
+
+class RemoteIndex:
+    """远程目录树的本地缓存，用于增量同步
+    - 每次运行只对 root_path 做一次 PROPFIND（服务器不支持 Depth: infinity 时逐层列出）
+    - 记录本工具上传过的文件及其本地签名，下次运行时结合 ETag 判断是否需要重新上传
+    """
+    def __init__(self, cache_file=REMOTE_INDEX_FILE):
+        self.cache_file = cache_file
+        self.entries = {}
+        self.uploaded = {}
+        self.propfind_requests = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _cache_key(self):
+        return f"{WEBDAV_CONFIG['hostname']}|{WEBDAV_CONFIG['root_path']}"
+
+    def _load(self):
+        """读取本地缓存（服务器或根目录变化时忽略）"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('key') == self._cache_key():
+                self.entries = data.get('entries', {})
+                self.uploaded = data.get('uploaded', {})
+        except Exception as e:
+            print_warning(f"读取远程索引缓存失败: {e}")
+
+    def save(self):
+        """保存到本地缓存文件"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with self._lock:
+                data = {'key': self._cache_key(), 'entries': self.entries, 'uploaded': self.uploaded}
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+        except Exception as e:
+            print_warning(f"保存远程索引缓存失败: {e}")
+
+    def refresh(self, client):
+        """拉取远程目录树
+        Returns:
+            bool: 是否成功
+        """
+        root = WEBDAV_CONFIG['root_path']
+        try:
+            try:
+                self.propfind_requests += 1
+                listing = propfind(client, root, depth='infinity')
+            except ResponseErrorCode:
+                # 很多服务器禁用了 Depth: infinity，退回逐层列出
+                print_debug("服务器不支持 Depth: infinity，逐层获取远程目录")
+                listing, queue = [], [root]
+                while queue:
+                    current = _normalize_remote_path(queue.pop())
+                    self.propfind_requests += 1
+                    for entry in propfind(client, current):
+                        if entry['path'] == current:
+                            continue
+                        listing.append(entry)
+                        if entry['isdir']:
+                            queue.append(entry['path'])
+        except Exception as e:
+            print_warning(f"获取远程目录失败，将上传全部文件: {e}")
+            with self._lock:
+                self.entries = {}
+            return False
+
+        entries = {entry['path']: entry for entry in listing}
+        with self._lock:
+            self.entries = entries
+            # 补全上次上传时还不知道的 ETag
+            for path, record in self.uploaded.items():
+                if path in entries and not record.get('etag'):
+                    record['etag'] = entries[path]['etag']
+        print_info(f"远程索引已更新: {len(entries)} 个条目")
+        return True
+
+    def has_dir(self, remote_folder):
+        entry = self.entries.get(_normalize_remote_path(remote_folder))
+        return bool(entry and entry['isdir'])
+
+    def is_identical(self, local_file, remote_file):
+        """判断远程文件是否与本地文件相同（大小 + ETag/修改时间）"""
+        remote_file = _normalize_remote_path(remote_file)
+        with self._lock:
+            remote = self.entries.get(remote_file)
+            record = self.uploaded.get(remote_file)
+        if not remote or remote['isdir']:
+            return False
+        stat = os.stat(local_file)
+        if remote['size'] != stat.st_size:
+            return False
+        # 本工具上传过且本地文件、远程ETag都未变化
+        if (record and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns
+                and (not record.get('etag') or record['etag'] == remote['etag'])):
+            return True
+        # 远程文件比本地文件新且大小一致
+        return remote['modified'] is not None and remote['modified'] >= stat.st_mtime
+
+    def record_upload(self, local_file, remote_file):
+        """记录一次成功的上传"""
+        remote_file = _normalize_remote_path(remote_file)
+        stat = os.stat(local_file)
+        with self._lock:
+            self.uploaded[remote_file] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'etag': None}
+            self.entries[remote_file] = {
+                'path': remote_file, 'isdir': False, 'size': stat.st_size, 'etag': None, 'modified': None
+            }
+
+    def record_dir(self, remote_folder):
+        remote_folder = _normalize_remote_path(remote_folder)
+        with self._lock:
+            self.entries.setdefault(remote_folder, {
+                'path': remote_folder, 'isdir': True, 'size': None, 'etag': None, 'modified': None
+            })
+
+class WebDAVUploader:
+    """长期存在的WebDAV上传器
+    - 线程池并发上传文件，不同书籍文件夹之间也可以并行
+    - 每个工作线程复用自己的客户端连接
+    - 缓存已创建的远程目录，避免重复 MKCOL
+    - 同步模式下跳过远程已存在的相同文件
+    """
+    def __init__(self, max_workers=None, sync_mode=None):
+        self.max_workers = max_workers or WEBDAV_CONFIG.get('upload_workers', 4)
+        self.sync_mode = WEBDAV_CONFIG.get('sync_mode', False) if sync_mode is None else sync_mode
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webdav')
+        self._known_dirs = set()
+        self._dirs_lock = threading.Lock()
+        self._index = None
+        self._index_lock = threading.Lock()
+        self.stats = {
+            'files_uploaded': 0, 'bytes_uploaded': 0,
+            'files_skipped': 0, 'bytes_skipped': 0,
+            'requests_saved': 0
+        }
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+        for key, value in deltas.items():
+            if key in _METRIC_NAMES:
+                metrics.count(_METRIC_NAMES[key], value)
+
+    @property
+    def index(self):
+        """同步模式下的远程索引，首次访问时拉取一次"""
+        if not self.sync_mode:
+            return None
+        with self._index_lock:
+            if self._index is None:
+                self._index = RemoteIndex()
+                self._index.refresh(get_thread_client())
+            return self._index
+
+    def ensure_remote_dir(self, remote_folder):
+        """确保远程目录存在，结果会被缓存
+        分片布局下书籍文件夹在根目录的子目录中，MKCOL 要求上级目录已存在，先逐级创建
+        """
+        with self._dirs_lock:
+            if remote_folder in self._known_dirs:
+                return
+        parent = posixpath.dirname(remote_folder.rstrip('/'))
+        if _is_below_root(parent):
+            self.ensure_remote_dir(parent)
+        index = self.index
+        if index and index.has_dir(remote_folder):
+            self._count(requests_saved=1)
+        else:
+            try:
+                _execute(get_thread_client(), 'mkdir', remote_folder, directory=True)
+                print_debug(f"创建远程目录: {remote_folder}")
+            except MethodNotSupported:
+                # 目录已存在时服务器返回405
+                pass
+            if index:
+                index.record_dir(remote_folder)
+        with self._dirs_lock:
+            self._known_dirs.add(remote_folder)
+
+    def _upload_file(self, source, remote_file):
+        """在工作线程中上传单个文件
+        Args:
+            source: 本地文件路径，或内存中的bytes
+            remote_file: 远程文件路径
+        """
+        if isinstance(source, bytes):
+            print_info(f"上传文件: {os.path.basename(remote_file)}")
+            with metrics.timed('upload'):
+                _execute(get_thread_client(), 'upload', remote_file, data=source)
+            self._count(files_uploaded=1, bytes_uploaded=len(source))
+            return
+
+        size = os.path.getsize(source)
+        index = self.index
+        if index and index.is_identical(source, remote_file):
+            print_debug(f"远程文件相同，跳过: {os.path.basename(remote_file)}")
+            self._count(files_skipped=1, bytes_skipped=size, requests_saved=1)
+            return
+        print_info(f"上传文件: {os.path.basename(remote_file)}")
+        # 以文件对象作为请求体，直接从磁盘流式上传
+        with open(source, 'rb') as f, metrics.timed('upload'):
+            _execute(get_thread_client(), 'upload', remote_file, data=f)
+        self._count(files_uploaded=1, bytes_uploaded=size)
+        if index:
+            index.record_upload(source, remote_file)
+
+    def _submit_files(self, folder_name, items, verify=False):
+        """并行上传一组文件，所有文件完成后设置结果
+        Args:
+            folder_name: 远程文件夹名称
+            items: [(本地路径或bytes, 远程文件名), ...]
+            verify: 上传完成后是否校验远程文件大小
+        Returns:
+            Future: 结果为是否全部上传成功
+        """
+        result = Future()
+        try:
+            remote_folder = build_remote_path(folder_name)
+            print_info(f"开始上传到WebDAV: {remote_folder}")
+            self.ensure_remote_dir(remote_folder)
+        except Exception as e:
+            print_error(f"上传到WebDAV失败: {e}")
+            result.set_result(False)
+            return result
+
+        if not items:
+            result.set_result(True)
+            return result
+
+        pending = [len(items)]
+        errors = []
+        lock = threading.Lock()
+
+        def on_file_done(fut):
+            exc = fut.exception()
+            with lock:
+                if exc:
+                    errors.append(exc)
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if not finished:
+                return
+            if errors:
+                print_error(f"上传到WebDAV失败: {errors[0]}")
+                result.set_result(False)
+                return
+            if verify:
+                expected = {
+                    name: len(source) if isinstance(source, bytes) else os.path.getsize(source)
+                    for source, name in items
+                }
+                if not verify_remote_files(folder_name, expected):
+                    result.set_result(False)
+                    return
+            print_info(f"文件夹上传完成: {folder_name}")
+            result.set_result(True)
+
+        for source, name in items:
+            remote_file = f"{remote_folder}/{name}"
+            # 在调用方的上下文中执行，日志保留书籍关联ID
+            self._executor.submit(contextvars.copy_context().run, self._upload_file, source, remote_file).add_done_callback(on_file_done)
+        return result
+
+    def submit_folder(self, local_folder, folder_name):
+        """异步上传文件夹中的所有文件
+        Args:
+            local_folder: 本地文件夹路径
+            folder_name: 远程文件夹名称
+        Returns:
+            Future: 结果为是否全部上传成功
+        """
+        try:
+            items = [
+                (os.path.join(local_folder, f), f) for f in os.listdir(local_folder)
+                if os.path.isfile(os.path.join(local_folder, f))
+            ]
+        except Exception as e:
+            print_error(f"上传到WebDAV失败: {e}")
+            result = Future()
+            result.set_result(False)
+            return result
+        return self._submit_files(folder_name, items)
+
+    def submit_stream(self, folder_name, source_path, file_name, extra_files=None):
+        """远程直传：源文件直接从原位置流式上传，附属文件从内存上传，不经过本地书籍文件夹
+        Args:
+            folder_name: 远程文件夹名称
+            source_path: 源电子书文件路径
+            file_name: 远程电子书文件名
+            extra_files: {文件名: bytes}，如NFO和封面
+        Returns:
+            Future: 结果为是否全部上传并校验成功
+        """
+        items = [(source_path, file_name)]
+        items += [(data, name) for name, data in (extra_files or {}).items()]
+        return self._submit_files(folder_name, items, verify=True)
+
+    def upload_folder(self, local_folder, folder_name):
+        """同步上传文件夹（文件之间仍然并行）
+        Returns:
+            bool: 是否上传成功
+        """
+        return self.submit_folder(local_folder, folder_name).result()
+
+    def report(self):
+        """打印本次运行的上传统计"""
+        stats = self.stats
+        if not any(stats.values()):
+            return
+        print_section("WebDAV上传统计")
+        print_info(f"上传文件: {stats['files_uploaded']} 个, {stats['bytes_uploaded'] / 1024 / 1024:.2f} MB")
+        if self.sync_mode:
+            propfinds = self._index.propfind_requests if self._index else 0
+            print_info(f"跳过相同文件: {stats['files_skipped']} 个, {stats['bytes_skipped'] / 1024 / 1024:.2f} MB")
+            print_info(f"节省请求: {stats['requests_saved']} 次 (远程索引 PROPFIND: {propfinds} 次)")
+
+    def shutdown(self, wait=True):
+        """等待所有上传完成并关闭线程池"""
+        self._executor.shutdown(wait=wait)
+        if self._index:
+            self._index.save()
+        self.report()
+
+def get_uploader():
+    """获取全局上传器，首次调用时创建"""
+    global _uploader
+    with _uploader_lock:
+        if _uploader is None:
+            _uploader = WebDAVUploader()
+        return _uploader
+
+def shutdown_uploader():
+    """等待全局上传器中的任务完成并释放"""
+    global _uploader
+    with _uploader_lock:
+        uploader, _uploader = _uploader, None
+    if uploader:
+        uploader.shutdown()
+
 def upload_to_webdav(local_folder, folder_name):
     """上传文件夹到WebDAV服务器
     Args:
@@ -34,39 +471,60 @@ def upload_to_webdav(local_folder, folder_name):
         folder_name: 文件夹名称
     Returns:
         bool: 是否上传成功
+    Raises:
+        DeadlineExceeded: 当前书籍的时间预算在上传完成前用完（已提交的文件会在后台继续上传）
     """
+    future = get_uploader().submit_folder(local_folder, folder_name)
+    deadline = current_deadline()
+    with tracing.span("等待上传完成", cat='wait', folder=folder_name):
+        if not deadline:
+            return future.result()
+        try:
+            return future.result(timeout=deadline.cap(None))
+        except FutureTimeout:
+            raise DeadlineExceeded(f"上传超出时间预算: {folder_name}")
 
-        
-    client = init_webdav_client()
-    if not client:
-        return False
-        
+def verify_remote_files(folder_name, expected):
+    """校验远程文件夹中的文件存在且大小一致
+    Args:
+        folder_name: 远程文件夹名称
+        expected: {文件名: 字节数}
+    Returns:
+        bool: 是否一致
+    """
+    remote_folder = build_remote_path(folder_name)
     try:
-        # 构建远程路径
-        remote_folder = os.path.join(WEBDAV_CONFIG['root_path'], folder_name).replace('\\', '/')
-        
-        print_info(f"开始上传到WebDAV: {remote_folder}")
-        
-        # 确保远程目录存在
-        if not client.check(remote_folder):
-            client.mkdir(remote_folder)
-        
-        # 上传文件夹中的所有文件
-        for file in os.listdir(local_folder):
-            local_file = os.path.join(local_folder, file)
-            remote_file = f"{remote_folder}/{file}"
-            
-            if os.path.isfile(local_file):
-                print_info(f"上传文件: {file}")
-                client.upload_file(remote_file, local_file)
-        
-        print_info(f"文件夹上传完成: {folder_name}")
-        return True
-        
+        remote_sizes = {
+            entry['path']: entry['size']
+            for entry in propfind(get_thread_client(), remote_folder)
+            if not entry['isdir']
+        }
     except Exception as e:
-        print_error(f"上传到WebDAV失败: {e}")
+        print_error(f"校验远程文件夹失败: {e}")
         return False
 
+    for name, size in expected.items():
+        remote_file = _normalize_remote_path(f"{remote_folder}/{name}")
+        if remote_sizes.get(remote_file) != size:
+            print_warning(f"远程文件缺失或大小不一致: {remote_file}")
+            return False
+    return True
+
+def verify_remote_folder(local_folder, folder_name):
+    """校验远程文件夹中的文件与本地文件夹一致（存在且大小相同）
+    Args:
+        local_folder: 本地文件夹路径
+        folder_name: 远程文件夹名称
+    Returns:
+        bool: 是否一致
+    """
+    expected = {
+        file: os.path.getsize(os.path.join(local_folder, file))
+        for file in os.listdir(local_folder)
+        if os.path.isfile(os.path.join(local_folder, file))
+    }
+    return verify_remote_files(folder_name, expected)
+
 def clean_local_folder(folder_path):
     """清理本地文件夹
     Args:
@@ -81,4 +539,43 @@ def clean_local_folder(folder_path):
         os.rmdir(folder_path)
         print_info(f"清理本地文件夹: {folder_path}")
     except Exception as e:
-        print_error(f"清理本地文件夹失败: {e}") 
\ No newline at end of file
+        print_error(f"清理本地文件夹失败: {e}")
+
+def list_remote_book_folders():
+    """列出远程根目录下的所有书籍文件夹（直接包含文件的目录），返回相对于根目录的路径
+    Returns:
+        list，获取远程目录失败时返回None
+    """
+    index = RemoteIndex()
+    if not index.refresh(get_thread_client()):
+        return None
+    root = _normalize_remote_path(WEBDAV_CONFIG['root_path']).rstrip('/') + '/'
+    folders = set()
+    for path, entry in index.entries.items():
+        if entry['isdir'] or not path.startswith(root):
+            continue
+        folder = posixpath.dirname(path[len(root):])
+        if folder:
+            folders.add(folder)
+    return sorted(folders)
+
+def move_remote_folder(src_folder, dst_folder):
+    """在远程服务器上移动书籍文件夹（MOVE，不重新上传），目标已存在时失败
+    Args:
+        src_folder: 相对于根目录的原路径
+        dst_folder: 相对于根目录的新路径
+    """
+    parent = posixpath.dirname(dst_folder)
+    if parent:
+        get_uploader().ensure_remote_dir(build_remote_path(parent))
+    get_thread_client().move(remote_path_from=build_remote_path(src_folder),
+                             remote_path_to=build_remote_path(dst_folder))
+    print_info(f"远程移动: {src_folder} -> {dst_folder}")
+
+def remove_remote_dir(folder):
+    """删除远程目录（调用方需确认其中已经没有文件）
+    Args:
+        folder: 相对于根目录的路径
+    """
+    get_thread_client().clean(build_remote_path(folder))
+    print_debug(f"删除远程空目录: {folder}")
@@ -0,0 +1,223 @@
+import difflib
+import json
+import os
+import re
+import threading
+from functools import lru_cache
+
+from src.config.config import CACHE_DIR
+from src.utils.logger import print_info, print_warning, print_debug
+from src.utils.file_ops import atomic_write
+from src.utils.text_utils import to_simplified
+
+# 作者别名表：{规范作者名: [别名, ...]}，可以手工编辑（例如补充笔名）
+ALIASES_FILE = os.path.join(CACHE_DIR, "author_aliases.json")
+# 待确认的别名：写法差异大、又没有经过用户确认的别名先放在这里，用 aliases 命令审核
+PENDING_ALIASES_FILE = os.path.join(CACHE_DIR, "author_aliases_pending.json")
+
+# 国籍/朝代标记：[美]、（英）、【清】、〔法〕 等
+MARKER_RE = re.compile(r'[\[（\(【〔][^\]）\)】〕]*[\]）\)】〕]')
+# 括号内的原文名：刘慈欣 (Liu Cixin)
+_PAREN_NAME_RE = re.compile(r'\s*\([^)]*\)')
+# 中文名后面的英文原名：阿加莎·克里斯蒂 Agatha Christie
+_TRAILING_LATIN_RE = re.compile(r'(?<=[\u4e00-\u9fff])\s*[A-Za-z\s.]+(?:\s+[A-Za-z\s.]+)*$')
+# 比较作者时忽略的字符：空白和各种间隔号
+_KEY_IGNORED_RE = re.compile(r'[\s.·•・‧・,，]')
+
+# 作者相似度超过此值视为同一作者
+AUTHOR_MATCH_THRESHOLD = 0.7
+
+# 标题相似度不低于此值的已确认匹配才用来学习作者别名，避免错误匹配污染别名表
+ALIAS_MIN_TITLE_SIMILARITY = 0.9
+
+# 两个写法的比较键相似度不低于此值时直接记为别名（多了“著”、少了间隔号等），否则需要用户确认
+ALIAS_MIN_AUTHOR_SIMILARITY = 0.5
+
+@lru_cache(maxsize=8192)
+def strip_markers(author):
+    """去除国籍标记并去掉首尾空白"""
+    return MARKER_RE.sub('', author or '').strip()
+
+def has_markers(text):
+    """文本中是否含有国籍标记"""
+    return bool(MARKER_RE.search(text or ''))
+
+@lru_cache(maxsize=8192)
+def clean_author(author):
+    """完整清理一个作者名：国籍标记、括号内的原文名、中文名后的英文名"""
+    author = MARKER_RE.sub('', author or '')
+    author = _PAREN_NAME_RE.sub('', author)
+    author = _TRAILING_LATIN_RE.sub('', author)
+    return author.strip()
+
+def clean_author_names(authors):
+    """处理作者名：去除国籍标记和英文名
+    Args:
+        authors: 作者名列表
+    Returns:
+        清理后的作者名列表（去掉清理后为空的项）
+    """
+    return [author for author in map(clean_author, authors) if author]
+
+@lru_cache(maxsize=8192)
+def author_key(author):
+    """作者比较用的键：去除标记、转为简体和小写，忽略空格和间隔号"""
+    return _KEY_IGNORED_RE.sub('', to_simplified(strip_markers(author)).lower())
+
+class AuthorAliases:
+    """持久化的作者别名表：把音译变体、笔名等映射到同一个规范作者，判断是否同一作者只需查一次字典"""
+    def __init__(self, path=ALIASES_FILE, pending_path=PENDING_ALIASES_FILE):
+        self.path = path
+        self.pending_path = pending_path
+        self._lock = threading.Lock()
+        self._names = {}  # 规范作者名 -> [别名, ...]（保存到文件的形式）
+        self._canonical = {}  # 作者键 -> 规范作者的键
+        self._pending = []  # [{'alias', 'canonical', 'title', 'count'}, ...]
+        self._load()
+
+    def _load(self):
+        names = self._read_json(self.path, {})
+        for canonical, aliases in names.items():
+            for alias in aliases:
+                if self._add(canonical, alias) is None:
+                    print_warning(f"作者别名表中的 {alias} -> {canonical} 与其他组冲突，已忽略")
+        self._pending = self._read_json(self.pending_path, [])
+
+    @staticmethod
+    def _read_json(path, default):
+        if not os.path.exists(path):
+            return default
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print_warning(f"读取作者别名表失败: {path} ({e})")
+            return default
+
+    @staticmethod
+    def _write_json(path, data):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, json.dumps(data, ensure_ascii=False, indent=2))
+        except OSError as e:
+            print_warning(f"保存作者别名表失败: {e}")
+
+    def _add(self, canonical, alias):
+        """把别名加入规范作者所在的组
+        不做传递合并：规范作者本身是另一组的别名，或别名已经属于另一组时拒绝
+        Returns:
+            True 新增，False 已存在，None 冲突
+        """
+        canonical_key = author_key(canonical)
+        alias_key = author_key(alias)
+        if not alias_key or not canonical_key or alias_key == canonical_key:
+            return False
+        if self._canonical.get(alias_key) == canonical_key:
+            return False
+        if self._canonical.get(canonical_key, canonical_key) != canonical_key or alias_key in self._canonical:
+            return None
+        self._canonical[alias_key] = canonical_key
+        self._canonical.setdefault(canonical_key, canonical_key)
+        self._names.setdefault(canonical, []).append(alias)
+        return True
+
+    def canonical(self, author):
+        """作者所属规范作者的键（不在别名表中时为作者自身的键）"""
+        key = author_key(author)
+        return self._canonical.get(key, key)
+
+    def same_author(self, a, b):
+        """两个作者名是否指同一作者（键相同，或在别名表中属于同一组）"""
+        return bool(a and b) and self.canonical(a) == self.canonical(b)
+
+    def learn(self, alias, canonical, confirmed=False, title=None):
+        """从已确认的匹配中记录别名，例如文件名中的 'Liu Cixin' 对应豆瓣的 '刘慈欣'
+        写法本来就相近，或用户看过两个作者名后确认的，直接加入别名表；
+        否则（同名不同作者的书、把译者当成作者等）只放入待确认列表，不影响作者比较
+        Args:
+            alias: 文件名等来源中的作者
+            canonical: 豆瓣作者
+            confirmed: 用户是否手动确认了这次匹配
+            title: 书名（记录在待确认列表中，便于审核）
+        Returns:
+            bool: 是否新增了别名
+        """
+        if not alias or not canonical or self.same_author(alias, canonical):
+            return False
+        alias, canonical = strip_markers(alias), strip_markers(canonical)
+        if not confirmed and _key_similarity(author_key(alias), author_key(canonical)) < ALIAS_MIN_AUTHOR_SIMILARITY:
+            self._queue(alias, canonical, title)
+            return False
+        return self._apply(alias, canonical)
+
+    def _apply(self, alias, canonical):
+        with self._lock:
+            added = self._add(canonical, alias)
+            if added is None:
+                print_warning(f"作者别名 {alias} -> {canonical} 与别名表中已有的组冲突，未记录")
+                return False
+            if not added:
+                return False
+            # 在锁内写入：并发的 learn 按修改顺序落盘，较新的别名不会被旧快照覆盖
+            self._write_json(self.path, self._names)
+        print_info(f"记录作者别名: {alias} -> {canonical}")
+        return True
+
+    def _queue(self, alias, canonical, title):
+        with self._lock:
+            entry = next((e for e in self._pending if e['alias'] == alias and e['canonical'] == canonical), None)
+            if entry:
+                entry['count'] += 1
+            else:
+                self._pending.append({'alias': alias, 'canonical': canonical, 'title': title, 'count': 1})
+            self._write_json(self.pending_path, self._pending)
+        print_info(f"作者写法不同，已加入待确认别名: {alias} -> {canonical}（可用 aliases 命令审核）")
+
+    def pending(self):
+        """待确认的别名列表"""
+        with self._lock:
+            return [dict(entry) for entry in self._pending]
+
+    def resolve_pending(self, alias, accept):
+        """审核一条待确认的别名：accept 为 True 时加入别名表，否则丢弃
+        Returns:
+            bool: 是否找到了这条待确认的别名
+        """
+        with self._lock:
+            entries = [e for e in self._pending if e['alias'] == alias]
+            if not entries:
+                return False
+            self._pending = [e for e in self._pending if e['alias'] != alias]
+            self._write_json(self.pending_path, self._pending)
+        if accept:
+            for entry in entries:
+                self._apply(entry['alias'], entry['canonical'])
+        return True
+
+_aliases = None
+_aliases_lock = threading.Lock()
+
+def get_author_aliases():
+    """获取全局作者别名表，首次调用时从文件加载"""
+    global _aliases
+    with _aliases_lock:
+        if _aliases is None:
+            _aliases = AuthorAliases()
+        return _aliases
+
+def same_author(a, b):
+    """两个作者名是否指同一作者（使用别名表）"""
+    return get_author_aliases().same_author(a, b)
+
+@lru_cache(maxsize=16384)
+def _key_similarity(key_a, key_b):
+    return difflib.SequenceMatcher(None, key_a, key_b).ratio()
+
+def author_similarity(a, b):
+    """作者相似度（0-1）：同一作者（包括别名）为1，否则按比较键计算并缓存"""
+    aliases = get_author_aliases()
+    if aliases.same_author(a, b):
+        return 1.0
+    similarity = _key_similarity(aliases.canonical(a), aliases.canonical(b))
+    print_debug(f"作者相似度: '{a}' vs '{b}' = {similarity:.2f}")
+    return similarity
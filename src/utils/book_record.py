@@ -0,0 +1,162 @@
+import json
+import re
+import sys
+
+# 持久化的字段，顺序即紧凑序列化（pack）中的位置，只能在末尾追加
+FIELDS = (
+    'douban_id', 'title', 'author', 'authors', 'translators', 'year', 'publish_year', 'publisher',
+    'isbn', 'pages', 'price', 'binding', 'series', 'tags', 'rating', 'rating_people',
+    'cover_url', 'url', 'intro', 'full_intro', 'detail_fetched'
+)
+
+# 只在一次搜索中使用的字段，不参与紧凑序列化
+TRANSIENT_FIELDS = ('similarity', 'author_similarity', 'index')
+
+PACK_VERSION = 1
+
+def parse_year(value):
+    """'2019-5'、'2019年' 等 -> 2019，无法识别时返回None"""
+    if value is None or isinstance(value, int):
+        return value
+    match = re.search(r'\d{4}', str(value))
+    return int(match.group(0)) if match else None
+
+def parse_rating(value):
+    """'8.5' -> 8.5，空值或无法识别时返回None"""
+    if value is None or isinstance(value, float):
+        return value
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return None
+
+def parse_count(value):
+    """'(1,234人评价)' -> 1234，无法识别时返回None"""
+    if value is None or isinstance(value, int):
+        return value
+    digits = re.sub(r'\D', '', str(value))
+    return int(digits) if digits else None
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _intern_all(values):
+    """作者、标签等重复率很高的短字符串：驻留后同名的记录共享同一个字符串对象"""
+    if values is None:
+        return None
+    return tuple(sys.intern(str(v)) for v in values)
+
+# 赋值时的类型转换：数值字段只解析一次，重复出现的字符串驻留
+_CONVERTERS = {
+    'year': parse_year,
+    'rating': parse_rating,
+    'rating_people': parse_count,
+    'author': _intern,
+    'publisher': _intern,
+    'binding': _intern,
+    'series': _intern,
+    'authors': _intern_all,
+    'translators': _intern_all,
+    'tags': _intern_all,
+}
+
+class BookRecord:
+    """一本书的豆瓣信息（搜索结果、详情页、本地书目共用）
+    用 __slots__ 存储，评分、评价人数、年份在赋值时解析为数字；
+    兼容原来的字典写法（record['title']、record.get('year')、update 等），值为None视为不存在
+    """
+    __slots__ = FIELDS + TRANSIENT_FIELDS + ('_extra',)
+
+    def __init__(self, data=None, **fields):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        if data:
+            self.update(data)
+        if fields:
+            self.update(fields)
+
+    # ---- 字典兼容接口 ----
+    def __getitem__(self, key):
+        # 已知字段总是存在（未设置时为None），与原来字典中的键一致
+        if key in FIELDS or key in TRANSIENT_FIELDS:
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        converter = _CONVERTERS.get(key)
+        if converter:
+            value = converter(value)
+        if key in FIELDS or key in TRANSIENT_FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def get(self, key, default=None):
+        if key in FIELDS or key in TRANSIENT_FIELDS:
+            value = getattr(self, key)
+        elif self._extra:
+            value = self._extra.get(key)
+        else:
+            value = None
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def keys(self):
+        names = [name for name in FIELDS + TRANSIENT_FIELDS if getattr(self, name) is not None]
+        if self._extra:
+            names.extend(key for key, value in self._extra.items() if value is not None)
+        return names
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __bool__(self):
+        return True
+
+    def items(self):
+        return [(key, self.get(key)) for key in self.keys()]
+
+    def update(self, other=None, **fields):
+        for key, value in (other.items() if other else ()):
+            self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+
+    def copy(self):
+        return BookRecord(self)
+
+    def to_dict(self):
+        """可JSON序列化的普通字典（列表字段转换为list）"""
+        return {key: list(value) if isinstance(value, tuple) else value for key, value in self.items()}
+
+    def __repr__(self):
+        return f"BookRecord(douban_id={self.douban_id!r}, title={self.title!r}, author={self.author!r})"
+
+    # ---- 紧凑序列化 ----
+    def pack(self):
+        """紧凑的JSON数组：[版本, 各字段值...]，不含字段名，末尾的空字段省略"""
+        values = [getattr(self, name) for name in FIELDS]
+        while values and values[-1] is None:
+            values.pop()
+        return json.dumps([PACK_VERSION, *values], ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def unpack(cls, text):
+        """pack 的逆过程；也接受旧格式（完整的JSON对象）"""
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return cls(data)
+        record = cls()
+        for name, value in zip(FIELDS, data[1:]):
+            if value is not None:
+                record[name] = value
+        return record
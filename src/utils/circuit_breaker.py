@@ -0,0 +1,147 @@
+import threading
+import time
+
+from src.config.config import REQUEST_CONFIG
+from src.utils.logger import print_info, print_warning, print_debug
+from src.utils.deadline import DeadlineExceeded, current_deadline
+from src.utils import metrics, tracing
+
+# 熔断器状态
+STATE_CLOSED = 'closed'        # 正常
+STATE_OPEN = 'open'            # 已熔断，暂停该主机的所有请求
+STATE_HALF_OPEN = 'half-open'  # 冷却结束，只放行一个探测请求
+
+# 请求结果分类
+OUTCOME_SUCCESS = 'success'
+OUTCOME_THROTTLED = 'throttled'  # 403/429
+OUTCOME_FAILURE = 'failure'      # 超时、连接错误、5xx等，不影响熔断
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+class CircuitBreaker:
+    """单个主机的熔断器
+    - 连续被限流 threshold 次后熔断，冷却期内所有线程的请求都在这里等待
+    - 冷却结束后进入半开状态，只放行一个探测请求
+    - 探测成功则恢复，再次被限流则加倍冷却时间重新熔断
+    """
+    def __init__(self, host, threshold=None, cooldown=None):
+        self.host = host
+        self.threshold = threshold or REQUEST_CONFIG.get('breaker_threshold', 5)
+        self.base_cooldown, self.max_cooldown = cooldown or REQUEST_CONFIG.get('breaker_cooldown', [30, 600])
+        self.cooldown = self.base_cooldown
+        self.open_until = 0.0
+        self.consecutive_throttles = 0
+        self._probing = False
+        self._cond = threading.Condition()
+        self.stats = {'opened': 0, 'probes': 0, 'wait_seconds': 0.0}
+        self._set_state(STATE_CLOSED)
+
+    def _set_state(self, state):
+        """切换状态并同步到性能指标（调用方持有锁，初始化时除外）"""
+        self.state = state
+        metrics.set_gauge('breaker_state', metrics.BREAKER_STATE_VALUES[state], host=self.host)
+
+    def acquire(self):
+        """请求前调用：熔断时等待冷却结束，半开时等待探测结果
+        Returns:
+            bool: 本次请求是否为探测请求
+        Raises:
+            DeadlineExceeded: 当前书籍的剩余时间不够等到熔断恢复
+        """
+        start = time.perf_counter()
+        with self._cond:
+            try:
+                while True:
+                    if self.state == STATE_CLOSED:
+                        return False
+                    now = time.monotonic()
+                    if self.state == STATE_OPEN:
+                        wait = self.open_until - now
+                        if wait <= 0:
+                            self._set_state(STATE_HALF_OPEN)
+                            print_info(f"熔断冷却结束，探测主机是否恢复: {self.host}")
+                            continue
+                    elif not self._probing:
+                        self._probing = True
+                        self.stats['probes'] += 1
+                        metrics.count('breaker_probes', host=self.host)
+                        return True
+                    else:
+                        # 其他线程正在探测，等待结果
+                        wait = 1.0
+                    deadline = current_deadline()
+                    if deadline and self.state == STATE_OPEN and wait >= deadline.remaining():
+                        raise DeadlineExceeded(f"主机已熔断，{wait:.0f} 秒后才会恢复: {self.host}")
+                    if deadline:
+                        deadline.check(f"等待熔断恢复: {self.host}")
+                        wait = min(wait, deadline.remaining())
+                    self._cond.wait(timeout=wait)
+            finally:
+                end = time.perf_counter()
+                self.stats['wait_seconds'] += end - start
+                if self.state != STATE_CLOSED or end - start > 0.001:
+                    metrics.count('breaker_wait_seconds', end - start, host=self.host)
+                    tracing.complete("熔断等待", start, end, cat='wait', host=self.host, state=self.state)
+
+    def record(self, outcome, probe=False):
+        """请求结束后调用
+        Args:
+            outcome: OUTCOME_* 之一；请求被异常中断时为None
+            probe: 是否为 acquire 返回的探测请求
+        """
+        with self._cond:
+            if probe:
+                self._probing = False
+            if outcome == OUTCOME_SUCCESS:
+                self.consecutive_throttles = 0
+                if self.state != STATE_CLOSED:
+                    self._set_state(STATE_CLOSED)
+                    self.cooldown = self.base_cooldown
+                    print_info(f"主机已恢复，熔断关闭: {self.host}")
+            elif outcome == OUTCOME_THROTTLED:
+                self.consecutive_throttles += 1
+                if self.state == STATE_HALF_OPEN:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self._open()
+                elif self.state == STATE_CLOSED and self.consecutive_throttles >= self.threshold:
+                    self._open()
+            self._cond.notify_all()
+
+    def _open(self):
+        """进入熔断状态（调用方持有锁）"""
+        self._set_state(STATE_OPEN)
+        self.open_until = time.monotonic() + self.cooldown
+        self.stats['opened'] += 1
+        metrics.count('breaker_opened', host=self.host)
+        print_warning(f"主机连续被限流 {self.consecutive_throttles} 次，熔断 {self.cooldown:.0f} 秒: {self.host}")
+
+    def is_open(self):
+        """是否处于熔断冷却期（不等待）"""
+        with self._cond:
+            return self.state == STATE_OPEN and self.open_until > time.monotonic()
+
+    def snapshot(self):
+        """当前状态和统计，用于日志和统计报告"""
+        with self._cond:
+            return {
+                'host': self.host,
+                'state': self.state,
+                'consecutive_throttles': self.consecutive_throttles,
+                **self.stats
+            }
+
+def get_breaker(host):
+    """获取主机的熔断器（全局共享，所有线程的请求共用同一个状态）"""
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+            print_debug(f"创建熔断器: {host}")
+        return breaker
+
+def breaker_snapshots():
+    """所有熔断器的状态"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
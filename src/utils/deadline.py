@@ -0,0 +1,101 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from src.utils import tracing
+
+# 当前书籍的截止时间，随调用链传递（线程池中需要用 contextvars.copy_context() 传递）
+_current = contextvars.ContextVar('deadline', default=None)
+
+class DeadlineExceeded(BaseException):
+    """书籍处理超出时间预算
+    继承 BaseException，避免被网络函数中宽泛的 except Exception 吞掉，
+    一直传递到处理整本书的调用方
+    """
+
+class Deadline:
+    """单本书的时间预算，所有网络步骤共享"""
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires = time.monotonic() + budget
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """剩余秒数（不小于0）"""
+        return max(0.0, self.expires - time.monotonic())
+
+    def check(self, stage=None):
+        """预算已用完时抛出 DeadlineExceeded"""
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"超出时间预算 {self.budget} 秒" + (f" ({stage})" if stage else ""))
+
+    def cap(self, timeout):
+        """用剩余时间限制超时，预算已用完时抛出 DeadlineExceeded"""
+        self.check()
+        return min(timeout, self.remaining()) if timeout else self.remaining()
+
+    def sleep(self, seconds, stage=None):
+        """等待；剩余时间不够等待完再做一次尝试时直接放弃"""
+        if seconds >= self.remaining():
+            raise DeadlineExceeded(f"剩余时间不足以等待 {seconds:.1f} 秒" + (f" ({stage})" if stage else ""))
+        time.sleep(seconds)
+
+    @contextmanager
+    def paused(self):
+        """暂停计时，例如等待用户输入时"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.expires += time.monotonic() - start
+
+def current_deadline():
+    """当前上下文的截止时间，没有时返回None"""
+    return _current.get()
+
+@contextmanager
+def deadline_scope(budget):
+    """在代码块内启用时间预算；budget 为空或0时不限制
+    Args:
+        budget: 预算秒数
+    Yields:
+        Deadline或None
+    """
+    deadline = Deadline(budget) if budget else None
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+def capped_timeout(timeout):
+    """按当前截止时间限制超时"""
+    deadline = _current.get()
+    return deadline.cap(timeout) if deadline else timeout
+
+def check_deadline(stage=None):
+    """当前截止时间已过时抛出 DeadlineExceeded"""
+    deadline = _current.get()
+    if deadline:
+        deadline.check(stage)
+
+def deadline_sleep(seconds, stage=None):
+    """受当前截止时间限制的 time.sleep"""
+    with tracing.span(stage or "sleep", cat='wait', seconds=round(seconds, 3)):
+        deadline = _current.get()
+        if deadline:
+            deadline.sleep(seconds, stage)
+        else:
+            time.sleep(seconds)
+
+@contextmanager
+def paused_deadline():
+    """暂停当前截止时间的计时（没有截止时间时不做任何事）"""
+    deadline = _current.get()
+    if deadline:
+        with deadline.paused():
+            yield
+    else:
+        yield
@@ -0,0 +1,205 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from src.utils.logger import print_info, print_warning, print_debug
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+# 下载工具和复制工具常用的临时文件后缀，改名为最终文件名时会再收到事件
+PARTIAL_SUFFIXES = ('.part', '.partial', '.crdownload', '.download', '.tmp', '.!qb', '.aria2')
+
+class _Inotify:
+    """通过 ctypes 调用 libc 的 inotify，只监视单个目录（不递归）"""
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "libc 不支持 inotify")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch 失败: {path}")
+
+    def read(self, timeout):
+        """等待最多 timeout 秒，返回 [(掩码, 文件名), ...]"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class _Pending:
+    """一个等待写入完成的文件"""
+    __slots__ = ('size', 'changed', 'closed')
+
+    def __init__(self, size, changed):
+        self.size = size
+        self.changed = changed
+        self.closed = False
+
+class DirectoryWatcher:
+    """监视书籍目录中新到达的文件
+    新文件在大小稳定（settle 秒内没有变化）后才算就绪；收到 close-write 或移入事件时只需短暂确认。
+    没有 inotify 的平台（或 use_inotify=False）退回按 poll_interval 定时扫描目录
+    """
+    def __init__(self, path, settle=2.0, poll_interval=5.0, use_inotify=True):
+        self.path = path
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self._pending = {}
+        # 已交给调用方的文件及当时的 (大小, 修改时间)，未变化的不重复交出（处理失败留在目录中的书）
+        self._delivered = {}
+        self._inotify = None
+        self._last_scan = 0.0
+        if use_inotify:
+            try:
+                self._inotify = _Inotify(path)
+            except OSError as e:
+                print_warning(f"无法使用 inotify ({e})，改为每 {poll_interval:g} 秒扫描一次目录")
+        print_info(f"开始监视书籍目录 ({'inotify' if self._inotify else '定时扫描'}): {path}")
+        # 启动前已在目录中的文件也要处理
+        self._scan()
+
+    @staticmethod
+    def _ignored(name):
+        return name.startswith('.') or name.lower().endswith(PARTIAL_SUFFIXES)
+
+    def _stat(self, name):
+        try:
+            st = os.stat(os.path.join(self.path, name))
+        except OSError:
+            return None
+        return st if os.path.isfile(os.path.join(self.path, name)) else None
+
+    def _touch(self, name, closed=False):
+        """记录一次文件变化"""
+        if self._ignored(name):
+            return
+        st = self._stat(name)
+        if st is None:
+            self._pending.pop(name, None)
+            return
+        pending = self._pending.get(name)
+        if pending is None:
+            pending = self._pending[name] = _Pending(st.st_size, time.monotonic())
+            print_debug(f"发现新文件: {name}")
+        elif st.st_size != pending.size:
+            pending.size = st.st_size
+            pending.changed = time.monotonic()
+            pending.closed = False
+        if closed:
+            pending.closed = True
+
+    def _scan(self):
+        """扫描整个目录：启动时、定时扫描模式下，以及 inotify 事件队列溢出后"""
+        self._last_scan = time.monotonic()
+        try:
+            names = os.listdir(self.path)
+        except OSError as e:
+            print_warning(f"读取书籍目录失败: {e}")
+            return
+        # 已移走的文件不再记录
+        self._delivered = {name: self._delivered[name] for name in names if name in self._delivered}
+        for name in names:
+            if name in self._pending or self._ignored(name):
+                continue
+            st = self._stat(name)
+            if st is None:
+                continue
+            if self._delivered.get(name) == (st.st_size, st.st_mtime_ns):
+                continue
+            self._touch(name)
+
+    def _read_events(self, timeout):
+        for mask, name in self._inotify.read(timeout):
+            if mask & IN_Q_OVERFLOW:
+                print_warning("inotify 事件队列溢出，重新扫描目录")
+                self._scan()
+            elif mask & IN_DELETE_SELF:
+                print_warning(f"书籍目录已被删除: {self.path}")
+            elif mask & IN_ISDIR or not name:
+                continue
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._pending.pop(name, None)
+                self._delivered.pop(name, None)
+            else:
+                self._touch(name, closed=bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO)))
+
+    def _collect_ready(self):
+        """取出已写入完成的文件：大小稳定足够久，且再次 stat 时大小未变"""
+        now = time.monotonic()
+        ready = []
+        for name, pending in list(self._pending.items()):
+            quiet = min(self.settle, 0.5) if pending.closed else self.settle
+            if now - pending.changed < quiet:
+                continue
+            st = self._stat(name)
+            if st is None:
+                del self._pending[name]
+            elif st.st_size != pending.size:
+                pending.size = st.st_size
+                pending.changed = now
+                pending.closed = False
+            else:
+                del self._pending[name]
+                self._delivered[name] = (st.st_size, st.st_mtime_ns)
+                ready.append(name)
+        return sorted(ready)
+
+    def wait_ready(self, timeout=1.0):
+        """等待最多 timeout 秒，返回已就绪的文件名列表（可能为空）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            ready = self._collect_ready()
+            remaining = deadline - time.monotonic()
+            if ready or remaining <= 0:
+                return ready
+            # 有待确认的文件时缩短等待，及时检查大小是否稳定
+            wait = min(remaining, 0.25) if self._pending else remaining
+            if self._inotify:
+                self._read_events(wait)
+            else:
+                if time.monotonic() - self._last_scan >= self.poll_interval:
+                    self._scan()
+                time.sleep(min(wait, max(self.poll_interval - (time.monotonic() - self._last_scan), 0.05)))
+
+    def close(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
@@ -0,0 +1,146 @@
+import errno
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from src.utils.logger import print_info, print_debug
+
+# 单次内核拷贝的最大字节数
+COPY_CHUNK = 64 * 1024 * 1024
+
+def _temp_path(path):
+    """与目标同目录的临时文件路径，保证最后的 rename 在同一文件系统内"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+def fsync_dir(path):
+    """同步目录项，确保 rename/unlink 落盘（不支持的平台忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextmanager
+def atomic_open(path, mode='wb', encoding=None):
+    """以临时文件写入，成功后 fsync 并原子替换目标文件；出错时目标文件保持不变
+    Args:
+        path: 目标文件路径
+        mode: 'wb' 或 'w'
+        encoding: 文本模式的编码
+    """
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(os.path.dirname(path) or '.')
+
+def atomic_write(path, data):
+    """原子写入文件
+    Args:
+        path: 目标文件路径
+        data: str（按UTF-8写入）或bytes
+    """
+    if isinstance(data, str):
+        with atomic_open(path, 'w', encoding='utf-8') as f:
+            f.write(data)
+    else:
+        with atomic_open(path, 'wb') as f:
+            f.write(data)
+
+def _kernel_copy(src_fd, dst_fd, size):
+    """在内核中拷贝文件内容：copy_file_range -> sendfile -> 普通读写
+    内核拷贝提前返回0（部分 FUSE/NFS 实现）时从已拷贝的位置改用普通读写继续
+    Returns:
+        int: 实际拷贝的字节数，源文件变短时小于 size
+    """
+    copied = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return copied
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP) or copied:
+                raise
+    if hasattr(os, 'sendfile') and not copied:
+        try:
+            while copied < size:
+                n = os.sendfile(dst_fd, src_fd, copied, min(COPY_CHUNK, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return copied
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.ENOSYS) or copied:
+                raise
+    with os.fdopen(os.dup(src_fd), 'rb') as fsrc, os.fdopen(os.dup(dst_fd), 'wb') as fdst:
+        fsrc.seek(copied)
+        fdst.seek(copied)
+        while copied < size:
+            chunk = fsrc.read(min(1024 * 1024, size - copied))
+            if not chunk:
+                break
+            fdst.write(chunk)
+            copied += len(chunk)
+    return copied
+
+def move_file(src, dst):
+    """移动文件：同一文件系统内直接 rename；跨设备时在内核中拷贝到临时文件，
+    fsync 后原子替换目标，再删除源文件
+    Args:
+        src: 源文件路径
+        dst: 目标文件路径
+    """
+    try:
+        os.rename(src, dst)
+        fsync_dir(os.path.dirname(dst) or '.')
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    size = os.path.getsize(src)
+    start = time.monotonic()
+    tmp_path = _temp_path(dst)
+    try:
+        with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+            copied = _kernel_copy(fsrc.fileno(), fdst.fileno(), size)
+            # 拷贝不完整（源文件在移动期间变化）时不能替换目标、删除源文件
+            if copied != size or os.fstat(fsrc.fileno()).st_size != size:
+                raise OSError(errno.EIO, f"跨设备拷贝不完整（{copied}/{size} 字节），保留源文件", src)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    fsync_dir(os.path.dirname(dst) or '.')
+    os.remove(src)
+    fsync_dir(os.path.dirname(src) or '.')
+
+    elapsed = max(time.monotonic() - start, 1e-6)
+    size_mb = size / 1024 / 1024
+    print_info(f"跨设备移动 {size_mb:.1f} MB，用时 {elapsed:.2f} 秒 ({size_mb / elapsed:.1f} MB/s)")
+    print_debug(f"跨设备移动完成: {src} -> {dst}")
@@ -2,8 +2,9 @@ import re
 import os
 import PyPDF2
 import ebookmeta
-from src.utils.logger import print_debug, print_error
+from src.utils.logger import print_debug
 from src.utils.text_utils import to_simplified
+from src.utils.author_utils import has_markers, strip_markers
 
 def parse_filename(filename):
     """
@@ -42,9 +43,9 @@ def parse_filename(filename):
             continue
             
         # 如果包含特殊标记如"〔法〕"，很可能是作者
-        if re.search(r'〔[^〕]+〕|\([^)]+\)|\[[^\]]+\]|（[^）]+）', possible_author):
+        if has_markers(possible_author):
             # 直接去除国籍标记，保留作者名
-            author = re.sub(r'〔[^〕]+〕|\([^)]+\)|\[[^\]]+\]|（[^）]+）', '', possible_author).strip()
+            author = strip_markers(possible_author)
             break
             
         # 否则，如果长度合适，可能是作者
@@ -93,52 +94,46 @@ def parse_filename(filename):
     
     if author:
         # 清理作者名中的特殊字符和国籍标记
-        author = re.sub(r'\[[^\]]*\]|〔[^〕]*〕|\([^)]*\)|（[^）]*）|【[^】]*】', '', author).strip()
+        author = strip_markers(author)
         # 转换为简体字
         author = to_simplified(author)
     
     return author, title, year, ext
 
-def extract_pdf_metadata(pdf_path):
-    """尝试从 PDF 文件元数据中提取书籍信息
-    Args:
-        pdf_path: PDF文件路径
-    Returns:
-        (author, title) 元组
-    """
-    try:
-        with open(pdf_path, "rb") as f:
-            reader = PyPDF2.PdfReader(f)
-            metadata = reader.metadata
-            title = metadata.get("/Title", "").strip() if metadata else None
-            author = metadata.get("/Author", "").strip() if metadata else None
-            # 转换为简体字
-            if title:
-                title = to_simplified(title)
-            if author:
-                author = to_simplified(author)
-            return author, title
-    except Exception as e:
-        print_error(f"无法读取 PDF 元数据: {e}")
-        return None, None
+# 可以读取内嵌元数据的格式
+METADATA_FORMATS = ['pdf', 'epub', 'mobi', 'azw3', 'azw']
 
-def extract_ebook_metadata(file_path):
-    """尝试从 EPUB/MOBI/AWZ3 文件的元数据中提取书籍信息
+def read_file_metadata(file_path, ext):
+    """读取电子书文件内嵌的元数据，以及PDF第一页的文字预览（供AI分析）
+    在元数据提取进程中运行，解析出错时直接抛出异常，由调用方记录失败原因
     Args:
         file_path: 电子书文件路径
+        ext: 文件扩展名
     Returns:
-        (author, title) 元组
+        dict: author、title、preview（均可能为None）
     """
-    try:
+    ext = ext.lower()
+    author = title = preview = None
+    if ext == "pdf":
+        with open(file_path, "rb") as f:
+            reader = PyPDF2.PdfReader(f)
+            metadata = reader.metadata
+            if metadata:
+                title = (metadata.get("/Title") or "").strip()
+                author = (metadata.get("/Author") or "").strip()
+            try:
+                if len(reader.pages) > 0:
+                    preview = (reader.pages[0].extract_text() or "")[:500]
+            except Exception as e:
+                # 预览只是辅助信息，失败时保留已读到的元数据
+                print_debug(f"无法提取 PDF 第一页文字: {e}")
+    elif ext in METADATA_FORMATS:
         metadata = ebookmeta.get_metadata(file_path)
-        author = metadata.get("author")
-        title = metadata.get("title")
-        # 转换为简体字
-        if title:
-            title = to_simplified(title)
-        if author:
-            author = to_simplified(author)
-        return author, title
-    except Exception as e:
-        print_error(f"无法读取电子书元数据: {e}")
-        return None, None 
\ No newline at end of file
+        title = metadata.title
+        author = metadata.author_list_to_string()
+    # 转换为简体字
+    return {
+        "author": to_simplified(author) if author else None,
+        "title": to_simplified(title) if title else None,
+        "preview": preview or None
+    }
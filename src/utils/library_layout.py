@@ -0,0 +1,114 @@
+import hashlib
+import os
+import posixpath
+
+from src.config.config import BOOKS_DIR, LAYOUT_CONFIG, SUPPORTED_FORMATS
+from src.utils.logger import print_warning
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+# 分片方式
+SHARD_NONE = 'none'  # 所有书籍文件夹直接放在书籍目录下
+SHARD_INITIAL = 'initial'  # 按文件夹名（默认以作者开头）的拼音/字母首字母
+SHARD_HASH = 'hash'  # 按文件夹名哈希的前缀，每层两个十六进制字符（256个子目录）
+
+# 首字母分片时，开头既不是字母也不是汉字的文件夹
+OTHER_SHARD = '_'
+
+_warned = set()
+
+def _warn_once(key, message):
+    if key not in _warned:
+        _warned.add(key)
+        print_warning(message)
+
+def _initial_levels(name, depth):
+    """按首字母分片的各层目录名：刘慈欣 - 三体 -> ['L', 'LI']；无法转为拼音时返回None"""
+    text = "".join(lazy_pinyin(name)) if lazy_pinyin else name
+    letters = []
+    for char in text:
+        if len(letters) >= depth:
+            break
+        if char.isascii() and char.isalpha():
+            letters.append(char.upper())
+        elif '一' <= char <= '鿿':
+            return None
+        else:
+            # 其余字符（数字、符号）结束取首字母，开头就是这类字符时归入 OTHER_SHARD
+            break
+    letters = "".join(letters)
+    return [letters[:i].ljust(i, OTHER_SHARD) for i in range(1, depth + 1)]
+
+def _hash_levels(name, depth):
+    """按哈希分片的各层目录名：['3f', 'a2']"""
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return [digest[i * 2:i * 2 + 2] for i in range(depth)]
+
+def shard_levels(folder_name):
+    """书籍文件夹在当前布局下所在的分片目录（各层目录名列表，不分片时为空）"""
+    mode = LAYOUT_CONFIG.get('shard', SHARD_NONE)
+    depth = max(int(LAYOUT_CONFIG.get('depth', 1) or 1), 1)
+    name = posixpath.basename(folder_name)
+    if mode == SHARD_INITIAL:
+        levels = _initial_levels(name, depth)
+        if levels is not None:
+            return levels
+        # 中文名无法取首字母（没有 pypinyin，或生僻字没有拼音）时退回哈希分片
+        if lazy_pinyin is None:
+            # 安装后可运行 reshard 调整
+            _warn_once('pypinyin', "未安装 pypinyin，中文开头的书籍文件夹按哈希分片（pip install pypinyin）")
+        return _hash_levels(name, depth)
+    if mode == SHARD_HASH:
+        return _hash_levels(name, depth)
+    if mode != SHARD_NONE:
+        _warn_once(mode, f"未知的分片方式: {mode}，不分片")
+    return []
+
+def library_path(folder_name):
+    """书籍文件夹相对于书籍目录（以及远程根目录）的路径，始终用 / 分隔
+    已经带有分片目录的路径按最后一级的文件夹名重新计算
+    """
+    name = posixpath.basename(folder_name)
+    return posixpath.join(*shard_levels(name), name)
+
+def iter_book_folders(root=BOOKS_DIR):
+    """遍历书籍目录中的所有书籍文件夹，返回相对路径（/ 分隔）
+    直接包含电子书或NFO文件、或者有文件但没有子目录的目录是书籍文件夹，其余是分片目录（不论是哪种布局留下的）；
+    分片目录中零散的 Thumbs.db、desktop.ini 之类不会让它被当成书籍文件夹；隐藏目录跳过
+    """
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        try:
+            entries = sorted(os.scandir(os.path.join(root, *relative.split('/'))), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        has_files = has_books = False
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(posixpath.join(relative, entry.name) if relative else entry.name)
+            elif entry.is_file():
+                has_files = True
+                ext = os.path.splitext(entry.name)[1].lstrip('.').lower()
+                has_books = has_books or ext in SUPPORTED_FORMATS or ext == 'nfo'
+        if relative and (has_books or (has_files and not subdirs)):
+            yield relative
+            continue
+        # 书籍目录本身的文件是待处理的书，不影响继续向下查找
+        pending.extend(reversed(subdirs))
+
+def prune_empty_shards(folder, root=BOOKS_DIR):
+    """书籍文件夹移走后，删除已经空了的上级分片目录（不删除书籍目录本身）"""
+    parent = posixpath.dirname(folder)
+    while parent:
+        try:
+            os.rmdir(os.path.join(root, *parent.split('/')))
+        except OSError:
+            return
+        parent = posixpath.dirname(parent)
@@ -1,47 +1,241 @@
+import atexit
+import contextvars
+import json
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
 import colorama
 
+from src.config.config import LOG_CONFIG
+
 # 初始化colorama，支持Windows下的彩色输出
 colorama.init(autoreset=True)
 
+# 日志级别
+DEBUG = 10
+INFO = 20
+SUCCESS = 25
+WARNING = 30
+ERROR = 40
+CRITICAL = 50
+
+LEVEL_NAMES = {'DEBUG': DEBUG, 'INFO': INFO, 'SUCCESS': SUCCESS, 'WARNING': WARNING, 'ERROR': ERROR, 'CRITICAL': CRITICAL}
+_LEVEL_LABELS = {level: name for name, level in LEVEL_NAMES.items()}
+
+# 当前书籍的关联ID，随调用链传递，写入JSON日志便于按书籍过滤
+_book = contextvars.ContextVar('log_book', default=None)
+
+# 后台提前处理时暂存控制台输出，轮到这本书时再按顺序输出，避免打断用户正在阅读的内容
+_console_buffer = contextvars.ContextVar('console_buffer', default=None)
+
+_console_lock = threading.Lock()
+
+class _State:
+    """日志输出配置：控制台级别、JSON文件级别，以及二者中较低的有效级别"""
+    console_level = INFO
+    file_level = DEBUG
+    min_level = INFO
+    writer = None
+
+def _parse_level(level, default):
+    if isinstance(level, int):
+        return level
+    return LEVEL_NAMES.get(str(level or '').upper(), default)
+
+class JsonLogWriter:
+    """后台线程批量写入JSON Lines日志文件，调用方只做一次入队"""
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._queue = queue.SimpleQueue()
+        self._file = open(path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        self._queue.put(record)
+
+    def _run(self):
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._file.flush()
+                continue
+            if record is None:
+                break
+            lines = [record]
+            # 一次取出队列中积压的所有记录再写入
+            while True:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    self._queue.put(None)
+                    break
+                lines.append(record)
+            self._file.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in lines))
+        self._file.flush()
+        self._file.close()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+def configure_logging(level=None, file=None, file_level=None):
+    """应用日志配置（默认读取 LOG_CONFIG，参数优先）
+    Args:
+        level: 控制台日志级别名称，如 'INFO'、'DEBUG'
+        file: JSON Lines日志文件路径，为空时不写文件
+        file_level: 文件日志级别
+    """
+    _State.console_level = _parse_level(level or LOG_CONFIG.get('level'), INFO)
+    _State.file_level = _parse_level(file_level or LOG_CONFIG.get('file_level'), DEBUG)
+    path = file or LOG_CONFIG.get('file')
+    if _State.writer and (not path or _State.writer.path != path):
+        _State.writer.close()
+        _State.writer = None
+    if path and not _State.writer:
+        _State.writer = JsonLogWriter(path)
+    _State.min_level = min(_State.console_level, _State.file_level) if _State.writer else _State.console_level
+
+def close_logging():
+    """写完并关闭日志文件"""
+    if _State.writer:
+        _State.writer.close()
+        _State.writer = None
+        _State.min_level = _State.console_level
+
+atexit.register(close_logging)
+
+def is_enabled(level):
+    """该级别的日志是否会输出，用于跳过代价较高的日志内容构造"""
+    return level >= _State.min_level
+
+@contextmanager
+def book_context(name):
+    """在代码块内为日志设置书籍关联ID
+    Args:
+        name: 书籍名称（通常是文件名）
+    Yields:
+        str: 关联ID
+    """
+    book_id = uuid.uuid4().hex[:8]
+    token = _book.set((book_id, name))
+    try:
+        yield book_id
+    finally:
+        _book.reset(token)
+
+@contextmanager
+def buffered_console():
+    """在代码块内把控制台输出暂存到列表中（JSON日志照常写入）
+    Yields:
+        list: 暂存的输出文本，之后交给 replay_console 输出
+    """
+    lines = []
+    token = _console_buffer.set(lines)
+    try:
+        yield lines
+    finally:
+        _console_buffer.reset(token)
+
+def replay_console(lines):
+    """输出 buffered_console 暂存的文本（外层也在暂存时并入外层）"""
+    if not lines:
+        return
+    buffer = _console_buffer.get()
+    if buffer is not None:
+        buffer.extend(lines)
+        return
+    with _console_lock:
+        sys.stdout.write("".join(lines))
+
+def _write_console(text):
+    buffer = _console_buffer.get()
+    if buffer is not None:
+        buffer.append(text)
+        return
+    with _console_lock:
+        sys.stdout.write(text)
+
+def current_book_id():
+    """当前书籍的关联ID，没有时返回None"""
+    book = _book.get()
+    return book[0] if book else None
+
+def current_book():
+    """当前书籍的 (关联ID, 名称)，没有时返回None"""
+    return _book.get()
+
+def _log(level, msg, style, prefix=""):
+    if level < _State.min_level:
+        return
+    if level >= _State.console_level:
+        # 只在需要输出到控制台时才拼接带颜色的文本
+        _write_console(f"{style}{prefix}{msg}{colorama.Style.RESET_ALL}\n")
+    writer = _State.writer
+    if writer and level >= _State.file_level:
+        record = {
+            'ts': round(time.time(), 3),
+            'level': _LEVEL_LABELS[level],
+            'msg': str(msg),
+            'thread': threading.current_thread().name
+        }
+        book = _book.get()
+        if book:
+            record['book_id'], record['book'] = book
+        writer.write(record)
+
 def print_debug(msg):
     """打印调试信息（青色）"""
-    print(f"{colorama.Fore.CYAN}DEBUG: {msg}{colorama.Style.RESET_ALL}")
+    if DEBUG < _State.min_level:
+        return
+    _log(DEBUG, msg, colorama.Fore.CYAN, "DEBUG: ")
 
 def print_info(msg):
     """打印信息（绿色）"""
-    print(f"{colorama.Fore.GREEN}INFO: {msg}{colorama.Style.RESET_ALL}")
+    _log(INFO, msg, colorama.Fore.GREEN, "INFO: ")
 
 def print_warning(msg):
     """打印警告（黄色）"""
-    print(f"{colorama.Fore.YELLOW}WARNING: {msg}{colorama.Style.RESET_ALL}")
+    _log(WARNING, msg, colorama.Fore.YELLOW, "WARNING: ")
 
 def print_error(msg):
     """打印错误（红色）"""
-    print(f"{colorama.Fore.RED}ERROR: {msg}{colorama.Style.RESET_ALL}")
+    _log(ERROR, msg, colorama.Fore.RED, "ERROR: ")
 
 def print_critical(msg):
     """打印严重错误（红底白字）"""
-    print(f"{colorama.Back.RED}{colorama.Fore.WHITE}CRITICAL: {msg}{colorama.Style.RESET_ALL}")
+    _log(CRITICAL, msg, colorama.Back.RED + colorama.Fore.WHITE, "CRITICAL: ")
 
 def print_success(msg):
     """打印成功信息（绿色）"""
-    print(f"{colorama.Fore.GREEN}✅ {msg}{colorama.Style.RESET_ALL}")
+    _log(SUCCESS, msg, colorama.Fore.GREEN, "✅ ")
 
 def print_section(title):
     """打印分节标题（青色）"""
-    print(f"\n{colorama.Fore.CYAN}=== {title} ==={colorama.Style.RESET_ALL}")
+    _log(INFO, f"=== {title} ===", "\n" + colorama.Fore.CYAN)
 
 def print_divider():
     """打印分隔线（青色）"""
-    print(f"{colorama.Fore.CYAN}{'=' * 50}{colorama.Style.RESET_ALL}")
+    _write_console(f"{colorama.Fore.CYAN}{'=' * 50}{colorama.Style.RESET_ALL}\n")
 
 def print_prompt(msg):
     """打印用户提示（黄色）"""
+    sys.stdout.flush()
     return input(f"{colorama.Fore.YELLOW}{msg}: {colorama.Style.RESET_ALL}")
 
 def print_highlight(msg):
     """打印高亮文本（白色）"""
-    print(f"{colorama.Fore.WHITE}{msg}{colorama.Style.RESET_ALL}")
+    _log(INFO, msg, colorama.Fore.WHITE)
+
+configure_logging()
 
 # ASCII艺术字体
 ASCII_ART = r"""
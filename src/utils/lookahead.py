@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.logger import buffered_console, replay_console
+
+class Lookahead:
+    """按顺序处理一组项目时，在后台提前执行接下来 depth 项的 fn(item)
+    后台执行时的控制台输出先暂存，take 取结果时再输出，看起来与当场执行一致。
+    fn 不能与用户交互，也不能有副作用：没有被 take 的结果直接丢弃
+    """
+    def __init__(self, fn, items, depth, thread_name_prefix="lookahead"):
+        self._fn = fn
+        self._items = list(items)
+        self._positions = {item: index for index, item in enumerate(self._items)}
+        self.depth = depth
+        self._futures = {}
+        self._next = 0  # 下一个还未提交的位置
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(depth, 1), thread_name_prefix=thread_name_prefix)
+
+    def _run(self, item):
+        with buffered_console() as lines:
+            try:
+                return self._fn(item), None, lines
+            except BaseException as e:
+                # 包括超出时间预算，交给 take 的调用方按当场执行时的方式处理
+                return None, e, lines
+
+    def _schedule(self, position):
+        """保证 position 及之后的 depth 项已经提交（第一项取结果时才与后面几项一起提交）"""
+        with self._lock:
+            self._next = max(self._next, position)
+            end = min(position + 1 + self.depth, len(self._items))
+            while self._next < end:
+                item = self._items[self._next]
+                self._futures[item] = self._executor.submit(self._run, item)
+                self._next += 1
+
+    def take(self, item):
+        """取出 item 的预处理结果，并让后台继续处理后面的项目
+        Returns:
+            (True, 结果)；item 不在列表中或已经取过时返回 (False, None)，由调用方当场执行
+        """
+        position = self._positions.get(item)
+        if position is None:
+            return False, None
+        self._schedule(position)
+        future = self._futures.pop(item, None)
+        if future is None:
+            return False, None
+        result, error, lines = future.result()
+        replay_console(lines)
+        if error is not None:
+            raise error
+        return True, result
+
+    def close(self):
+        """取消还没开始的预处理，等待正在进行的完成（结果丢弃）"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._futures.clear()
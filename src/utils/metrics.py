@@ -0,0 +1,276 @@
+import bisect
+import threading
+import time
+
+from src.config.config import METRICS_CONFIG
+from src.utils.logger import print_section, print_highlight, print_info, print_error
+from src.utils.file_ops import atomic_write
+from src.utils import tracing
+
+# 延迟直方图的桶上界（秒），与 Prometheus 的习惯一致
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))
+
+# 报告中各阶段的显示名称和顺序
+STAGE_LABELS = {
+    'book': '整本书',
+    'parse': '文件名解析',
+    'metadata': '元数据提取',
+    'fingerprint': '文本指纹',
+    'catalog': '本地书目',
+    'douban_search': '豆瓣搜索',
+    'douban_detail': '豆瓣详情页',
+    'ai_select': 'AI选择',
+    'ai_confirm': 'AI确认',
+    'move': '移动文件',
+    'cover': '封面',
+    'nfo': 'NFO',
+    'upload': '上传文件',
+}
+
+# 报告中计数器的显示名称
+COUNTER_LABELS = {
+    'books': '处理书籍',
+    'http_requests': 'HTTP请求',
+    'http_retries': 'HTTP重试',
+    'http_failures': 'HTTP失败',
+    'cover_cache_hits': '封面缓存命中',
+    'cover_cache_revalidated': '封面缓存校验未变化',
+    'cover_bytes_downloaded': '封面下载字节',
+    'catalog_hits': '本地书目命中',
+    'catalog_misses': '本地书目未命中',
+    'douban_detail_skipped': '跳过豆瓣详情页',
+    'query_variant_hits': '改写查询后匹配',
+    'near_duplicates': '疑似重复',
+    'upload_files': '上传文件数',
+    'upload_bytes': '上传字节',
+    'upload_skipped_files': '同步跳过文件数',
+    'extract_timeout': '元数据提取超时',
+    'extract_memory': '元数据提取超出内存',
+    'extract_crash': '元数据提取进程崩溃',
+    'extract_parse': '元数据解析失败',
+    'http_timeouts': 'HTTP超时',
+    'http_connect_errors': 'HTTP连接错误',
+    'http_throttled': 'HTTP限流',
+    'http_5xx': 'HTTP 5xx',
+    'http_4xx': 'HTTP其他4xx',
+    'http_other_errors': 'HTTP其他错误',
+    'breaker_opened': '熔断次数',
+    'breaker_probes': '熔断探测',
+    'breaker_wait_seconds': '熔断累计等待秒数',
+}
+
+# 熔断器状态的数值（breaker_state 仪表）
+BREAKER_STATE_VALUES = {'closed': 0, 'half-open': 1, 'open': 2}
+
+class Histogram:
+    """固定桶的延迟直方图"""
+    __slots__ = ('counts', 'sum', 'count', 'max', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q):
+        """按桶估算分位数（桶内线性插值）"""
+        with self._lock:
+            counts, total, maximum = list(self.counts), self.count, self.max
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = min(BUCKETS[index], maximum)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return maximum
+
+_histograms = {}
+_counters = {}
+_gauges = {}
+_books = set()
+_first_book = None  # 第一本书开始处理的时间，用于按实际运行时间计算吞吐量
+_lock = threading.Lock()
+
+def observe(stage, seconds):
+    """记录一个阶段的耗时"""
+    histogram = _histograms.get(stage)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(stage, Histogram())
+    histogram.observe(seconds)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+def _series(name, labels):
+    """带标签的指标以 Prometheus 的写法作为键：breaker_opened{host="book.douban.com"}"""
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{_label_value(value)}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+def count(name, value=1, **labels):
+    """累加计数器，可带标签（如 host）"""
+    key = _series(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """设置仪表的当前值，可带标签（如 host）"""
+    key = _series(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+def count_book(key):
+    """记录开始处理一本书：同一本书（超时搁置后重试等）只计一次"""
+    global _first_book
+    with _lock:
+        if _first_book is None:
+            _first_book = time.monotonic()
+        if key in _books:
+            return
+        _books.add(key)
+        _counters['books'] = _counters.get('books', 0) + 1
+
+def wall_seconds():
+    """从第一本书开始处理到现在的实际运行时间（秒），还没有处理书时为0"""
+    with _lock:
+        return time.monotonic() - _first_book if _first_book is not None else 0.0
+
+class timed:
+    """计时上下文管理器：with timed('douban_search'): ...
+    开启追踪时同时记录一个同名的追踪片段
+    """
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        observe(self.stage, end - self.start)
+        if tracing.is_tracing():
+            if exc_type is None:
+                tracing.complete(self.stage, self.start, end)
+            else:
+                tracing.complete(self.stage, self.start, end, error=exc_type.__name__)
+        return False
+
+def snapshot():
+    """当前所有指标：{'stages': {阶段: Histogram}, 'counters': {名称: 值}, 'gauges': {名称: 值}}"""
+    with _lock:
+        return {'stages': dict(_histograms), 'counters': dict(_counters), 'gauges': dict(_gauges)}
+
+def export():
+    """可JSON序列化的指标汇总：各阶段的次数、总耗时、P50/P95/最大耗时，以及计数器和仪表"""
+    data = snapshot()
+    stages = {}
+    for stage, h in data['stages'].items():
+        stages[stage] = {'count': h.count, 'sum': h.sum, 'p50': h.quantile(0.5),
+                         'p95': h.quantile(0.95), 'max': h.max}
+    return {'stages': stages, 'counters': data['counters'], 'gauges': data['gauges']}
+
+def _format_bytes(value):
+    return f"{value / 1024 / 1024:.2f} MB"
+
+def format_row(cells, widths):
+    """按终端显示宽度对齐一行（中文字符占两列）：第一列左对齐，其余右对齐"""
+    parts = []
+    for index, (cell, width) in enumerate(zip(cells, widths)):
+        cell = str(cell)
+        padding = ' ' * max(width - sum(2 if ord(ch) > 127 else 1 for ch in cell), 1)
+        parts.append(cell + padding if index == 0 else padding + cell)
+    return ''.join(parts)
+
+def report():
+    """打印各阶段耗时汇总表和计数器"""
+    data = snapshot()
+    stages, counters = data['stages'], data['counters']
+    if not stages and not counters:
+        return
+    print_section("性能统计")
+    if stages:
+        widths = (12, 8, 10, 9, 9, 9, 9)
+        print_highlight(format_row(('阶段', '次数', '总耗时', '平均', 'P50', 'P95', '最大'), widths))
+        ordered = [s for s in STAGE_LABELS if s in stages] + sorted(s for s in stages if s not in STAGE_LABELS)
+        for stage in ordered:
+            h = stages[stage]
+            cells = (STAGE_LABELS.get(stage, stage), h.count, f"{h.sum:.1f}s", f"{h.sum / h.count:.2f}s",
+                     f"{h.quantile(0.5):.2f}s", f"{h.quantile(0.95):.2f}s", f"{h.max:.2f}s")
+            print_highlight(format_row(cells, widths))
+    for key in sorted(counters):
+        value = counters[key]
+        name, _, labels = key.partition('{')
+        label = COUNTER_LABELS.get(name, name) + (f" {{{labels}" if labels else "")
+        if name.endswith('bytes') or '_bytes_' in name:
+            value = _format_bytes(value)
+        elif isinstance(value, float):
+            value = f"{value:.1f}"
+        print_info(f"{label}: {value}")
+    # 按实际运行时间计算：并行处理、提前识别时各本书的耗时相互重叠，不能直接相加
+    elapsed = wall_seconds()
+    if counters.get('books') and elapsed:
+        print_info(f"吞吐量: {counters['books'] / elapsed * 60:.1f} 本/分钟 (运行 {elapsed:.1f} 秒)")
+
+def write_prometheus_textfile(path=None):
+    """把指标写成 Prometheus 文本格式，供 node_exporter 的 textfile collector 读取
+    Args:
+        path: 输出文件路径，默认使用 METRICS_CONFIG['prometheus_textfile']
+    """
+    path = path or METRICS_CONFIG.get('prometheus_textfile')
+    if not path:
+        return
+    data = snapshot()
+    lines = [
+        "# HELP ebook_stage_duration_seconds Duration of each processing stage.",
+        "# TYPE ebook_stage_duration_seconds histogram",
+    ]
+    for stage, h in sorted(data['stages'].items()):
+        with h._lock:
+            counts, total, number = list(h.counts), h.sum, h.count
+        cumulative = 0
+        for upper, bucket_count in zip(BUCKETS, counts):
+            cumulative += bucket_count
+            le = "+Inf" if upper == float('inf') else repr(float(upper))
+            lines.append(f'ebook_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+        lines.append(f'ebook_stage_duration_seconds_sum{{stage="{stage}"}} {total}')
+        lines.append(f'ebook_stage_duration_seconds_count{{stage="{stage}"}} {number}')
+    # 同名的带标签序列放在同一个 TYPE 行下
+    typed = set()
+    for key, value in sorted(data['counters'].items(), key=lambda item: item[0].partition('{')[::2]):
+        name, _, labels = key.partition('{')
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE ebook_{name}_total counter")
+        lines.append(f"ebook_{name}_total{'{' + labels if labels else ''} {value}")
+    for key, value in sorted(data['gauges'].items(), key=lambda item: item[0].partition('{')[::2]):
+        name, _, labels = key.partition('{')
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE ebook_{name} gauge")
+        lines.append(f"ebook_{name}{'{' + labels if labels else ''} {value}")
+    lines.append("# TYPE ebook_last_run_timestamp_seconds gauge")
+    lines.append(f"ebook_last_run_timestamp_seconds {time.time():.0f}")
+    try:
+        atomic_write(path, "\n".join(lines) + "\n")
+        print_info(f"指标已写入: {path}")
+    except OSError as e:
+        print_error(f"写入指标文件失败: {path} ({e})")
@@ -1,8 +1,15 @@
 import random
-import time
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
 import requests
 from src.config.config import REQUEST_CONFIG
-from src.utils.logger import print_debug, print_info, print_error, print_warning
+from src.utils.logger import print_debug, print_info, print_error, print_warning, print_section
+from src.utils.deadline import capped_timeout, check_deadline, deadline_sleep
+from src.utils import metrics, tracing
+from src.utils.proxy_pool import DIRECT, get_proxy_pool, proxy_label
+from src.utils.circuit_breaker import OUTCOME_SUCCESS, OUTCOME_THROTTLED, OUTCOME_FAILURE, get_breaker, breaker_snapshots
 
 # 随机User-Agent列表
 USER_AGENTS = [
@@ -26,13 +33,79 @@ def get_random_headers():
         'Cache-Control': 'max-age=0'
     }
 
-def safe_request(url, method='get', params=None, retry_count=0, **kwargs):
-    """安全的请求函数，带有重试、延迟和异常处理
+# 每个线程复用一个会话以保持连接（长期运行的 watch 模式下尤其明显）
+_thread_local = threading.local()
+
+def get_session():
+    """获取当前线程的 requests.Session；不保存 Cookie，每个请求仍与单独调用 requests 时一致"""
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        _thread_local.session = session
+    return session
+
+# 错误分类
+ERROR_TIMEOUT = 'timeout'
+ERROR_CONNECT = 'connect'
+ERROR_THROTTLED = 'throttled'        # 403/429
+ERROR_SERVER = 'server_error'        # 5xx
+ERROR_CLIENT = 'client_error'        # 其他4xx，重试无意义
+ERROR_OTHER = 'other'
+
+# 请求统计
+NETWORK_STATS = {
+    'requests': 0, 'attempts': 0, 'retries': 0, 'success': 0, 'failed': 0,
+    ERROR_TIMEOUT: 0, ERROR_CONNECT: 0, ERROR_THROTTLED: 0,
+    ERROR_SERVER: 0, ERROR_CLIENT: 0, ERROR_OTHER: 0
+}
+_stats_lock = threading.Lock()
+
+# 同时计入全局性能指标的统计项
+_METRIC_NAMES = {
+    'requests': 'http_requests', 'retries': 'http_retries', 'failed': 'http_failures',
+    # 错误分类按主机计数（带 host 标签）
+    ERROR_TIMEOUT: 'http_timeouts', ERROR_CONNECT: 'http_connect_errors', ERROR_THROTTLED: 'http_throttled',
+    ERROR_SERVER: 'http_5xx', ERROR_CLIENT: 'http_4xx', ERROR_OTHER: 'http_other_errors'
+}
+
+def _count(*keys, host=None):
+    with _stats_lock:
+        for key in keys:
+            NETWORK_STATS[key] += 1
+    labels = {'host': host} if host else {}
+    for key in keys:
+        if key in _METRIC_NAMES:
+            metrics.count(_METRIC_NAMES[key], **labels)
+
+def classify_response(response):
+    """按状态码分类响应，成功时返回None"""
+    if response.status_code == 200:
+        return None
+    if response.status_code in (403, 429):
+        return ERROR_THROTTLED
+    if response.status_code >= 500:
+        return ERROR_SERVER
+    return ERROR_CLIENT
+
+def _retry_delay(error, attempt, response=None):
+    """不同错误类型的重试等待时间（秒）"""
+    if error == ERROR_THROTTLED:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return random.uniform(*REQUEST_CONFIG['retry_delay']) * (attempt + 1)
+    if error == ERROR_SERVER:
+        return random.uniform(*REQUEST_CONFIG['retry_delay'])
+    # 超时和连接错误只依靠下一次请求前的随机延迟
+    return 0
+
+def safe_request(url, method='get', params=None, **kwargs):
+    """安全的请求函数，带有重试、延迟、错误分类和按主机熔断
     Args:
         url: 请求URL
         method: 请求方法，默认get
         params: 请求参数
-        retry_count: 当前重试次数
         **kwargs: 其他请求参数
     Returns:
         requests.Response对象或None
@@ -42,65 +115,117 @@ def safe_request(url, method='get', params=None, retry_count=0, **kwargs):
     if 'headers' in kwargs:
         headers.update(kwargs.pop('headers'))
     
-    # 添加代理
-    proxies = REQUEST_CONFIG['proxy']
-    
     print_debug(f"发起请求: {method.upper()} {url}")
     if params:
         print_debug(f"请求参数: {params}")
-    if proxies:
-        print_debug(f"使用代理: {proxies}")
-    
-    try:
-        # 请求前随机延迟，避免频繁请求
-        if retry_count > 0 or random.random() < 0.8:  # 80%概率延迟
-            delay = random.uniform(*REQUEST_CONFIG['request_delay'])
-            print_debug(f"请求延迟: {delay:.2f}秒")
-            time.sleep(delay)
-        
-        # 发起请求
-        if method.lower() == 'get':
-            response = requests.get(
-                url, 
-                headers=headers, 
-                params=params, 
-                proxies=proxies,
-                timeout=REQUEST_CONFIG['timeout'],
-                **kwargs
-            )
-        else:
-            response = requests.post(
-                url, 
-                headers=headers, 
-                data=params, 
-                proxies=proxies,
-                timeout=REQUEST_CONFIG['timeout'],
-                **kwargs
-            )
-        
-        # 检查响应状态
-        if response.status_code == 200:
+
+    host = urlsplit(url).netloc
+    pool = get_proxy_pool()
+    _count('requests')
+    for attempt in range(REQUEST_CONFIG['max_retries'] + 1):
+        if attempt > 0:
+            _count('retries')
+            print_info(f"第 {attempt} 次重试...")
+
+        # 选择代理并等待该代理的请求间隔（每个代理独立限速）
+        lease = pool.acquire(host)
+        if lease.proxies:
+            print_debug(f"使用代理: {lease.proxy.label}")
+        # 熔断时在这里等待（所有线程共享），半开时只有一个探测请求能通过
+        breaker = get_breaker(lease.breaker_key)
+        probe = breaker.acquire()
+        outcome = None
+        error = None
+        response = None
+        try:
+            _count('attempts')
+            with tracing.span(f"{method.upper()} {host}", cat='http', url=url, attempt=attempt,
+                              proxy=lease.proxy.label if lease.proxies else None) as attempt_span:
+                try:
+                    if method.lower() == 'get':
+                        response = get_session().get(
+                            url,
+                            headers=headers,
+                            params=params,
+                            proxies=lease.proxies,
+                            timeout=capped_timeout(REQUEST_CONFIG['timeout']),
+                            **kwargs
+                        )
+                    else:
+                        response = get_session().post(
+                            url,
+                            headers=headers,
+                            data=params,
+                            proxies=lease.proxies,
+                            timeout=capped_timeout(REQUEST_CONFIG['timeout']),
+                            **kwargs
+                        )
+                    error = classify_response(response)
+                except requests.exceptions.Timeout:
+                    error = ERROR_TIMEOUT
+                except requests.exceptions.ConnectionError:
+                    error = ERROR_CONNECT
+                except Exception as e:
+                    print_error(f"请求异常: {e}")
+                    error = ERROR_OTHER
+
+                attempt_span.args['status'] = response.status_code if response is not None else None
+                attempt_span.args['error'] = error
+            if error is None:
+                outcome = OUTCOME_SUCCESS
+            elif error == ERROR_THROTTLED:
+                outcome = OUTCOME_THROTTLED
+            else:
+                outcome = OUTCOME_FAILURE
+        finally:
+            breaker.record(outcome, probe)
+            pool.release(lease, outcome)
+
+        if error is None:
+            _count('success')
             print_info(f"请求成功: {response.status_code}")
             return response
-        elif response.status_code == 403 or response.status_code == 429:
+        _count(error, host=host)
+
+        if error == ERROR_TIMEOUT:
+            print_error("请求超时")
+            # 超时可能是被截止时间缩短的，预算用完就不再重试
+            check_deadline(url)
+        elif error == ERROR_CONNECT:
+            print_error("连接错误")
+        elif error == ERROR_THROTTLED:
             print_warning(f"请求被限制 (状态码: {response.status_code})，等待后重试...")
-            retry_delay = random.uniform(*REQUEST_CONFIG['retry_delay']) * (retry_count + 1)
-            print_debug(f"重试延迟: {retry_delay:.2f}秒")
-            time.sleep(retry_delay)
-        else:
+        elif error in (ERROR_SERVER, ERROR_CLIENT):
             print_warning(f"请求失败 (状态码: {response.status_code})")
-            
-    except requests.exceptions.Timeout:
-        print_error("请求超时")
-    except requests.exceptions.ConnectionError:
-        print_error("连接错误")
-    except Exception as e:
-        print_error(f"请求异常: {e}")
-    
-    # 重试逻辑
-    if retry_count < REQUEST_CONFIG['max_retries']:
-        print_info(f"第 {retry_count + 1} 次重试...")
-        return safe_request(url, method, params, retry_count + 1, **kwargs)
+        if error == ERROR_CLIENT:
+            break
+
+        if attempt < REQUEST_CONFIG['max_retries']:
+            retry_delay = _retry_delay(error, attempt, response)
+            if retry_delay:
+                print_debug(f"重试延迟: {retry_delay:.2f}秒")
+                deadline_sleep(retry_delay, "重试延迟")
     else:
         print_error("达到最大重试次数，请求失败")
-        return None 
\ No newline at end of file
+    _count('failed')
+    return None
+
+def report_network_stats():
+    """打印本次运行的请求统计和各主机的熔断状态"""
+    with _stats_lock:
+        stats = dict(NETWORK_STATS)
+    if not stats['requests']:
+        return
+    print_section("网络请求统计")
+    print_info(f"请求: {stats['requests']} 次 (实际发送 {stats['attempts']} 次, 重试 {stats['retries']} 次), "
+               f"成功 {stats['success']} 次, 失败 {stats['failed']} 次")
+    print_info(f"错误: 超时 {stats[ERROR_TIMEOUT]}, 连接 {stats[ERROR_CONNECT]}, 限流 {stats[ERROR_THROTTLED]}, "
+               f"5xx {stats[ERROR_SERVER]}, 其他4xx {stats[ERROR_CLIENT]}, 其他 {stats[ERROR_OTHER]}")
+    for snapshot in get_proxy_pool().snapshots():
+        if snapshot['requests'] and snapshot['proxy'] != proxy_label(DIRECT):
+            latency = f"{snapshot['latency']:.2f}秒" if snapshot['latency'] is not None else "N/A"
+            print_info(f"代理 {snapshot['proxy']}: 请求 {snapshot['requests']} 次, 平均延迟 {latency}, "
+                       f"限流 {snapshot['throttled']} 次, 失败 {snapshot['failures']} 次, 剔除 {snapshot['ejected']} 次")
+    for snapshot in breaker_snapshots():
+        print_info(f"熔断器 {snapshot['host']}: 状态={snapshot['state']}, 熔断 {snapshot['opened']} 次, "
+                   f"探测 {snapshot['probes']} 次, 各线程累计等待 {snapshot['wait_seconds']:.1f} 秒")
@@ -0,0 +1,184 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from src.config.config import REQUEST_CONFIG
+from src.utils.logger import print_info, print_warning, print_debug
+from src.utils.deadline import deadline_sleep
+from src.utils.circuit_breaker import OUTCOME_SUCCESS, OUTCOME_THROTTLED, get_breaker
+
+# 没有配置代理时的直连
+DIRECT = None
+
+# 延迟和限流率的指数滑动平均系数
+EWMA_ALPHA = 0.3
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def proxy_label(proxy_url):
+    """日志中显示的代理名称（不显示账号密码）"""
+    if proxy_url is DIRECT:
+        return "直连"
+    parts = urlsplit(proxy_url)
+    return f"{parts.hostname}:{parts.port}" if parts.port else (parts.hostname or proxy_url)
+
+def configured_proxies():
+    """配置中的代理列表：优先使用 proxies，兼容旧的单个 proxy 设置"""
+    proxies = [p for p in REQUEST_CONFIG.get('proxies') or [] if p]
+    if not proxies and REQUEST_CONFIG.get('proxy'):
+        legacy = REQUEST_CONFIG['proxy']
+        proxies = [legacy.get('https') or legacy.get('http')] if isinstance(legacy, dict) else [legacy]
+    return proxies or [DIRECT]
+
+class ProxyState:
+    """单个代理的健康状态和统计"""
+    def __init__(self, url):
+        self.url = url
+        self.label = proxy_label(url)
+        self.latency = None          # 请求耗时的滑动平均（秒）
+        self.throttle_rate = 0.0     # 被限流比例的滑动平均
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.eject_count = 0
+        self.next_slot = 0.0         # 下一次允许发起请求的时间（按代理限速）
+        self.stats = {'requests': 0, 'throttled': 0, 'failures': 0, 'ejected': 0}
+
+    @property
+    def requests_proxies(self):
+        """requests 使用的 proxies 参数"""
+        return {'http': self.url, 'https': self.url} if self.url else None
+
+    def score(self, now):
+        """越小越好：等待时间 + 按限流率放大的平均延迟"""
+        latency = self.latency if self.latency is not None else 0.5
+        return max(self.next_slot - now, 0.0) + latency * (1 + 4 * self.throttle_rate)
+
+class ProxyLease:
+    """一次请求使用的代理"""
+    def __init__(self, proxy, host):
+        self.proxy = proxy
+        self.host = host
+        self.started = time.monotonic()
+
+    @property
+    def proxies(self):
+        return self.proxy.requests_proxies
+
+    @property
+    def breaker_key(self):
+        """限流按出口IP计算，使用代理时每个代理有独立的熔断器"""
+        return self.host if self.proxy.url is DIRECT else f"{self.host} via {self.proxy.label}"
+
+class ProxyPool:
+    """代理池
+    - 每个代理独立限速（请求间隔 request_delay），代理越多总吞吐越高
+    - 按延迟和限流率打分选择代理，跳过已熔断的代理
+    - 连续失败的代理暂时剔除，剔除时间逐次加倍
+    - 可选按主机粘滞：同一主机固定使用同一个代理，直到该代理被剔除
+    """
+    def __init__(self, proxy_urls=None, sticky=None):
+        self.proxies = [ProxyState(url) for url in (proxy_urls or configured_proxies())]
+        self.sticky = REQUEST_CONFIG.get('proxy_sticky', False) if sticky is None else sticky
+        self.eject_after = REQUEST_CONFIG.get('proxy_eject_after', 3)
+        self.eject_seconds = REQUEST_CONFIG.get('proxy_eject_seconds', 120)
+        self._sticky_map = {}
+        self._lock = threading.Lock()
+        if len(self.proxies) > 1 or self.proxies[0].url is not DIRECT:
+            print_info(f"代理池: {', '.join(p.label for p in self.proxies)}")
+
+    def _available(self, host, now):
+        """可用的代理：未被剔除且对该主机未熔断；都不可用时返回最早恢复的代理"""
+        healthy = [p for p in self.proxies if p.ejected_until <= now]
+        usable = [p for p in healthy if not get_breaker(ProxyLease(p, host).breaker_key).is_open()]
+        if usable:
+            return usable
+        if healthy:
+            return healthy
+        return [min(self.proxies, key=lambda p: p.ejected_until)]
+
+    def acquire(self, host, pace=True):
+        """为一次请求选择代理，并等待该代理的请求间隔
+        Args:
+            host: 目标主机
+            pace: 是否按 request_delay 限速
+        Returns:
+            ProxyLease
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = self._available(host, now)
+            proxy = self._sticky_map.get(host) if self.sticky else None
+            if proxy not in candidates:
+                proxy = min(candidates, key=lambda p: (p.score(now), random.random()))
+                if self.sticky:
+                    self._sticky_map[host] = proxy
+            wait = 0.0
+            if pace:
+                start = max(now, proxy.next_slot)
+                wait = start - now
+                proxy.next_slot = start + random.uniform(*REQUEST_CONFIG['request_delay'])
+            proxy.stats['requests'] += 1
+
+        if wait > 0:
+            print_debug(f"请求延迟: {wait:.2f}秒 ({proxy.label})")
+            deadline_sleep(wait, "请求延迟")
+        return ProxyLease(proxy, host)
+
+    def release(self, lease, outcome):
+        """记录请求结果，更新代理评分
+        Args:
+            lease: acquire 返回的 ProxyLease
+            outcome: OUTCOME_* 之一；请求被异常中断时为None
+        """
+        if outcome is None:
+            return
+        proxy = lease.proxy
+        elapsed = time.monotonic() - lease.started
+        with self._lock:
+            throttled = 1.0 if outcome == OUTCOME_THROTTLED else 0.0
+            proxy.throttle_rate = (1 - EWMA_ALPHA) * proxy.throttle_rate + EWMA_ALPHA * throttled
+            if outcome == OUTCOME_SUCCESS:
+                proxy.latency = elapsed if proxy.latency is None else (1 - EWMA_ALPHA) * proxy.latency + EWMA_ALPHA * elapsed
+                proxy.consecutive_failures = 0
+                proxy.eject_count = 0
+                return
+            proxy.stats['throttled' if throttled else 'failures'] += 1
+            proxy.consecutive_failures += 1
+            if proxy.consecutive_failures >= self.eject_after and len(self.proxies) > 1:
+                seconds = min(self.eject_seconds * 2 ** proxy.eject_count, self.eject_seconds * 16)
+                proxy.ejected_until = time.monotonic() + seconds
+                proxy.eject_count += 1
+                proxy.consecutive_failures = 0
+                proxy.stats['ejected'] += 1
+                for host, sticky in list(self._sticky_map.items()):
+                    if sticky is proxy:
+                        del self._sticky_map[host]
+                print_warning(f"代理连续失败 {self.eject_after} 次，暂时剔除 {seconds:.0f} 秒: {proxy.label}")
+
+    def snapshots(self):
+        """各代理的状态和统计"""
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'proxy': p.label,
+                'latency': p.latency,
+                'throttle_rate': p.throttle_rate,
+                'ejected_now': p.ejected_until > now,
+                **p.stats
+            } for p in self.proxies]
+
+def get_proxy_pool():
+    """获取全局代理池，首次调用时按配置创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProxyPool()
+        return _pool
+
+def reset_proxy_pool():
+    """代理配置修改后重新创建代理池"""
+    global _pool
+    with _pool_lock:
+        _pool = None
@@ -57,6 +57,12 @@ def sanitize_filename(filename):
         
     return sanitized
 
+def normalize_title(text):
+    """标题归一化：转为简体、小写，移除空格和标点符号，便于比较和建立索引"""
+    # 先转为简体字
+    text = to_simplified(text or "")
+    return re.sub(r'[\s.,，。:：;；!！?？《》\[\]【】()（）]', '', text.lower())
+
 def calculate_title_similarity(title1, title2):
     """计算两个标题的相似度
     Args:
@@ -66,13 +72,8 @@ def calculate_title_similarity(title1, title2):
         相似度（0-1之间的浮点数）
     """
     # 移除空格和标点符号，便于比较
-    def normalize(text):
-        # 先转为简体字
-        text = to_simplified(text)
-        return re.sub(r'[\s.,，。:：;；!！?？《》\[\]【】()（）]', '', text.lower())
-    
-    norm_title1 = normalize(title1)
-    norm_title2 = normalize(title2)
+    norm_title1 = normalize_title(title1)
+    norm_title2 = normalize_title(title2)
     
     # 使用difflib计算相似度
     similarity = difflib.SequenceMatcher(None, norm_title1, norm_title2).ratio()
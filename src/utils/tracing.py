@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+
+from src.utils.logger import current_book, print_info, print_error
+from src.utils.file_ops import atomic_write
+
+# 追踪默认关闭；开启后每个时间片段记录为一个 Chrome trace event（"X" 完整事件），
+# 输出的JSON可以直接在 https://ui.perfetto.dev 或 chrome://tracing 中打开
+
+class _State:
+    """追踪状态：输出路径、时间原点、已记录的事件，以及线程到显示编号的映射"""
+    enabled = False
+    path = None
+    origin = 0.0
+    events = []
+    threads = {}  # 线程ident -> (显示编号, 线程名)
+
+_lock = threading.Lock()
+
+def start_tracing(path):
+    """开启追踪，结束时由 finish_tracing 写入 path"""
+    with _lock:
+        _State.path = path
+        _State.origin = time.perf_counter()
+        _State.events = []
+        _State.threads = {}
+        _State.enabled = True
+
+def is_tracing():
+    return _State.enabled
+
+def complete(name, start, end, cat='stage', **args):
+    """记录一个已结束的时间片段
+    Args:
+        name: 片段名称
+        start: 开始时间（time.perf_counter）
+        end: 结束时间（time.perf_counter）
+        cat: 分类（stage/http/wait/ai/upload），可在 Perfetto 中按分类过滤
+        **args: 附加信息，显示在片段详情中
+    """
+    if not _State.enabled:
+        return
+    book = current_book()
+    if book:
+        args['book_id'], args['book'] = book
+    thread = threading.current_thread()
+    event = {
+        'name': name,
+        'cat': cat,
+        'ph': 'X',
+        'ts': round((start - _State.origin) * 1e6, 1),
+        'dur': round((end - start) * 1e6, 1),
+        'pid': os.getpid(),
+        'args': args
+    }
+    with _lock:
+        tid = _State.threads.get(thread.ident)
+        if tid is None:
+            tid = (len(_State.threads) + 1, thread.name)
+            _State.threads[thread.ident] = tid
+        event['tid'] = tid[0]
+        _State.events.append(event)
+
+class span:
+    """追踪片段上下文管理器：with span('GET book.douban.com', cat='http') as s: s.args['status'] = 200
+    未开启追踪时只有一次属性判断的开销
+    """
+    __slots__ = ('name', 'cat', 'args', 'start')
+
+    def __init__(self, name, cat='stage', **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter() if _State.enabled else None
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            if exc_type is not None:
+                self.args['error'] = exc_type.__name__
+            complete(self.name, self.start, time.perf_counter(), self.cat, **self.args)
+        return False
+
+def finish_tracing():
+    """停止追踪并写出 trace-event JSON 文件"""
+    with _lock:
+        if not _State.enabled:
+            return
+        _State.enabled = False
+        events, threads, path = _State.events, _State.threads, _State.path
+        _State.events, _State.threads = [], {}
+
+    pid = os.getpid()
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'ebook-renamer'}}]
+    for tid, thread_name in threads.values():
+        metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+        # 按首次出现的顺序排列线程，主线程在最上面
+        metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'sort_index': tid}})
+    try:
+        atomic_write(path, json.dumps({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'},
+                                      ensure_ascii=False))
+        print_info(f"追踪文件已写入: {path}（{len(events)} 个片段，可在 https://ui.perfetto.dev 中打开）")
+    except OSError as e:
+        print_error(f"写入追踪文件失败: {path} ({e})")